@@ -23,4 +23,67 @@
 from deso.argcomp.parser import (
   completePath,
   CompletingArgumentParser,
+  completionContext,
+  completionMetrics,
+  dynamic,
+  filterCompleter,
+  limitCompleter,
+  mapCompleter,
+  mergeCompleter,
+  noCompletion,
+  unionCompleter,
 )
+from importlib import (
+  import_module,
+)
+
+
+# Everything beyond the parser API lives in modules that are only
+# imported once one of their names is accessed. Some of them pull in
+# expensive (e.g., http.client or multiprocessing) or platform specific
+# (e.g., fcntl) modules, and neither regular invocations nor completion
+# requests should pay for those unless they make use of them.
+_LAZY = {
+  "NegativeCache": "deso.argcomp.cache",
+  "completeGitBranch": "deso.argcomp.git",
+  "completeGitRef": "deso.argcomp.git",
+  "completeGitRemote": "deso.argcomp.git",
+  "completeGitTag": "deso.argcomp.git",
+  "completeGitWorktree": "deso.argcomp.git",
+  "completeIndex": "deso.argcomp.index",
+  "FileSystemIndex": "deso.argcomp.index",
+  "writeIndex": "deso.argcomp.index",
+  "mergeMetrics": "deso.argcomp.metrics",
+  "Metrics": "deso.argcomp.metrics",
+  "readMetrics": "deso.argcomp.metrics",
+  "writeMetrics": "deso.argcomp.metrics",
+  "completePathRecursive": "deso.argcomp.path",
+  "Prefetcher": "deso.argcomp.prefetch",
+  "ProcessCompleter": "deso.argcomp.process",
+  "ServiceCompleter": "deso.argcomp.service",
+  "bashCompletion": "deso.argcomp.shell",
+  "completeFromSnapshot": "deso.argcomp.snapshot",
+  "saveSnapshot": "deso.argcomp.snapshot",
+  "completeGroup": "deso.argcomp.system",
+  "completeInterface": "deso.argcomp.system",
+  "completePid": "deso.argcomp.system",
+  "completeProcessName": "deso.argcomp.system",
+  "completeSshHost": "deso.argcomp.system",
+  "completeUser": "deso.argcomp.system",
+}
+
+
+def __getattr__(name):
+  """Import the module providing the given name on first access."""
+  module = _LAZY.get(name)
+  if module is None:
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+  object_ = getattr(import_module(module), name)
+  globals()[name] = object_
+  return object_
+
+
+def __dir__():
+  """List all names provided by the module, including lazy ones."""
+  return sorted(set(globals()) | set(_LAZY))
@@ -0,0 +1,143 @@
+# cache.py
+
+#/***************************************************************************
+# *   Copyright (C) 2017 Daniel Mueller (deso@posteo.net)                   *
+# *                                                                         *
+# *   This program is free software: you can redistribute it and/or modify  *
+# *   it under the terms of the GNU General Public License as published by  *
+# *   the Free Software Foundation, either version 3 of the License, or     *
+# *   (at your option) any later version.                                   *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU General Public License for more details.                          *
+# *                                                                         *
+# *   You should have received a copy of the GNU General Public License     *
+# *   along with this program.  If not, see <http://www.gnu.org/licenses/>. *
+# ***************************************************************************/
+
+"""Caching functionality for completers."""
+
+from deso.argcomp.file import (
+  replacing,
+)
+from deso.argcomp.parser import (
+  completionMetrics,
+  isNarrowable,
+)
+from deso.argcomp.snapshot import (
+  completerName,
+)
+from json import (
+  dumps,
+  loads,
+)
+from time import (
+  time,
+)
+
+
+class NegativeCache:
+  """A persistent cache of completion requests that produced no results."""
+  def __init__(self, path, ttl=60.0):
+    """Create a new cache backed by the file at the given path."""
+    # Completion typically happens in a new process each time, so the
+    # cache has to live in a file. Entries expire after 'ttl' seconds.
+    self._path = path
+    self._ttl = ttl
+    self._entries = None
+
+
+  def _load(self):
+    """Load the cache entries from the backing file."""
+    try:
+      with open(self._path, "rb") as f:
+        return loads(f.read().decode())
+    except (OSError, ValueError):
+      return {}
+
+
+  def _expired(self, now, time_):
+    """Check whether an entry recorded at the given time has expired."""
+    return now - time_ >= self._ttl
+
+
+  def lookup(self, key, word, narrowable=True):
+    """Check whether completing the given word is known to produce no results."""
+    if self._entries is None:
+      self._entries = self._load()
+
+    now = time()
+    entries = self._entries.get(key, {})
+    if not narrowable:
+      # Completions of a non-narrowable completer for a word may not be
+      # among those for any of its prefixes, so only the word itself
+      # can tell.
+      time_ = entries.get(word)
+      return time_ is not None and not self._expired(now, time_)
+
+    # If a prefix of the word produced no results, the word itself
+    # cannot produce any either.
+    for prefix, time_ in entries.items():
+      if word.startswith(prefix) and not self._expired(now, time_):
+        return True
+
+    return False
+
+
+  def record(self, key, word):
+    """Record that completing the given word produced no results."""
+    # Other processes may have updated the cache in the meantime, so
+    # reload it before adding the new entry. We also take the chance to
+    # drop all expired entries.
+    now = time()
+    entries = {}
+    for k, prefixes in self._load().items():
+      prefixes = {p: t for p, t in prefixes.items() if not self._expired(now, t)}
+      if prefixes:
+        entries[k] = prefixes
+
+    entries.setdefault(key, {})[word] = now
+    self._entries = entries
+
+    try:
+      with replacing(self._path) as f:
+        f.write(dumps(entries).encode())
+    except OSError:
+      # Failure to persist the cache is no reason to fail completion.
+      pass
+
+
+  def wrap(self, completer, name=None):
+    """Wrap a completer so that requests producing no results are cached."""
+    # Entries are keyed by the completer's name and the words preceding
+    # the one to complete. Completers that cannot be referenced by
+    # import path need an explicit name.
+    if name is None:
+      name = completerName(completer)
+
+    narrowable = isNarrowable(completer)
+
+    def cachedCompleter(parser, values, word):
+      """Complete a word unless it is known to produce no results."""
+      key = "\0".join([name] + list(values[:-1]))
+      hit = self.lookup(key, word, narrowable)
+      metrics = completionMetrics()
+      if metrics is not None:
+        metrics.recordCache("negative", hit)
+
+      if hit:
+        return
+
+      empty = True
+      for completion in completer(parser, values, word):
+        empty = False
+        yield completion
+
+      if empty:
+        self.record(key, word)
+
+    cachedCompleter.narrowable = narrowable
+    cachedCompleter.__wrapped__ = completer
+    return cachedCompleter
@@ -0,0 +1,85 @@
+# file.py
+
+#/***************************************************************************
+# *   Copyright (C) 2017 Daniel Mueller (deso@posteo.net)                   *
+# *                                                                         *
+# *   This program is free software: you can redistribute it and/or modify  *
+# *   it under the terms of the GNU General Public License as published by  *
+# *   the Free Software Foundation, either version 3 of the License, or     *
+# *   (at your option) any later version.                                   *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU General Public License for more details.                          *
+# *                                                                         *
+# *   You should have received a copy of the GNU General Public License     *
+# *   along with this program.  If not, see <http://www.gnu.org/licenses/>. *
+# ***************************************************************************/
+
+"""Helpers for reading and writing files."""
+
+from contextlib import (
+  contextmanager,
+)
+from os import (
+  curdir,
+  replace,
+  stat,
+  unlink,
+)
+from os.path import (
+  basename,
+  dirname,
+)
+from tempfile import (
+  mkstemp,
+)
+
+
+# Parsed files, keyed by path, along with the stat information they
+# were parsed from.
+_PARSED = {}
+
+
+def parseCached(path, parse):
+  """Retrieve the result of parsing a file, reusing a previous result if the file is unchanged."""
+  # The result is kept for the lifetime of the process, which is
+  # mostly of interest for hosts performing multiple completions. Many
+  # tools replace files atomically, so a changed inode is as good an
+  # indication of a change as a different modification time or size.
+  try:
+    stat_ = stat(path)
+  except OSError:
+    return None
+
+  key = (stat_.st_ino, stat_.st_mtime_ns, stat_.st_size)
+  cached = _PARSED.get(path)
+  if cached is not None and cached[0] == key:
+    return cached[1]
+
+  try:
+    with open(path, "rb") as f:
+      result = parse(f)
+  except OSError:
+    return None
+
+  _PARSED[path] = (key, result)
+  return result
+
+
+@contextmanager
+def replacing(path):
+  """Open a temporary file that atomically replaces 'path' once the context is left."""
+  # We write into a temporary file in the same directory and only
+  # replace the original one once it is complete. That way readers
+  # never see a partially written file.
+  fd, tmp = mkstemp(dir=dirname(path) or curdir, prefix=basename(path) + ".")
+  try:
+    with open(fd, "wb") as f:
+      yield f
+
+    replace(tmp, path)
+  except BaseException:
+    unlink(tmp)
+    raise
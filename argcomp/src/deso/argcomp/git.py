@@ -0,0 +1,262 @@
+# git.py
+
+#/***************************************************************************
+# *   Copyright (C) 2017 Daniel Mueller (deso@posteo.net)                   *
+# *                                                                         *
+# *   This program is free software: you can redistribute it and/or modify  *
+# *   it under the terms of the GNU General Public License as published by  *
+# *   the Free Software Foundation, either version 3 of the License, or     *
+# *   (at your option) any later version.                                   *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU General Public License for more details.                          *
+# *                                                                         *
+# *   You should have received a copy of the GNU General Public License     *
+# *   along with this program.  If not, see <http://www.gnu.org/licenses/>. *
+# ***************************************************************************/
+
+"""Completion support for git references, remotes, and worktrees."""
+
+from bisect import (
+  bisect_left,
+)
+from deso.argcomp.file import (
+  parseCached,
+)
+from deso.argcomp.parser import (
+  dynamic,
+)
+from os import (
+  curdir,
+  environ,
+  fsdecode,
+  scandir,
+)
+from os.path import (
+  abspath,
+  basename,
+  dirname,
+  isabs,
+  isdir,
+  isfile,
+  join,
+  normpath,
+  relpath,
+)
+from re import (
+  compile as regex,
+)
+
+
+HEADS = "refs/heads/"
+TAGS = "refs/tags/"
+REMOTES = "refs/remotes/"
+
+_REMOTE = regex(r'^\s*\[\s*remote\s+"((?:[^"\\]|\\.)*)"\s*\]')
+
+
+def _readFile(path):
+  """Read the first line of a file, if it exists."""
+  try:
+    with open(path, "rb") as f:
+      return fsdecode(f.readline().strip())
+  except OSError:
+    return None
+
+
+def gitDirectory(path=curdir):
+  """Find the git directory of the repository containing the given path."""
+  directory = environ.get("GIT_DIR")
+  if directory:
+    return abspath(directory)
+
+  path = abspath(path)
+  while True:
+    candidate = join(path, ".git")
+    if isdir(candidate):
+      return candidate
+    elif isfile(candidate):
+      # Worktrees and submodules have a .git file pointing to the actual
+      # git directory.
+      content = _readFile(candidate)
+      if content is not None and content.startswith("gitdir:"):
+        return normpath(join(path, content[len("gitdir:"):].strip()))
+    elif isfile(join(path, "HEAD")) and isdir(join(path, "refs")):
+      # We are inside of a bare repository.
+      return path
+
+    parent = dirname(path)
+    if parent == path:
+      return None
+    path = parent
+
+
+def commonDirectory(directory):
+  """Retrieve the directory containing the state shared by all worktrees."""
+  common = _readFile(join(directory, "commondir"))
+  if common is None:
+    return directory
+
+  return normpath(join(directory, common))
+
+
+def _parsePackedRefs(f):
+  """Parse a packed-refs file into a sorted list of reference names."""
+  refs = []
+  for line in f:
+    # Skip the header as well as the lines containing the objects
+    # annotated tags point to.
+    if line.startswith((b"#", b"^")):
+      continue
+
+    _, _, ref = line.rstrip(b"\n").partition(b" ")
+    if ref:
+      refs.append(fsdecode(ref))
+
+  refs.sort()
+  return refs
+
+
+def _packedRefs(common, prefix):
+  """Retrieve all packed references starting with the given prefix."""
+  refs = parseCached(join(common, "packed-refs"), _parsePackedRefs) or []
+  for i in range(bisect_left(refs, prefix), len(refs)):
+    if not refs[i].startswith(prefix):
+      break
+    yield refs[i]
+
+
+def _looseRefs(common, prefix):
+  """Retrieve all loose references starting with the given prefix."""
+  def scan(relative):
+    """Scan a directory below the references directory."""
+    try:
+      with scandir(join(common, relative)) as it:
+        for entry in it:
+          name = relative + "/" + entry.name
+          try:
+            is_dir = entry.is_dir(follow_symlinks=False)
+          except OSError:
+            continue
+
+          if is_dir:
+            # Only descend into directories that can contain matching
+            # references.
+            directory = name + "/"
+            if directory.startswith(prefix) or prefix.startswith(directory):
+              yield from scan(name)
+          elif name.startswith(prefix) and not name.endswith(".lock"):
+            yield name
+    except OSError:
+      pass
+
+  # The prefix always contains at least the namespace (e.g.,
+  # 'refs/heads/'), so we can start scanning in the directory named by
+  # it.
+  directory, _, _ = prefix.rpartition("/")
+  yield from scan(directory)
+
+
+def _completeRefs(namespaces, word, path):
+  """Complete the names of references in the given namespaces."""
+  directory = gitDirectory(path)
+  if directory is None:
+    return
+
+  common = commonDirectory(directory)
+  names = set()
+  for namespace in namespaces:
+    prefix = namespace + word
+    for ref in _packedRefs(common, prefix):
+      names.add(ref[len(namespace):])
+    for ref in _looseRefs(common, prefix):
+      names.add(ref[len(namespace):])
+
+  yield from sorted(names)
+
+
+def completeGitBranch(parser, values, word, path=curdir):
+  """Complete the name of a local branch."""
+  yield from _completeRefs((HEADS,), word, path)
+
+
+def completeGitTag(parser, values, word, path=curdir):
+  """Complete the name of a tag."""
+  yield from _completeRefs((TAGS,), word, path)
+
+
+def completeGitRef(parser, values, word, path=curdir):
+  """Complete the name of a local branch, a tag, or a remote branch."""
+  yield from _completeRefs((HEADS, TAGS, REMOTES), word, path)
+
+
+# References, remotes, and worktrees depend on the repository containing
+# the working directory and change with every fetch or commit.
+dynamic(completeGitBranch)
+dynamic(completeGitTag)
+dynamic(completeGitRef)
+
+
+def _parseRemotes(f):
+  """Parse a git configuration file for the names of remotes."""
+  remotes = []
+  for line in f:
+    match = _REMOTE.match(fsdecode(line))
+    if match is not None:
+      name = match.group(1).replace('\\"', '"').replace("\\\\", "\\")
+      remotes.append(name)
+
+  return sorted(set(remotes))
+
+
+def completeGitRemote(parser, values, word, path=curdir):
+  """Complete the name of a remote."""
+  directory = gitDirectory(path)
+  if directory is None:
+    return
+
+  config = join(commonDirectory(directory), "config")
+  for remote in parseCached(config, _parseRemotes) or []:
+    if remote.startswith(word):
+      yield remote
+
+
+dynamic(completeGitRemote)
+
+
+def completeGitWorktree(parser, values, word, path=curdir):
+  """Complete the path of a worktree."""
+  directory = gitDirectory(path)
+  if directory is None:
+    return
+
+  common = commonDirectory(directory)
+  worktrees = []
+  # The main worktree contains the common directory, unless the
+  # repository is a bare one.
+  if basename(common) == ".git":
+    worktrees.append(dirname(common))
+
+  try:
+    with scandir(join(common, "worktrees")) as it:
+      for entry in it:
+        # The gitdir file contains the path to the worktree's .git file.
+        gitdir = _readFile(join(entry.path, "gitdir"))
+        if gitdir is not None:
+          worktrees.append(dirname(normpath(join(entry.path, gitdir))))
+  except OSError:
+    pass
+
+  # We report paths relative to the current working directory unless
+  # the user started typing an absolute one.
+  if not isabs(word):
+    worktrees = map(relpath, worktrees)
+
+  for worktree in sorted(worktrees):
+    if worktree.startswith(word):
+      yield worktree
+
+
+dynamic(completeGitWorktree)
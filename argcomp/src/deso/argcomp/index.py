@@ -0,0 +1,265 @@
+# index.py
+
+#/***************************************************************************
+# *   Copyright (C) 2017 Daniel Mueller (deso@posteo.net)                   *
+# *                                                                         *
+# *   This program is free software: you can redistribute it and/or modify  *
+# *   it under the terms of the GNU General Public License as published by  *
+# *   the Free Software Foundation, either version 3 of the License, or     *
+# *   (at your option) any later version.                                   *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU General Public License for more details.                          *
+# *                                                                         *
+# *   You should have received a copy of the GNU General Public License     *
+# *   along with this program.  If not, see <http://www.gnu.org/licenses/>. *
+# ***************************************************************************/
+
+"""Completion support for large sorted candidate files."""
+
+from deso.argcomp.file import (
+  replacing,
+)
+from deso.argcomp.parser import (
+  completePath,
+)
+from functools import (
+  partial,
+)
+from json import (
+  dumps,
+  load,
+)
+from mmap import (
+  ACCESS_READ,
+  mmap,
+)
+from os import (
+  fsdecode,
+  fsencode,
+  fstat,
+  scandir,
+  sep,
+  stat,
+)
+from os.path import (
+  abspath,
+  basename,
+  dirname,
+  join,
+)
+
+
+def writeIndex(path, candidates, separator="\n"):
+  """Atomically create or replace an index file containing the given candidates."""
+  # Candidates are encoded the way the operating system encodes paths,
+  # so that file names that are not valid in the file system encoding
+  # round-trip. Lookup works on the raw bytes, so we need to sort by
+  # those and not by the strings they were created from.
+  separator = fsencode(separator)
+  records = sorted({fsencode(candidate) for candidate in candidates})
+
+  with replacing(path) as f:
+    for record in records:
+      assert separator not in record, record
+      f.write(record)
+      f.write(separator)
+
+
+def _lowerBound(data, prefix, separator, lo=0):
+  """Find the offset of the first record in 'data' (at or after 'lo') not less than 'prefix'."""
+  # Both 'lo' and 'hi' always point to the start of a record (or the
+  # end of the data).
+  hi = len(data)
+
+  while lo < hi:
+    mid = (lo + hi) // 2
+    # Find the record 'mid' points into.
+    start = data.rfind(separator, lo, mid)
+    start = lo if start < 0 else start + 1
+    end = data.find(separator, start)
+    end = len(data) if end < 0 else end
+
+    if data[start:end] < prefix:
+      lo = end + 1
+    else:
+      hi = start
+
+  return lo
+
+
+def searchIndex(data, prefix, separator=b"\n"):
+  """Find all records in sorted 'data' starting with the given prefix."""
+  pos = _lowerBound(data, prefix, separator)
+  size = len(data)
+
+  while pos < size:
+    end = data.find(separator, pos)
+    end = size if end < 0 else end
+
+    record = data[pos:end]
+    if not record.startswith(prefix):
+      break
+
+    yield record
+    pos = end + 1
+
+
+def searchIndexLevel(data, prefix, separator, delimiter):
+  """Find all records in sorted 'data' starting with the given prefix and not descending below it."""
+  # Records are paths split into components by 'delimiter' and the ones
+  # of interest are those having no delimiter after the prefix, except
+  # for a trailing one. All records below a component are adjacent, so
+  # once we encounter one we can skip the entire subtree.
+  pos = _lowerBound(data, prefix, separator)
+  size = len(data)
+
+  while pos < size:
+    end = data.find(separator, pos)
+    end = size if end < 0 else end
+
+    record = data[pos:end]
+    if not record.startswith(prefix):
+      break
+
+    index = record.find(delimiter, len(prefix))
+    if index < 0 or index + len(delimiter) == len(record):
+      yield record
+
+    if index < 0:
+      pos = end + 1
+    else:
+      # The smallest key larger than all records below the component is
+      # the component with its trailing delimiter's last byte
+      # incremented.
+      child = record[:index + len(delimiter)]
+      bound = child[:-1] + bytes([child[-1] + 1])
+      pos = _lowerBound(data, bound, separator, end + 1)
+
+
+def _searchIndexFile(path, search):
+  """Search the data of an index file, decoding the records found."""
+  try:
+    f = open(path, "rb")
+  except FileNotFoundError:
+    return
+
+  with f:
+    # An empty file cannot be mapped.
+    if fstat(f.fileno()).st_size == 0:
+      return
+
+    with mmap(f.fileno(), 0, access=ACCESS_READ) as data:
+      for record in search(data):
+        yield fsdecode(record)
+
+
+def completeIndex(parser, values, word, path, separator="\n"):
+  """Complete a word from an index file as created by writeIndex."""
+  # Typically, this completer is used by binding 'path' (and possibly
+  # 'separator') with functools.partial.
+  search = partial(searchIndex, prefix=fsencode(word), separator=fsencode(separator))
+  yield from _searchIndexFile(path, search)
+
+
+def _listDirectory(directory):
+  """List the entries of a directory as (name, is_dir, is_link) tuples."""
+  entries = []
+  with scandir(directory) as it:
+    for entry in it:
+      try:
+        entries.append((entry.name, entry.is_dir(), entry.is_symlink()))
+      except OSError:
+        pass
+
+  return entries
+
+
+class FileSystemIndex:
+  """A prebuilt index of a directory tree usable for path completion."""
+  # Just like completePath, we are not narrowable.
+  narrowable = False
+  # File names may contain new lines, but never NUL bytes.
+  separator = "\0"
+
+  def __init__(self, root, path):
+    """Create an index of the tree at 'root', stored in the file 'path'."""
+    # Next to the index itself we store the state of each directory
+    # (its modification time and entries) so that subsequent updates
+    # only need to re-scan directories that actually changed.
+    self._root = abspath(root)
+    self._path = path
+    self._state_path = path + ".state"
+
+
+  def _loadState(self):
+    """Load the directory state recorded by the last update."""
+    try:
+      with open(self._state_path, "r") as f:
+        return load(f)
+    except (OSError, ValueError):
+      return {}
+
+
+  def update(self):
+    """Create or incrementally update the index."""
+    old_state = self._loadState()
+    state = {}
+    paths = []
+    directories = [""]
+
+    while directories:
+      relative = directories.pop()
+      directory = join(self._root, relative)
+      try:
+        mtime = stat(directory).st_mtime_ns
+      except OSError:
+        continue
+
+      # A directory's modification time changes whenever an entry is
+      # added, removed, or renamed. If it did not change since the last
+      # update, we can reuse the recorded entries.
+      recorded = old_state.get(relative)
+      if recorded is not None and recorded[0] == mtime:
+        entries = recorded[1]
+      else:
+        try:
+          entries = _listDirectory(directory)
+        except OSError:
+          continue
+
+      state[relative] = [mtime, entries]
+
+      for name, is_dir, is_link in entries:
+        paths.append(join(directory, name) + (sep if is_dir else ""))
+        # We do not follow symbolic links to directories to prevent
+        # cycles.
+        if is_dir and not is_link:
+          directories.append(join(relative, name))
+
+    writeIndex(self._path, paths, self.separator)
+    with replacing(self._state_path) as f:
+      f.write(dumps(state).encode())
+
+
+  def __call__(self, parser, values, word):
+    """Complete a path using the index."""
+    # We look up absolute paths but report completions relative to the
+    # word the user provided. Note that joining with an empty base name
+    # preserves a trailing separator.
+    prefix = join(abspath(dirname(word)), basename(word))
+
+    if not prefix.startswith(join(self._root, "")):
+      yield from completePath(parser, values, word)
+      return
+
+    # Just like completePath we only complete a single level of the
+    # directory tree.
+    search = partial(searchIndexLevel, prefix=fsencode(prefix),
+                     separator=fsencode(self.separator), delimiter=fsencode(sep))
+    for path in _searchIndexFile(self._path, search):
+      rest = path[len(prefix):]
+      if rest:
+        yield word + rest
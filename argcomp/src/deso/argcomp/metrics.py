@@ -0,0 +1,310 @@
+# metrics.py
+
+#/***************************************************************************
+# *   Copyright (C) 2017 Daniel Mueller (deso@posteo.net)                   *
+# *                                                                         *
+# *   This program is free software: you can redistribute it and/or modify  *
+# *   it under the terms of the GNU General Public License as published by  *
+# *   the Free Software Foundation, either version 3 of the License, or     *
+# *   (at your option) any later version.                                   *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU General Public License for more details.                          *
+# *                                                                         *
+# *   You should have received a copy of the GNU General Public License     *
+# *   along with this program.  If not, see <http://www.gnu.org/licenses/>. *
+# ***************************************************************************/
+
+"""Aggregated metrics about completion requests."""
+
+from deso.argcomp.file import (
+  replacing,
+)
+from functools import (
+  partial,
+)
+from json import (
+  dumps,
+  loads,
+)
+from os import (
+  fchmod,
+)
+from re import (
+  compile as regex,
+)
+from threading import (
+  Lock,
+)
+
+
+REQUESTS = "argcomp_requests_total"
+EMPTY = "argcomp_empty_total"
+REQUEST_DURATION = "argcomp_request_duration_seconds"
+COMPLETER_CALLS = "argcomp_completer_calls_total"
+COMPLETER_DURATION = "argcomp_completer_duration_seconds"
+CACHE_HITS = "argcomp_cache_hits_total"
+CACHE_MISSES = "argcomp_cache_misses_total"
+
+# The upper bounds of the latency histogram buckets, in seconds. An
+# implicit last bucket catches everything larger.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+_SAMPLE = regex(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$')
+_LE = regex(r'^(?:(.*),)?le="([^"]*)"$')
+
+
+def completerLabel(completer):
+  """Retrieve a label identifying a completer in metrics."""
+  # Wrappers are reported as what they wrap.
+  while True:
+    if isinstance(completer, partial):
+      completer = completer.func
+    elif hasattr(completer, "__wrapped__"):
+      completer = completer.__wrapped__
+    else:
+      break
+
+  if not hasattr(completer, "__qualname__"):
+    completer = type(completer)
+
+  return "%s.%s" % (completer.__module__, completer.__qualname__)
+
+
+def _labels(labels):
+  """Format a set of labels the way Prometheus expects them."""
+  def escape(value):
+    """Escape a label value."""
+    return value.replace("\\", r"\\").replace("\"", r"\"").replace("\n", r"\n")
+
+  items = sorted(labels.items())
+  return ",".join('%s="%s"' % (key, escape(str(value))) for key, value in items)
+
+
+def _emptyMetrics():
+  """Create an empty set of metrics."""
+  return {"counters": {}, "histograms": {}}
+
+
+def mergeMetrics(*metrics):
+  """Merge multiple sets of metrics into one."""
+  result = _emptyMetrics()
+  for metrics_ in metrics:
+    for name, series in metrics_["counters"].items():
+      merged = result["counters"].setdefault(name, {})
+      for labels, value in series.items():
+        merged[labels] = merged.get(labels, 0) + value
+
+    for name, series in metrics_["histograms"].items():
+      merged = result["histograms"].setdefault(name, {})
+      for labels, histogram in series.items():
+        other = merged.get(labels)
+        if other is None:
+          other = {"buckets": [0] * (len(BUCKETS) + 1), "sum": 0.0}
+          merged[labels] = other
+
+        assert len(histogram["buckets"]) == len(other["buckets"])
+        buckets = zip(other["buckets"], histogram["buckets"])
+        other["buckets"] = [x + y for x, y in buckets]
+        other["sum"] += histogram["sum"]
+
+  return result
+
+
+def formatPrometheus(metrics):
+  """Format a set of metrics in the Prometheus text format."""
+  def sample(name, labels, value):
+    """Format a single sample."""
+    if labels:
+      return "%s{%s} %s" % (name, labels, value)
+    return "%s %s" % (name, value)
+
+  lines = []
+  for name, series in sorted(metrics["counters"].items()):
+    lines.append("# TYPE %s counter" % name)
+    for labels, value in sorted(series.items()):
+      lines.append(sample(name, labels, value))
+
+  for name, series in sorted(metrics["histograms"].items()):
+    lines.append("# TYPE %s histogram" % name)
+    for labels, histogram in sorted(series.items()):
+      # Prometheus buckets are cumulative.
+      count = 0
+      bounds = list(map(repr, BUCKETS)) + ["+Inf"]
+      for bound, value in zip(bounds, histogram["buckets"]):
+        count += value
+        le = ",".join(filter(None, [labels, 'le="%s"' % bound]))
+        lines.append(sample(name + "_bucket", le, count))
+
+      lines.append(sample(name + "_sum", labels, repr(histogram["sum"])))
+      lines.append(sample(name + "_count", labels, count))
+
+  return "".join(line + "\n" for line in lines)
+
+
+def parsePrometheus(text):
+  """Parse a set of metrics in the Prometheus text format."""
+  # We only support what formatPrometheus produces, not arbitrary
+  # files in said format.
+  metrics = _emptyMetrics()
+  types = {}
+  for line in text.splitlines():
+    if line.startswith("# TYPE "):
+      _, _, name, type_ = line.split()
+      types[name] = type_
+      continue
+    elif not line or line.startswith("#"):
+      continue
+
+    match = _SAMPLE.match(line)
+    if match is None:
+      raise ValueError("Invalid sample: %r" % line)
+
+    name, labels, value = match.groups()
+    labels = labels or ""
+    if types.get(name) == "counter":
+      metrics["counters"].setdefault(name, {})[labels] = int(value)
+      continue
+
+    base, _, suffix = name.rpartition("_")
+    if types.get(base) != "histogram":
+      raise ValueError("Sample of unknown metric: %r" % line)
+
+    series = metrics["histograms"].setdefault(base, {})
+    if suffix == "bucket":
+      labels, _ = _LE.match(labels).groups()
+      histogram = series.setdefault(labels or "", {"buckets": [], "sum": 0.0})
+      # Convert the cumulative counts back.
+      histogram["buckets"].append(int(value) - sum(histogram["buckets"]))
+    elif suffix == "sum":
+      series[labels]["sum"] = float(value)
+
+  return metrics
+
+
+def readMetrics(path):
+  """Read a set of metrics from a file in JSON or Prometheus text format."""
+  with open(path, "rb") as f:
+    text = f.read().decode()
+
+  if text.lstrip().startswith("{"):
+    return loads(text)
+  return parsePrometheus(text)
+
+
+def writeMetrics(path, metrics, format_=None):
+  """Atomically write a set of metrics to a file."""
+  # Unless specified otherwise, files with a '.json' suffix are written
+  # as JSON and all others in the Prometheus text format, so that they
+  # can be picked up by the node exporter's textfile collector.
+  if format_ is None:
+    format_ = "json" if path.endswith(".json") else "prometheus"
+
+  if format_ == "json":
+    text = dumps(metrics, sort_keys=True)
+  else:
+    text = formatPrometheus(metrics)
+
+  with replacing(path) as f:
+    # Temporary files are only accessible by their owner, but collectors
+    # typically run as a different user.
+    fchmod(f.fileno(), 0o644)
+    f.write(text.encode())
+
+
+class Metrics:
+  """Aggregated counters and latency histograms."""
+  def __init__(self, path=None, format_=None):
+    """Create a new, empty, set of metrics to be flushed to the given file."""
+    self._path = path
+    self._format = format_
+    self._lock = Lock()
+    self._metrics = _emptyMetrics()
+
+
+  def increment(self, name, value=1, **labels):
+    """Increment a counter."""
+    labels = _labels(labels)
+    with self._lock:
+      series = self._metrics["counters"].setdefault(name, {})
+      series[labels] = series.get(labels, 0) + value
+
+
+  def observe(self, name, value, **labels):
+    """Record an observation, typically a duration in seconds, in a histogram."""
+    labels = _labels(labels)
+    index = len(BUCKETS)
+    for i, bound in enumerate(BUCKETS):
+      if value <= bound:
+        index = i
+        break
+
+    with self._lock:
+      series = self._metrics["histograms"].setdefault(name, {})
+      histogram = series.get(labels)
+      if histogram is None:
+        histogram = {"buckets": [0] * (len(BUCKETS) + 1), "sum": 0.0}
+        series[labels] = histogram
+
+      histogram["buckets"][index] += 1
+      histogram["sum"] += value
+
+
+  def recordRequest(self, duration, empty):
+    """Record a completion request."""
+    self.increment(REQUESTS)
+    if empty:
+      self.increment(EMPTY)
+    self.observe(REQUEST_DURATION, duration)
+
+
+  def recordCompleter(self, completer, duration):
+    """Record the invocation of a completer."""
+    label = completerLabel(completer)
+    self.increment(COMPLETER_CALLS, completer=label)
+    self.observe(COMPLETER_DURATION, duration, completer=label)
+
+
+  def recordCache(self, cache, hit):
+    """Record a cache lookup."""
+    self.increment(CACHE_HITS if hit else CACHE_MISSES, cache=cache)
+
+
+  def snapshot(self):
+    """Retrieve a copy of the metrics collected so far."""
+    with self._lock:
+      return mergeMetrics(self._metrics)
+
+
+  def flush(self, path=None):
+    """Add the metrics collected so far to those stored in a file."""
+    # Completion typically happens in a new process each time, so we
+    # merge with what previous processes stored. A lock file serializes
+    # concurrent flushes so that no updates get lost. Metrics without a
+    # file are only kept in memory.
+    path = self._path if path is None else path
+    if path is None:
+      return
+
+    with self._lock:
+      metrics = self._metrics
+      self._metrics = _emptyMetrics()
+
+    # The fcntl module is only available on POSIX systems. Elsewhere
+    # concurrent flushes may lose updates, which we accept.
+    try:
+      from fcntl import flock, LOCK_EX
+    except ImportError:
+      flock = None
+
+    with open(path + ".lock", "ab") as lock:
+      if flock is not None:
+        flock(lock.fileno(), LOCK_EX)
+      try:
+        stored = readMetrics(path)
+      except (OSError, ValueError):
+        stored = _emptyMetrics()
+
+      writeMetrics(path, mergeMetrics(stored, metrics), self._format)
@@ -23,20 +23,31 @@ from argparse import (
   Action,
   ArgumentParser,
   FileType,
+  PARSER,
   REMAINDER,
   SUPPRESS,
 )
 from collections import (
+  ChainMap,
   namedtuple,
 )
+from contextvars import (
+  ContextVar,
+)
 from contextlib import (
   contextmanager,
+  redirect_stderr,
+  redirect_stdout,
 )
 from functools import (
   partial,
 )
 from os import (
+  _exit,
   curdir,
+  devnull,
+  environ,
+  fsdecode,
   sep,
   walk,
 )
@@ -44,16 +55,50 @@ from os.path import (
   dirname,
   join,
 )
+from heapq import (
+  merge,
+)
+from importlib import (
+  import_module,
+)
 from itertools import (
   chain,
+  islice,
 )
 from sys import (
   argv,
+  getsizeof,
+  intern,
   maxsize,
 )
+from threading import (
+  Lock,
+)
+from time import (
+  perf_counter,
+)
 
 
 COMPLETE_OPTION = "--_complete"
+COMPLETE_FD_OPTION = "--_complete-fd"
+
+# The environment variable used by the shell to ask for information on
+# whether completions can be narrowed down on its side.
+NARROW_VARIABLE = "ARGCOMP_NARROW"
+# The markers printed ahead of the completions in that case.
+NARROWABLE = "narrowable"
+NOT_NARROWABLE = "dynamic"
+# The environment variable naming a file to collect metrics in.
+METRICS_VARIABLE = "ARGCOMP_METRICS"
+
+# The context of the completion request currently being processed.
+_CONTEXT = ContextVar("context", default=None)
+# Completers that got imported, keyed by their import path.
+_COMPLETERS = {}
+# The identities of all parsers currently escaping their arguments.
+_ESCAPING = ContextVar("escaping", default=frozenset())
+# The lock serializing the release of parsers' completion state.
+_RELEASE_LOCK = Lock()
 
 
 class ParserError(BaseException):
@@ -66,6 +111,56 @@ def noCompletion(parser, values, word):
   return tuple()
 
 
+def importCompleter(name):
+  """Import a completer given its import path."""
+  module, _, qualname = name.partition(":")
+  object_ = import_module(module)
+  for attribute in qualname.split("."):
+    object_ = getattr(object_, attribute)
+
+  return object_
+
+
+def loadCompleter(completer):
+  """Load a completer that may be given by its import path."""
+  # Completers can be specified as 'package.module:function' strings
+  # so that their (potentially expensive to import) modules only get
+  # imported once completion actually requires them.
+  if not isinstance(completer, str):
+    return completer
+
+  loaded = _COMPLETERS.get(completer)
+  if loaded is None:
+    loaded = importCompleter(completer)
+    _COMPLETERS[completer] = loaded
+
+  return loaded
+
+
+def isNarrowable(completer):
+  """Check whether a completer's completions for a word include those of its extensions."""
+  # Completers are considered narrowable unless marked otherwise. That
+  # includes the functions wrapped by a partial.
+  while True:
+    if not getattr(completer, "narrowable", True):
+      return False
+    elif isinstance(completer, partial):
+      completer = completer.func
+    else:
+      return True
+
+
+def dynamic(completer):
+  """Mark a completer as not narrowable."""
+  # Completions of narrowable completers may get reused when the word
+  # to complete is extended, e.g., by the shell. Completers that report
+  # completions not starting with the word (such as a path completer
+  # descending into directories) or that change their results over
+  # time need to be marked as dynamic.
+  completer.narrowable = False
+  return completer
+
+
 def completePath(parser, values, word):
   """Attempt completion of a path."""
   # Note that in case there is no trailing separator ("/") the return
@@ -91,6 +186,88 @@ def completePath(parser, values, word):
     break
 
 
+# Completing a directory's contents is not a narrowing of completing the
+# directory itself.
+dynamic(completePath)
+
+
+def unionCompleter(*completers):
+  """Create a completer yielding the completions of all given completers once."""
+  def completeUnion(parser, values, word):
+    """Yield the completions of all completers, skipping duplicates."""
+    seen = set()
+    for completer in completers:
+      for completion in completer(parser, values, word):
+        if completion not in seen:
+          seen.add(completion)
+          yield completion
+
+  completeUnion.narrowable = all(map(isNarrowable, completers))
+  return completeUnion
+
+
+def mergeCompleter(*completers):
+  """Create a completer merging the sorted completions of all given completers."""
+  def completeMerge(parser, values, word):
+    """Yield the merged completions of all completers, skipping duplicates."""
+    # Because all inputs are sorted, duplicates are adjacent and we do
+    # not have to remember all completions reported so far.
+    sources = [completer(parser, values, word) for completer in completers]
+    last = None
+    for completion in merge(*sources):
+      if completion != last:
+        last = completion
+        yield completion
+
+  completeMerge.narrowable = all(map(isNarrowable, completers))
+  return completeMerge
+
+
+def filterCompleter(predicate, completer):
+  """Create a completer yielding only completions satisfying a predicate."""
+  def completeFilter(parser, values, word):
+    """Yield the completions accepted by the predicate."""
+    return filter(predicate, completer(parser, values, word))
+
+  completeFilter.narrowable = isNarrowable(completer)
+  return completeFilter
+
+
+def mapCompleter(function, completer):
+  """Create a completer transforming all completions using a function."""
+  def completeMap(parser, values, word):
+    """Yield the transformed completions."""
+    return map(function, completer(parser, values, word))
+
+  # The function may map completions to something not starting with
+  # the word, so we cannot know whether the result is narrowable.
+  return dynamic(completeMap)
+
+
+def limitCompleter(count, completer):
+  """Create a completer yielding at most 'count' completions."""
+  def completeLimit(parser, values, word):
+    """Yield the first completions."""
+    # Completers are consumed lazily, so once the limit is reached no
+    # more work is performed upstream.
+    return islice(completer(parser, values, word), count)
+
+  # Completions cut off by the limit may be reported for an extended
+  # word, so a limited completer cannot be narrowable.
+  return dynamic(completeLimit)
+
+
+def completeChoice(parser, values, word, choices):
+  """Attempt completion of a word from the given choices."""
+  # Choices that are non-strings are allowed. For instance, integers
+  # are valid candidates and understood by the ArgumentParser.
+  # At the end of the day, however, everything we emit is a string,
+  # so work with strings here.
+  for choice in map(str, choices):
+    if choice.startswith(word):
+      yield choice
+
+
 class Argument(namedtuple("Argument", ["min_", "max_", "comp"])):
   """A tuple describing arguments."""
   def __new__(cls, min_=0, max_=0, comp=noCompletion):
@@ -115,6 +292,65 @@ class Arguments(namedtuple("Arguments", ["positionals", "keywords"])):
     return super().__new__(cls, positionals, keywords)
 
 
+class Settings(namedtuple("Settings", ["shared", "metrics", "release",
+                                       "fast_exit", "prefetcher"])):
+  """A tuple of the settings a parser hands down to its sub parsers."""
+  pass
+
+
+class Footprint(namedtuple("Footprint", ["nodes", "arguments", "strings", "size"])):
+  """A tuple describing the memory footprint of a completion tree."""
+  pass
+
+
+def footprint(arguments):
+  """Determine the memory footprint of a completion tree."""
+  seen = set()
+  nodes = 0
+  arguments_ = 0
+  strings = 0
+  size = 0
+
+  def account(object_):
+    """Account for an object unless it was seen before."""
+    nonlocal size
+
+    if id(object_) in seen:
+      return False
+
+    seen.add(id(object_))
+    size += getsizeof(object_)
+    return True
+
+  # Note that we only account for the completion tree itself. The
+  # completers referenced by it are owned by the program.
+  stack = [arguments]
+  while stack:
+    node = stack.pop()
+    if not account(node):
+      continue
+
+    nodes += 1
+    account(node.positionals)
+    account(node.keywords)
+    if isinstance(node.keywords, ChainMap):
+      # The keywords inherited from parent parsers are shared.
+      for map_ in node.keywords.maps:
+        account(map_)
+
+    for word in node.keywords:
+      if account(word):
+        strings += 1
+
+    for value in chain(node.positionals, node.keywords.values()):
+      if isinstance(value, Arguments):
+        stack.append(value)
+      elif account(value):
+        arguments_ += 1
+
+  return Footprint(nodes, arguments_, strings, size)
+
+
 def escapeDoubleDash(args, index=0):
   """Escape all '--' strings in the array."""
   first = args[:index]
@@ -127,8 +363,176 @@ def unescapeDoubleDash(args):
   return map(lambda x: x.replace(r"\--", r"--"), args)
 
 
-def complete(parser, values, arguments, words):
-  """Complete the last word in the given list of words."""
+def completionRequested(args):
+  """Check whether the given arguments represent a completion request."""
+  return COMPLETE_OPTION in args or COMPLETE_FD_OPTION in args
+
+
+def readWords(fd):
+  """Read NUL separated words from the given file descriptor."""
+  # We read everything in one go. The file descriptor is owned by the
+  # caller (typically it is stdin), so we must not close it.
+  with open(fd, "rb", closefd=False) as f:
+    data = f.read()
+
+  words = data.split(b"\0")
+  # A terminating NUL byte is optional. If present, it must not result
+  # in an additional empty word.
+  if data.endswith(b"\0"):
+    words.pop()
+
+  return [fsdecode(word) for word in words]
+
+
+def completionWords(values):
+  """Extract the words to complete from a list of --_complete arguments."""
+  # The values array contains all arguments as they were passed in to
+  # the completion option, in our case, the word index ($COMP_CWORD)
+  # and words as parsed by the shell ($COMP_WORDS[@]). The first word in
+  # the words array is typically the Python script invoked. It might not
+  # be if the script was invoked by indirectly by passing it as an
+  # argument to the interpreter.
+  index, script, *words = values
+  return words[:int(index)]
+
+
+class CompletionContext:
+  """Information about a completion request shared by all completers involved."""
+  def __init__(self, parser, values, arguments, completers, keywords,
+               path, seen, metrics=None):
+    """Create a new completion context."""
+    self._parser = parser
+    self._values = values
+    self._arguments = arguments
+    self._completers = completers
+    self._keywords = keywords
+    self._path = path
+    self._seen = seen
+    self._metrics = metrics
+    self._parsed = False
+    self._namespace = None
+
+
+  @property
+  def parser(self):
+    """Retrieve the parser the completion request is for."""
+    return self._parser
+
+
+  @property
+  def values(self):
+    """Retrieve the words provided for completion, including the one to complete."""
+    return self._values
+
+
+  @property
+  def word(self):
+    """Retrieve the word to complete."""
+    return self._values[-1]
+
+
+  @property
+  def arguments(self):
+    """Retrieve the arguments of the parser the word belongs to."""
+    return self._arguments
+
+
+  @property
+  def completers(self):
+    """Retrieve the completers invoked for completing the word."""
+    return self._completers
+
+
+  @property
+  def path(self):
+    """Retrieve the names of the sub commands leading to the active parser."""
+    return self._path
+
+
+  @property
+  def seen(self):
+    """Retrieve the keyword arguments already provided, in order."""
+    return self._seen
+
+
+  @property
+  def metrics(self):
+    """Retrieve the metrics to record information about the request in, if any."""
+    return self._metrics
+
+
+  @property
+  def narrowable(self):
+    """Check whether completions of any extension of the word are a subset of ours."""
+    return all(map(isNarrowable, self._completers))
+
+
+  @property
+  def namespace(self):
+    """Retrieve a namespace as parsed from the words provided, if possible."""
+    # Parsing is potentially expensive and so we do it only once and
+    # only if someone asks. Because the words typed so far may not
+    # form a valid command line, we try again without the word to
+    # complete if parsing fails. If that does not work either, there is
+    # no namespace.
+    # Note that the sandbox only covers the parser itself. Sub parsers
+    # report errors by printing their usage and exiting, and an option
+    # such as --help prints the help text before exiting. None of that
+    # must end up in the completions or terminate the completion.
+    if not self._parsed:
+      self._parsed = True
+      if self._parser is not None:
+        with open(devnull, "w") as null:
+          for values in (self._values, self._values[:-1]):
+            try:
+              with sandbox(self._parser), redirect_stdout(null), \
+                   redirect_stderr(null):
+                self._namespace, _ = self._parser.parse_known_args(values)
+              break
+            except (ParserError, SystemExit):
+              pass
+
+    return self._namespace
+
+
+  def completions(self):
+    """Retrieve all completions for the word."""
+    word = self.word
+    token = _CONTEXT.set(self)
+    try:
+      for completer in self._completers:
+        if self._metrics is None:
+          yield from completer(self._parser, self._values, word)
+        else:
+          start = perf_counter()
+          try:
+            yield from completer(self._parser, self._values, word)
+          finally:
+            self._metrics.recordCompleter(completer, perf_counter() - start)
+    finally:
+      _CONTEXT.reset(token)
+
+    if self._keywords:
+      for keyword in self._arguments.keywords:
+        if keyword.startswith(word):
+          yield keyword
+
+
+def completionContext():
+  """Retrieve the context of the completion request currently being processed."""
+  # Completers can use this function to access information about the
+  # completion request that is shared among all completers.
+  return _CONTEXT.get()
+
+
+def completionMetrics():
+  """Retrieve the metrics of the completion request currently being processed."""
+  context = _CONTEXT.get()
+  return context.metrics if context is not None else None
+
+
+def resolve(parser, values, arguments, words, metrics=None):
+  """Determine how to complete the last word in the given list of words."""
   def getPositional():
     """Retrieve the positional argument at 'pos_idx'."""
     if pos_idx < len(arguments.positionals):
@@ -147,6 +551,9 @@ def complete(parser, values, arguments, words):
   pos = getPositional()
   # The minimum and maximum keyword-level positional arguments.
   key = Argument()
+  # The sub commands and keyword arguments encountered.
+  path = []
+  seen = []
 
   for word in words:
     # Try matching any keyword arguments. They take precedence over
@@ -158,8 +565,10 @@ def complete(parser, values, arguments, words):
         arguments = value
         pos_idx = 0
         pos = getPositional()
+        path.append(word)
       elif isinstance(value, Argument):
         key = value
+        seen.append(word)
     # Try matching it as a positional. Keyword argument positionals
     # take precedence over parser level ones.
     elif key.max_ > 0:
@@ -177,20 +586,68 @@ def complete(parser, values, arguments, words):
           break
       else:
         # We were unable to find a matching positional argument.
-        return
+        return None
 
+  completers = []
   if pos.max_ > 0:
-    yield from pos.comp(parser, values, to_complete)
+    completers.append(loadCompleter(pos.comp))
 
   if key.max_ > 0:
-    yield from key.comp(parser, values, to_complete)
+    completers.append(loadCompleter(key.comp))
 
   # If there are open keyword-level positional arguments then we
   # should not start completion of keyword arguments.
-  if key.min_ <= 0:
-    for word in arguments.keywords:
-      if word.startswith(to_complete):
-        yield word
+  keywords = key.min_ <= 0
+  return CompletionContext(parser, values, arguments, tuple(completers),
+                           keywords, tuple(path), tuple(seen), metrics)
+
+
+def complete(parser, values, arguments, words):
+  """Complete the last word in the given list of words."""
+  context = resolve(parser, values, arguments, words)
+  if context is not None:
+    yield from context.completions()
+
+
+def isArgumentFile(word, chars):
+  """Check whether a word references a file containing arguments."""
+  return chars is not None and word[:1] != "" and word[0] in chars
+
+
+def completeWords(parser, words, arguments, chars=None, metrics=None):
+  """Complete the last word in a list of words."""
+  # The result is a tuple of the completions, whether they are
+  # narrowable, and the context they were created in (if any). We do
+  # not know what arguments a file provides without reading it, which
+  # may be costly. So we ignore all files referenced by words starting
+  # with one of 'chars'.
+  *words, to_complete = words
+  words = [word for word in words if not isArgumentFile(word, chars)]
+  words.append(to_complete)
+
+  if isArgumentFile(to_complete, chars):
+    prefix, path = to_complete[0], to_complete[1:]
+    completions = [prefix + p for p in completePath(parser, words, path)]
+    return completions, isNarrowable(completePath), None
+
+  context = resolve(parser, words, arguments, words, metrics)
+  if context is None:
+    return [], True, None
+
+  return list(context.completions()), context.narrowable, context
+
+
+def printCompletions(completions, narrowable):
+  """Print completions in the format the shell expects them in."""
+  # If the shell asks for it, we tell it whether it can narrow down
+  # the completions itself once the word to complete gets extended.
+  # Note that if there is no context, no extension of the word will
+  # produce any completions.
+  if environ.get(NARROW_VARIABLE):
+    print(NARROWABLE if narrowable else NOT_NARROWABLE)
+
+  if len(completions) > 0:
+    print("\n".join(map(str, completions)))
 
 
 def decodeNargs(nargs):
@@ -215,25 +672,27 @@ def decodeNargs(nargs):
     return nargs, nargs
 
 
+# The number of arguments consumed by argparse's built-in actions.
+_ACTION_NARGS = {
+  # An action of None is the default and is equal to the "store"
+  # action, both of which default to a single argument.
+  None: 1,
+  "store": 1,
+  "store_const": 0,
+  "store_true": 0,
+  "store_false": 0,
+  "append": 1,
+  "append_const": 0,
+  "count": 0,
+  "help": 0,
+  "version": 0,
+}
+
+
 def decodeAction(action):
   """Decode the number of arguments for an action."""
-  lookup = {
-    # An action of None is the default and is equal to the "store"
-    # action, both of which default to a single argument.
-    None: 1,
-    "store": 1,
-    "store_const": 0,
-    "store_true": 0,
-    "store_false": 0,
-    "append": 1,
-    "append_const": 0,
-    "count": 0,
-    "help": 0,
-    "version": 0,
-  }
-
   try:
-    return decodeNargs(lookup[action])
+    return decodeNargs(_ACTION_NARGS[action])
   except KeyError:
     # We must be dealing with an action object/class or an object
     # implementing the same interface. Any such object must have a
@@ -271,62 +730,121 @@ class CompleteAction(Action):
   def __call__(self, parser, namespace, values, option_string=None):
     """Invoke the action to attempt to complete a command line argument."""
     values = list(unescapeDoubleDash(values))
+    parser.complete(completionWords(values))
 
-    # The values array we got passed in here contains all arguments as
-    # they were passed in to the --_complete option, in our case, the
-    # word index ($COMP_CWORD) and words as parsed by the shell
-    # ($COMP_WORDS[@]). The first word in the words array is typically
-    # the Python script invoked. It might not be if the script was
-    # invoked by indirectly by passing it as an argument to the
-    # interpreter.
-    index, script, *words = values
-    index = int(index)
 
-    parser.complete(words[:index])
+class CompleteFdAction(Action):
+  """An action completing command line arguments read from a file descriptor."""
+  def __call__(self, parser, namespace, values, option_string=None):
+    """Invoke the action to attempt to complete a command line argument."""
+    # The file descriptor provides the same data as would be passed in
+    # to the --_complete option, just NUL separated. Because it never
+    # passes through argv, no escaping of '--' is necessary.
+    parser.complete(completionWords(readWords(values)))
 
 
 class CompletingArgumentParser(ArgumentParser):
   """An ArgumentParser derivate with argument completion support."""
-  _ESCAPED = "__escaped"
-
-
   def __init__(self, *args, prefix_chars=None, fromfile_prefix_chars=None,
-               arguments=None, **kwargs):
+               arguments=None, shared=None, metrics=None, release=False,
+               fast_exit=False, prefetcher=None, **kwargs):
     """Create an argument parser with argument completion support."""
     assert prefix_chars is None, ("The prefix_chars argument is not "
                                   "supported. Got %s." % prefix_chars)
-    assert fromfile_prefix_chars is None, ("The fromfile_prefix_chars "
-                                           "argument is not supported. "
-                                           "Got %s." % fromfile_prefix_chars)
 
     if arguments is None:
       self._arguments = Arguments()
     else:
       self._arguments = arguments
 
+    # The settings get handed down to all sub parsers. We keep them in
+    # a single attribute, because argparse accesses attributes of the
+    # parser all over the place when parsing, and CPython does so
+    # efficiently only for objects with few (up to 30) attributes.
+    # - shared: objects that can be shared within the completion tree
+    #   of this parser and all its sub parsers
+    # - release: in release mode, long-running programs that do not
+    #   perform completion do not have to pay for the completion state.
+    #   If the program was not invoked for completion we do not even
+    #   build it, otherwise we drop it after the first regular parse.
+    # - prefetcher: long-lived programs can have the completers likely
+    #   to be invoked by the next request warmed in the background
+    self._settings = Settings(
+      shared={} if shared is None else shared, metrics=metrics,
+      release=release, fast_exit=fast_exit, prefetcher=prefetcher,
+    )
+    self._parsers = {}
+    # The formatter to use while adding arguments in bulk.
+    self._formatter = None
+    self._completion = not release or completionRequested(argv[1:])
+
+    if self._completion:
+      self._inheritCompletion(kwargs.get("parents", ()))
+
     # Note that in case the add_help option is true the argment parser
     # will add two arguments -h/--help. Because it uses the add_argument
     # method to do so there is nothing to do special from our side.
-    super().__init__(*args, **kwargs)
-
-    self.add_argument(
-      COMPLETE_OPTION, action=CompleteAction, complete=False,
-      default=SUPPRESS, nargs=REMAINDER, help=SUPPRESS,
-    )
-
+    super().__init__(*args, fromfile_prefix_chars=fromfile_prefix_chars,
+                     **kwargs)
+
+    # Parent parsers may have provided the hidden options already.
+    if self._completion and COMPLETE_OPTION not in self._option_string_actions:
+      self.add_argument(
+        COMPLETE_OPTION, action=CompleteAction, complete=False,
+        default=SUPPRESS, nargs=REMAINDER, help=SUPPRESS,
+      )
+    if self._completion and COMPLETE_FD_OPTION not in self._option_string_actions:
+      self.add_argument(
+        COMPLETE_FD_OPTION, action=CompleteFdAction, complete=False,
+        default=SUPPRESS, type=int, help=SUPPRESS,
+      )
+
+
+  def _inheritCompletion(self, parents):
+    """Inherit the completions of the arguments of the given parent parsers."""
+    # argparse copies the actions of parent parsers without invoking
+    # add_argument. Just as argparse we expect parents to be fully
+    # initialized at this point.
+    inherited = []
+    for parent in parents:
+      if isinstance(parent, CompletingArgumentParser):
+        # The keywords of a parent are referenced instead of copied, so
+        # that a common set of options costs the same regardless of the
+        # number of parsers inheriting it. The (usually few) positionals
+        # have to be copied, because the child may add more of them.
+        self._arguments.positionals.extend(parent.arguments.positionals)
+        inherited.append(parent.arguments.keywords)
+      else:
+        # A plain ArgumentParser knows nothing about completion, so we
+        # deduce what we can from its actions.
+        for action in parent._actions:
+          if action.nargs == PARSER:
+            continue
+
+          args = action.option_strings or (action.dest,)
+          self._addCompletion(args, nargs=action.nargs, choices=action.choices,
+                              type=action.type)
+
+    if inherited:
+      # Just as with argparse's 'resolve' conflict handler, arguments of
+      # the child override those of its parents and later parents
+      # override earlier ones.
+      keywords = ChainMap(self._arguments.keywords, *reversed(inherited))
+      self._arguments = self._arguments._replace(keywords=keywords)
+
+
+  def _share(self, object_):
+    """Retrieve an object equal to the given one that can be shared."""
+    try:
+      return self._settings.shared.setdefault(object_, object_)
+    except TypeError:
+      # The object (e.g., its completer) is not hashable and so it
+      # cannot be shared.
+      return object_
 
-  def _addCompletion(self, arg, choices=None, completer=None, **kwargs):
-    """Register a completion for the given argument."""
-    def completeChoice(parser, values, word, choices):
-      """Attempt completion of a word from the given choices."""
-      # Choices that are non-strings are allowed. For instance, integers
-      # are valid candidates and understood by the ArgumentParser.
-      # At the end of the day, however, everything we emit is a string,
-      # so work with strings here.
-      for choice in map(str, choices):
-        if choice.startswith(word):
-          yield choice
 
+  def _addCompletion(self, args, choices=None, completer=None, **kwargs):
+    """Register a completion for the given argument and all its aliases."""
     # We only fall back to interpreting the action to deduce the
     # argument count if no nargs parameter is given.
     if "nargs" in kwargs:
@@ -341,7 +859,19 @@ class CompletingArgumentParser(ArgumentParser):
     if choices is not None:
       # The 'completer' argument and 'choices' are mutually exclusive.
       assert completer is None
-      completer = partial(completeChoice, choices=choices)
+      # Choices are shared based on what gets emitted. Choices comparing
+      # equal, such as (1, 2) and (1.0, 2.0), may well complete
+      # differently.
+      try:
+        key = ("choices", tuple(map(str, choices)))
+      except TypeError:
+        # The choices cannot be iterated and so they cannot be shared.
+        completer = partial(completeChoice, choices=choices)
+      else:
+        completer = self._settings.shared.get(key)
+        if completer is None:
+          completer = partial(completeChoice, choices=choices)
+          self._settings.shared[key] = completer
 
     if "type" in kwargs:
       if isinstance(kwargs["type"], FileType):
@@ -351,21 +881,23 @@ class CompletingArgumentParser(ArgumentParser):
     if completer is None:
       completer = noCompletion
 
-    argument = Argument(cur_min_, cur_max_, completer)
-    keyword = arg.startswith("-")
-    if keyword:
-      # We are dealing with a keyword argument.
-      self._arguments.keywords[arg] = argument
-    else:
-      # We are dealing with a positional argument.
-      self._arguments.positionals.append(argument)
+    # All aliases of an argument (e.g., -f and --foo) share the same
+    # Argument object, as do equal arguments of different parsers.
+    argument = self._share(Argument(cur_min_, cur_max_, completer))
+    for arg in args:
+      keyword = arg.startswith("-")
+      if keyword:
+        # We are dealing with a keyword argument.
+        self._arguments.keywords[intern(arg)] = argument
+      else:
+        # We are dealing with a positional argument.
+        self._arguments.positionals.append(argument)
 
 
   def _addArgument(self, *args, complete=True, **kwargs):
     """Add completions for an argument to the parser."""
-    if complete:
-      for arg in args:
-        self._addCompletion(arg, **kwargs)
+    if complete and self._completion:
+      self._addCompletion(args, **kwargs)
 
 
   def add_argument(self, *args, complete=True, completer=None, **kwargs):
@@ -374,37 +906,88 @@ class CompletingArgumentParser(ArgumentParser):
     return super().add_argument(*args, **kwargs)
 
 
-  def _skipMultiEscape(function):
-    """A decorator used to avoid multiple escape operations by recursive invocations."""
-    def wrapper(self, *args, **kwargs):
-      """Wrapper function potentially skipping an invocation on CompletingArgumentParser."""
-      if hasattr(self, self._ESCAPED):
-        # In case the __escaped member exists we must have executed the
-        # wrapper code of parse_args/parse_known_args in
-        # CompletingArgumentParser already. We do not want to invoke it
-        # multiple times, so directly forward the call to the parent
-        # class.
-        super_ = super(CompletingArgumentParser, self)
-        return getattr(super_, function.__name__)(*args, **kwargs)
+  def _addArguments(self, container, spec):
+    """Add the arguments and groups described by a specification to a container."""
+    for entry in spec:
+      entry = dict(entry)
+      if "group" in entry:
+        arguments = entry.pop("arguments", ())
+        group = container.add_argument_group(entry.pop("group"), **entry)
+        self._addArguments(group, arguments)
+      elif "exclusive" in entry:
+        arguments = entry.pop("arguments", ())
+        del entry["exclusive"]
+        group = container.add_mutually_exclusive_group(**entry)
+        self._addArguments(group, arguments)
+      elif "subcommands" in entry:
+        assert container is self, ("subcommands are only supported at the "
+                                   "parser level")
+        parsers = entry.pop("subcommands")
+        # argparse uses a formatter for deducing the program name of sub
+        # commands, changing it in the process. So we must not hand out
+        # our shared one here.
+        formatter, self._formatter = self._formatter, None
+        try:
+          subparsers = self.add_subparsers(**entry)
+        finally:
+          self._formatter = formatter
+
+        for parser in parsers:
+          parser = dict(parser)
+          arguments = parser.pop("arguments", ())
+          subparsers.add_parser(parser.pop("name"), **parser).add_arguments(arguments)
       else:
-        return function(self, *args, **kwargs)
+        args = entry.pop("args")
+        if isinstance(args, str):
+          args = (args,)
+        container.add_argument(*args, **entry)
+
+
+  def add_arguments(self, spec):
+    """Add arguments, groups, and sub commands as described by a specification."""
+    # The specification is a list of dicts, each describing either
+    # - an argument: {"args": ("-f", "--foo"), **add_argument kwargs}
+    # - an argument group:
+    #   {"group": title, "arguments": [...], **add_argument_group kwargs}
+    # - a mutually exclusive group:
+    #   {"exclusive": True, "arguments": [...],
+    #    **add_mutually_exclusive_group kwargs}
+    # - sub commands:
+    #   {"subcommands": [{"name": name, "arguments": [...],
+    #                     **add_parser kwargs}, ...],
+    #    **add_subparsers kwargs}
+    # Compared to adding arguments one by one, we use a single formatter
+    # for verifying all of them instead of creating one per argument.
+    formatter = self._formatter
+    self._formatter = super()._get_formatter()
+    try:
+      self._addArguments(self, spec)
+    finally:
+      self._formatter = formatter
+
 
-    return wrapper
+  def _get_formatter(self):
+    """Retrieve a formatter for the parser."""
+    # argparse creates a formatter for each argument added only to
+    # check its metavar. The formatter is not changed by that, so we can
+    # reuse one while adding arguments in bulk. Note that formatters
+    # used for creating help texts are stateful and must not be shared.
+    if self._formatter is not None:
+      return self._formatter
+
+    return super()._get_formatter()
 
 
   def _parseArgs(self, parse_func, args=None, namespace=None):
     """Parse a list of arguments."""
     @contextmanager
     def escaped(parser):
-      """A context manager for setting the __escaped member."""
-      setattr(parser, self._ESCAPED, None)
+      """A context manager for marking a parser as escaping."""
+      token = _ESCAPING.set(_ESCAPING.get() | {id(parser)})
       try:
         yield
       finally:
-        delattr(parser, self._ESCAPED)
-
-    if args is None:
-      args = argv[1:]
+        _ESCAPING.reset(token)
 
     # Unfortunately, any '--' argument is interpreted by the
     # ArgumentParser causing it to treat all follow up arguments as
@@ -421,48 +1004,137 @@ class CompletingArgumentParser(ArgumentParser):
     #    everything else as positional arguments. With this approach we
     #    have to find a way to define those (optional!) positional
     #    arguments but also to pass them in to the CompleteAction.
-    try:
-      # TODO: This approach likely breaks assignments, e.g.,
-      #       --_complete="${COMP_WORDS[@]}"
-      index = args.index(COMPLETE_OPTION) + 1
-      args = list(escapeDoubleDash(args, index=index))
-    except ValueError:
-      pass
+    # TODO: This approach likely breaks assignments, e.g.,
+    #       --_complete="${COMP_WORDS[@]}"
+    index = args.index(COMPLETE_OPTION) + 1
+    args = list(escapeDoubleDash(args, index=index))
 
     # Note that argparse's parse_args may be implemented by means of
     # parse_known_args. If that is the case, we would effectively be
     # escaping the arguments twice because we get invoked again. To
-    # avoid this case, we have some machinery in place to detect such a
-    # recursive invocation and forward the call directly to the parent
-    # class.
+    # avoid this case, we mark the parser as escaping and forward a
+    # recursive invocation directly to the parent class. The marker is
+    # kept in a context variable and not on the instance, so that
+    # concurrent invocations from different threads do not interfere
+    # with each other.
     with escaped(self):
       return parse_func(args=args, namespace=namespace)
 
 
-  @_skipMultiEscape
-  def parse_args(self, args=None, namespace=None):
-    """Parse a list of arguments."""
-    return self._parseArgs(super().parse_args, args, namespace)
-
-
-  @_skipMultiEscape
   def parse_known_args(self, args=None, namespace=None):
     """Parse all known arguments from a list of arguments."""
+    # This method is on the path of each and every parse operation (for
+    # each level of sub parsers). The vast majority of them are not
+    # about completion and we want them to have no measurable overhead
+    # over a plain ArgumentParser. That is also why we do not override
+    # parse_args: argparse implements it by means of parse_known_args,
+    # so overriding the latter suffices and saves a level of dispatch.
+    if args is None:
+      args = argv[1:]
+
+    # Arguments can be parsed as is unless completion is requested and
+    # they are not yet escaped. We bypass super() here, as creating the
+    # proxy object is measurable as well.
+    if COMPLETE_OPTION not in args or id(self) in _ESCAPING.get():
+      result = ArgumentParser.parse_known_args(self, args, namespace)
+      if self._settings.release:
+        self._releaseCompletion()
+      return result
+
     return self._parseArgs(super().parse_known_args, args, namespace)
 
 
+  def _releaseCompletion(self):
+    """Drop all state only required for completion."""
+    # Completers may parse the words typed so far while a completion
+    # is in progress, and that must not affect the completion itself.
+    if _CONTEXT.get() is not None:
+      return
+
+    # The parser may be used by multiple threads concurrently, of which
+    # only the first one gets to release the state.
+    with _RELEASE_LOCK:
+      if not self._completion:
+        return
+      self._completion = False
+
+    for parser in self._parsers.values():
+      parser._releaseCompletion()
+
+    # argparse offers no public way of removing an argument, so we have
+    # to resort to its internals for dropping the hidden options. Other
+    # threads may be parsing in the meantime, which is why we replace
+    # the containers (shared by all argument groups) instead of
+    # modifying them.
+    def visible(action):
+      """Check whether an action is not one of the hidden options."""
+      return not isinstance(action, (CompleteAction, CompleteFdAction))
+
+    actions = list(filter(visible, self._actions))
+    options = {s: a for s, a in self._option_string_actions.items() if visible(a)}
+    for container in [self] + self._action_groups + self._mutually_exclusive_groups:
+      container._actions = actions
+      container._option_string_actions = options
+      if container is not self:
+        container._group_actions = list(filter(visible, container._group_actions))
+
+    self._arguments = Arguments()
+    self._settings = self._settings._replace(shared={})
+    self._parsers = {}
+
+
+  def _isArgumentFile(self, word):
+    """Check whether a word references a file containing arguments."""
+    return isArgumentFile(word, self.fromfile_prefix_chars)
+
+
+  def _readArgumentFile(self, path, args):
+    """Read the arguments contained in a file, appending them to a list."""
+    try:
+      # In contrast to argparse we read the file line by line, so that
+      # large files do not have to be kept in memory as a whole.
+      with open(path) as f:
+        for line in f:
+          for arg in self.convert_arg_line_to_args(line.rstrip("\n")):
+            if self._isArgumentFile(arg):
+              self._readArgumentFile(arg[1:], args)
+            else:
+              args.append(arg)
+    except OSError as err:
+      self.error(str(err))
+
+
+  def _read_args_from_files(self, arg_strings):
+    """Replace arguments referencing files with the contents of the files."""
+    args = []
+    arg_strings = iter(arg_strings)
+    for arg in arg_strings:
+      if arg == COMPLETE_OPTION:
+        # The words to complete are to be taken literally.
+        args.append(arg)
+        args.extend(arg_strings)
+      elif self._isArgumentFile(arg):
+        self._readArgumentFile(arg[1:], args)
+      else:
+        args.append(arg)
+
+    return args
+
+
   def add_subparsers(self, *args, **kwargs):
     """Add subparsers to the argument parser."""
     def addParser(add_parser, name, *args, **kwargs):
       """A replacement method for the add_parser method."""
-      sub_arguments = Arguments()
-      self._arguments.keywords[name] = sub_arguments
-
       # Invoke the original add_parser function. We need to do that
       # because this function takes care of handling special keyword
       # arguments such as 'help' which must not be passed through to our
-      # argument parser directly.
-      return add_parser(name, *args, arguments=sub_arguments, **kwargs)
+      # argument parser directly. Note that the sub parser creates its
+      # own completion tree, because it may inherit from parents.
+      parser = add_parser(name, *args, **self._settings._asdict(), **kwargs)
+      if self._completion:
+        self._arguments.keywords[intern(name)] = parser.arguments
+        self._parsers[name] = parser
+      return parser
 
     assert "parser_class" not in kwargs, ("parser_class argument not supported. "
                                           "Got %s." % kwargs["parser_class"])
@@ -508,20 +1180,137 @@ class CompletingArgumentParser(ArgumentParser):
     # by a new line symbol) and then exit. The latter step is rather
     # clumsy but then no better solution that requires no additional
     # work on the client side was found.
+    metrics = self._settings.metrics
+    if metrics is None and environ.get(METRICS_VARIABLE):
+      # The metrics module (indirectly) depends on this one, so we
+      # cannot import it globally.
+      from deso.argcomp.metrics import Metrics
+      metrics = Metrics(environ[METRICS_VARIABLE])
+
+    # Warming up for the previous request is pointless once we know
+    # what the next one is about.
+    prefetcher = self._settings.prefetcher
+    if prefetcher is not None:
+      prefetcher.cancel()
+
+    start = perf_counter()
+    narrowable = True
     try:
       # We do not want clients invoking a parser and causing a failure
       # to unconditionally exit the program and printing an error or the
       # usage of the program, so we replace the methods causing trouble
       # with benign ones temporarily.
       with sandbox(self):
-        completions = list(complete(self, words, self.arguments, words))
+        completions, narrowable, context = completeWords(
+          self, words, self.arguments, self.fromfile_prefix_chars, metrics
+        )
+        if context is not None and prefetcher is not None:
+          prefetcher.schedule(self, context.arguments, completions)
     except ParserError:
-      self.exit(1)
+      completions = None
+
+    if metrics is not None:
+      metrics.recordRequest(perf_counter() - start, not completions)
+      try:
+        metrics.flush()
+      except OSError:
+        # Failure to persist metrics is no reason to fail completion.
+        pass
+
+    if completions is None:
+      self._exitCompletion(1)
+
+    printCompletions(completions, narrowable)
+    self._exitCompletion(0 if len(completions) > 0 else 1)
+
+
+  def _exitCompletion(self, status):
+    """Exit after a completion request got handled."""
+    if self._settings.fast_exit:
+      # Once the completions are written there is nothing left the
+      # shell is waiting for. A regular exit would still run atexit
+      # handlers, finalizers, and the tear down of all module state, and
+      # it would wait for non-daemon threads (e.g., those of executors
+      # used by completers). We skip all of that and terminate right
+      # away, making sure that the output does not get lost. Note that
+      # print flushes whatever sys.stdout currently refers to.
+      try:
+        print(end="", flush=True)
+      except (OSError, ValueError):
+        status = 1
+      _exit(status)
+
+    self.exit(status)
+
+
+  def _compact(self, shared):
+    """Compact the completion tree, sharing objects via the given table."""
+    for parser in self._parsers.values():
+      parser._compact(shared)
+
+    def shareArgument(argument):
+      """Share an Argument object, including a choice completer."""
+      comp = argument.comp
+      if isinstance(comp, partial) and comp.func is completeChoice:
+        # Choices provided as lists create distinct completers that we
+        # only recognize as equal by looking at what they emit.
+        try:
+          key = ("choices", tuple(map(str, comp.keywords["choices"])))
+        except TypeError:
+          pass
+        else:
+          argument = argument._replace(comp=shared.setdefault(key, comp))
+
+      try:
+        return shared.setdefault(argument, argument)
+      except TypeError:
+        # Arguments with an unhashable completer are not shared.
+        return argument
+
+    keywords = self._arguments.keywords
+    parents = ()
+    if isinstance(keywords, ChainMap):
+      # Keywords inherited from parent parsers are shared already.
+      keywords, *parents = keywords.maps
+
+    compacted = {}
+    for word, value in keywords.items():
+      if isinstance(value, Arguments):
+        parser = self._parsers.get(word)
+        if parser is not None:
+          value = parser._arguments
+      else:
+        value = shareArgument(value)
+
+      compacted[intern(word)] = value
+
+    positionals = list(map(shareArgument, self._arguments.positionals))
+
+    # Lists and dicts are not hashable, so we key them by the identities
+    # of their (already shared) contents.
+    key = ("keywords",) + tuple((w, id(v)) for w, v in compacted.items())
+    if parents:
+      key += tuple(map(id, parents))
+      compacted = ChainMap(compacted, *parents)
+
+    keywords = shared.setdefault(key, compacted)
+    key = ("positionals",) + tuple(map(id, positionals))
+    positionals = shared.setdefault(key, positionals)
+    key = ("arguments", id(positionals), id(keywords))
+    self._arguments = shared.setdefault(key, Arguments(positionals, keywords))
+
+
+  def compact(self):
+    """Share identical parts of the completion tree between all sub parsers."""
+    # After compaction different parsers may reference the very same
+    # completion data. Hence, no arguments must be added to any of the
+    # parsers in the tree afterwards.
+    self._compact({})
 
-    if len(completions) > 0:
-      print("\n".join(map(str, completions)))
 
-    self.exit(0 if len(completions) > 0 else 1)
+  def footprint(self):
+    """Report the memory footprint of the parser's completion tree."""
+    return footprint(self._arguments)
 
 
   @property
@@ -0,0 +1,139 @@
+# path.py
+
+#/***************************************************************************
+# *   Copyright (C) 2017 Daniel Mueller (deso@posteo.net)                   *
+# *                                                                         *
+# *   This program is free software: you can redistribute it and/or modify  *
+# *   it under the terms of the GNU General Public License as published by  *
+# *   the Free Software Foundation, either version 3 of the License, or     *
+# *   (at your option) any later version.                                   *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU General Public License for more details.                          *
+# *                                                                         *
+# *   You should have received a copy of the GNU General Public License     *
+# *   along with this program.  If not, see <http://www.gnu.org/licenses/>. *
+# ***************************************************************************/
+
+"""Recursive path completion functionality."""
+
+from concurrent.futures import (
+  ThreadPoolExecutor,
+)
+from deso.argcomp.parser import (
+  completePath,
+  dynamic,
+)
+from fnmatch import (
+  fnmatchcase,
+)
+from os import (
+  curdir,
+  scandir,
+  sep,
+)
+from os.path import (
+  join,
+)
+
+
+RECURSIVE = "**"
+
+
+def _scan(directory):
+  """List the entries of a directory along with some meta data."""
+  entries = []
+  try:
+    with scandir(directory) as it:
+      for entry in it:
+        try:
+          is_dir = entry.is_dir()
+          is_link = entry.is_symlink()
+        except OSError:
+          is_dir = is_link = False
+        entries.append((entry.name, is_dir, is_link))
+  except OSError:
+    pass
+
+  return sorted(entries)
+
+
+def _isExcluded(exclude, relative, name, is_dir):
+  """Check whether an entry is matched by any of the exclusion patterns."""
+  # We support a simplified version of the .gitignore syntax: patterns
+  # with a trailing separator only match directories, patterns
+  # containing a separator elsewhere are matched against the path
+  # relative to the directory to complete in, and all others are
+  # matched against the entry's name.
+  for pattern in exclude:
+    if pattern.endswith(sep):
+      if not is_dir:
+        continue
+      pattern = pattern[:-1]
+
+    if sep in pattern:
+      if fnmatchcase(relative, pattern.lstrip(sep)):
+        return True
+    elif fnmatchcase(name, pattern):
+      return True
+
+  return False
+
+
+def completePathRecursive(parser, values, word, max_depth=8, exclude=(),
+                          limit=1000, max_workers=8):
+  """Attempt completion of a path, recursively if the word contains '**'."""
+  # A word such as 'src/**/conf' completes all paths below 'src/' (up
+  # to 'max_depth' levels deep) whose last component starts with 'conf'.
+  # The pattern may contain separators, in which case it is matched
+  # against the corresponding number of trailing path components.
+  # Directories matching any of the 'exclude' patterns are not entered.
+  # At most 'limit' completions are reported.
+  if RECURSIVE not in word:
+    yield from completePath(parser, values, word)
+    return
+
+  top, pattern = word.split(RECURSIVE, 1)
+  pattern = pattern.lstrip(sep)
+  components = pattern.count(sep) + 1
+
+  count = 0
+  level = [""]
+  executor = ThreadPoolExecutor(max_workers=max_workers)
+  try:
+    for _ in range(max_depth):
+      if not level:
+        break
+
+      # Scan all directories of the current level concurrently but
+      # process the results in a deterministic order.
+      futures = [
+        (relative, executor.submit(_scan, join(top, relative) if top or relative else curdir))
+        for relative in level
+      ]
+      level = []
+
+      for parent, future in futures:
+        for name, is_dir, is_link in future.result():
+          relative = join(parent, name)
+          if _isExcluded(exclude, relative, name, is_dir):
+            continue
+
+          tail = sep.join(relative.split(sep)[-components:])
+          if tail.startswith(pattern):
+            yield join(top, relative) + (sep if is_dir else "")
+            count += 1
+            if count >= limit:
+              return
+
+          # We do not follow symbolic links to directories to prevent
+          # cycles.
+          if is_dir and not is_link:
+            level.append(relative)
+  finally:
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+dynamic(completePathRecursive)
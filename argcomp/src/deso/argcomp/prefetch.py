@@ -0,0 +1,155 @@
+# prefetch.py
+
+#/***************************************************************************
+# *   Copyright (C) 2017 Daniel Mueller (deso@posteo.net)                   *
+# *                                                                         *
+# *   This program is free software: you can redistribute it and/or modify  *
+# *   it under the terms of the GNU General Public License as published by  *
+# *   the Free Software Foundation, either version 3 of the License, or     *
+# *   (at your option) any later version.                                   *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU General Public License for more details.                          *
+# *                                                                         *
+# *   You should have received a copy of the GNU General Public License     *
+# *   along with this program.  If not, see <http://www.gnu.org/licenses/>. *
+# ***************************************************************************/
+
+"""Support for warming the caches of completers likely to be invoked next."""
+
+from concurrent.futures import (
+  ThreadPoolExecutor,
+  wait,
+)
+from deso.argcomp.parser import (
+  Arguments,
+  loadCompleter,
+)
+from functools import (
+  partial,
+)
+from itertools import (
+  chain,
+  islice,
+)
+from threading import (
+  Lock,
+)
+
+
+def warmer(completer):
+  """Retrieve the function warming a completer's caches, if any."""
+  # Completers opt in to being warmed by providing a warm method that
+  # accepts the parser. Completers given by import path are warmed by
+  # importing them (and warming the result).
+  if isinstance(completer, str):
+    def warmImported(parser):
+      """Import a completer and warm it."""
+      warm = warmer(loadCompleter(completer))
+      if warm is not None:
+        warm(parser)
+
+    return warmImported
+
+  while True:
+    warm = getattr(completer, "warm", None)
+    if warm is not None:
+      return warm
+    elif isinstance(completer, partial):
+      completer = completer.func
+    elif hasattr(completer, "__wrapped__"):
+      completer = completer.__wrapped__
+    else:
+      return None
+
+
+def reachable(arguments, completions=()):
+  """Retrieve the completers of arguments reachable from a completion tree node."""
+  # The user is most likely to continue with one of the sub commands
+  # just completed, so we report their completers first.
+  nodes = [arguments.keywords.get(c) for c in completions]
+  nodes = [n for n in nodes if isinstance(n, Arguments)]
+  nodes.append(arguments)
+
+  seen = set()
+  for node in nodes:
+    for value in chain(node.positionals, node.keywords.values()):
+      if isinstance(value, Arguments):
+        continue
+
+      key = value.comp if isinstance(value.comp, str) else id(value.comp)
+      if key not in seen:
+        seen.add(key)
+        yield value.comp
+
+
+class Prefetcher:
+  """A scheduler warming the caches of completers in background threads."""
+  def __init__(self, max_workers=1, max_pending=16):
+    """Create a new prefetcher."""
+    # At most 'max_workers' completers are warmed concurrently and at
+    # most 'max_pending' are scheduled per completion request.
+    self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                        thread_name_prefix="argcomp-prefetch")
+    self._max_pending = max_pending
+    self._lock = Lock()
+    self._futures = []
+    self._generation = 0
+
+
+  def _warm(self, generation, warm, parser):
+    """Warm a completer, unless the request it was scheduled for got superseded."""
+    with self._lock:
+      if generation != self._generation:
+        return
+
+    try:
+      warm(parser)
+    except Exception:
+      # Warming is merely an optimization. Errors will surface once the
+      # completer gets actually invoked.
+      pass
+
+
+  def schedule(self, parser, arguments, completions=()):
+    """Schedule warming the completers reachable from a completion tree node."""
+    warms = filter(None, map(warmer, reachable(arguments, completions)))
+    warms = list(islice(warms, self._max_pending))
+
+    with self._lock:
+      futures = self._futures
+      self._generation += 1
+      generation = self._generation
+      self._futures = [
+        self._executor.submit(self._warm, generation, warm, parser) for warm in warms
+      ]
+
+    for future in futures:
+      future.cancel()
+
+
+  def cancel(self):
+    """Cancel all warming not yet started."""
+    with self._lock:
+      futures = self._futures
+      self._futures = []
+      self._generation += 1
+
+    for future in futures:
+      future.cancel()
+
+
+  def wait(self):
+    """Wait for all scheduled warming to finish."""
+    with self._lock:
+      futures = self._futures
+
+    wait(futures)
+
+
+  def close(self):
+    """Cancel all pending warming and wait for the running one to finish."""
+    self.cancel()
+    self._executor.shutdown()
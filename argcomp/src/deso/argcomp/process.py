@@ -0,0 +1,75 @@
+# process.py
+
+#/***************************************************************************
+# *   Copyright (C) 2017 Daniel Mueller (deso@posteo.net)                   *
+# *                                                                         *
+# *   This program is free software: you can redistribute it and/or modify  *
+# *   it under the terms of the GNU General Public License as published by  *
+# *   the Free Software Foundation, either version 3 of the License, or     *
+# *   (at your option) any later version.                                   *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU General Public License for more details.                          *
+# *                                                                         *
+# *   You should have received a copy of the GNU General Public License     *
+# *   along with this program.  If not, see <http://www.gnu.org/licenses/>. *
+# ***************************************************************************/
+
+"""Support for running completers in worker processes."""
+
+from concurrent.futures import (
+  ProcessPoolExecutor,
+)
+from deso.argcomp.parser import (
+  isNarrowable,
+)
+
+
+def _collect(completer, values, word, *args):
+  """Run a completer and collect all its completions."""
+  # Worker processes have no access to the parser object: it is not
+  # generally picklable (and transferring it would be costly anyway).
+  return list(completer(None, values, word, *args))
+
+
+class ProcessCompleter:
+  """A completer wrapper running a completer in worker processes."""
+  def __init__(self, completer, split=None, max_workers=None):
+    """Create a new process completer wrapping the given completer."""
+    # Both the completer and its arguments get pickled for transfer to
+    # the worker, meaning that the completer has to be a module-level
+    # function. It will receive None instead of the parser. If 'split'
+    # is given, it is invoked as split(values, word) and should return
+    # a list of partitions of the completer's search space. In that
+    # case the completer is run once per partition (as completer(None,
+    # values, word, partition)), distributed across all workers.
+    self._completer = completer
+    self._split = split
+    self._max_workers = max_workers
+    self.narrowable = isNarrowable(completer)
+
+
+  def __call__(self, parser, values, word):
+    """Complete the given word in worker processes."""
+    values = list(values)
+
+    executor = ProcessPoolExecutor(max_workers=self._max_workers)
+    try:
+      if self._split is None:
+        futures = [executor.submit(_collect, self._completer, values, word)]
+      else:
+        futures = [
+          executor.submit(_collect, self._completer, values, word, part)
+          for part in self._split(values, word)
+        ]
+
+      # Yield results as soon as they are available but retain the
+      # order of the partitions.
+      for future in futures:
+        yield from future.result()
+    finally:
+      # The consumer may stop early (e.g., because of a limit), in which
+      # case we must not wait for the remaining partitions.
+      executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,260 @@
+# service.py
+
+#/***************************************************************************
+# *   Copyright (C) 2017 Daniel Mueller (deso@posteo.net)                   *
+# *                                                                         *
+# *   This program is free software: you can redistribute it and/or modify  *
+# *   it under the terms of the GNU General Public License as published by  *
+# *   the Free Software Foundation, either version 3 of the License, or     *
+# *   (at your option) any later version.                                   *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU General Public License for more details.                          *
+# *                                                                         *
+# *   You should have received a copy of the GNU General Public License     *
+# *   along with this program.  If not, see <http://www.gnu.org/licenses/>. *
+# ***************************************************************************/
+
+"""Completion support for querying local HTTP services."""
+
+from deso.argcomp.parser import (
+  completionMetrics,
+  isNarrowable,
+  noCompletion,
+)
+from http.client import (
+  HTTPConnection,
+  HTTPException,
+)
+from socket import (
+  AF_UNIX,
+  SOCK_STREAM,
+  socket,
+)
+from threading import (
+  Lock,
+)
+from time import (
+  monotonic,
+)
+from urllib.parse import (
+  quote,
+)
+
+
+class ResponseError(HTTPException):
+  """An exception indicating that a service responded with an error status."""
+  pass
+
+
+class UnixHTTPConnection(HTTPConnection):
+  """An HTTP connection using a Unix domain socket as transport."""
+  def __init__(self, path, timeout=None):
+    """Create a new connection to the socket at the given path."""
+    super().__init__("localhost", timeout=timeout)
+    self._path = path
+
+
+  def connect(self):
+    """Connect to the Unix domain socket."""
+    sock = socket(AF_UNIX, SOCK_STREAM)
+    try:
+      sock.settimeout(self.timeout)
+      sock.connect(self._path)
+    except OSError:
+      sock.close()
+      raise
+
+    self.sock = sock
+
+
+class ServiceCompleter:
+  """A completer retrieving candidates from a local HTTP service."""
+  def __init__(self, path, host="localhost", port=None, unix_socket=None,
+               timeout=0.5, pool_size=2, ttl=30.0, backoff=5.0,
+               cache_size=128, fallback=noCompletion):
+    """Create a new service completer."""
+    # The resource to query is described by 'path', which may contain a
+    # '{word}' placeholder that gets replaced by the (quoted) word to
+    # complete. Connections are kept alive in a pool and responses are
+    # cached for 'ttl' seconds, so that long-lived processes performing
+    # multiple completions do not contact the service over and over
+    # again. If the service is unavailable we use the 'fallback'
+    # completer instead and do not try again for 'backoff' seconds.
+    # With the word being part of the path each keystroke may result in
+    # a new cache entry, so at most 'cache_size' of them are kept.
+    assert port is None or unix_socket is None
+
+    self._path = path
+    self._host = host
+    self._port = port
+    self._unix_socket = unix_socket
+    self._timeout = timeout
+    self._pool_size = pool_size
+    self._ttl = ttl
+    self._cache_size = cache_size
+    self._backoff = backoff
+    self._fallback = fallback
+    self.narrowable = isNarrowable(fallback)
+
+    self._lock = Lock()
+    self._pool = []
+    self._cache = {}
+    self._failed = None
+
+
+  def _connect(self):
+    """Create a new, not yet connected, connection to the service."""
+    if self._unix_socket is not None:
+      return UnixHTTPConnection(self._unix_socket, timeout=self._timeout)
+    else:
+      return HTTPConnection(self._host, self._port, timeout=self._timeout)
+
+
+  def _acquire(self):
+    """Retrieve a connection, preferably an idle one from the pool."""
+    with self._lock:
+      if self._pool:
+        return self._pool.pop(), True
+
+    return self._connect(), False
+
+
+  def _release(self, connection):
+    """Return a connection to the pool."""
+    with self._lock:
+      if len(self._pool) < self._pool_size:
+        self._pool.append(connection)
+        return
+
+    connection.close()
+
+
+  def _request(self, path):
+    """Perform a GET request for the given path and return the response body."""
+    while True:
+      connection, reused = self._acquire()
+      try:
+        connection.request("GET", path)
+        response = connection.getresponse()
+        body = response.read()
+      except (OSError, HTTPException):
+        connection.close()
+        # A pooled connection may have been closed by the service in the
+        # meantime. In that case we just retry with a fresh one.
+        if reused:
+          continue
+        raise
+
+      if response.will_close:
+        connection.close()
+      else:
+        self._release(connection)
+
+      if not 200 <= response.status < 300:
+        raise ResponseError("unexpected response status %d" % response.status)
+
+      return body
+
+
+  def _store(self, now, path, body):
+    """Cache a response body, evicting entries as necessary."""
+    cache = self._cache
+    # Re-inserting moves the entry to the end, keeping the cache ordered
+    # by time of insertion.
+    cache.pop(path, None)
+    expired = [p for p, (time, _) in cache.items() if now - time >= self._ttl]
+    for expired_path in expired:
+      del cache[expired_path]
+
+    # If that is not enough, we evict the oldest entries.
+    while cache and len(cache) >= self._cache_size:
+      del cache[next(iter(cache))]
+
+    if self._cache_size > 0:
+      cache[path] = (now, body)
+
+
+  def fetch(self, path):
+    """Retrieve the body of the resource at the given path."""
+    now = monotonic()
+    metrics = completionMetrics()
+    with self._lock:
+      if self._failed is not None and now - self._failed < self._backoff:
+        raise ConnectionError("service unavailable")
+
+      cached = self._cache.get(path)
+      if cached is not None:
+        time, body = cached
+        if now - time < self._ttl:
+          if metrics is not None:
+            metrics.recordCache("service", True)
+          return body
+
+    if metrics is not None:
+      metrics.recordCache("service", False)
+
+    try:
+      body = self._request(path)
+    except ResponseError:
+      # An error response (e.g., a 404 for a word the service knows
+      # nothing about) only concerns this very request. The service is
+      # available nevertheless, so we do not back off.
+      with self._lock:
+        self._failed = None
+      raise
+    except (OSError, HTTPException):
+      with self._lock:
+        self._failed = monotonic()
+      raise
+
+    with self._lock:
+      self._failed = None
+      self._store(now, path, body)
+    return body
+
+
+  def query(self, parser, values, word):
+    """Retrieve the path of the resource to query for the given word."""
+    return self._path.format(word=quote(word))
+
+
+  def parse(self, body):
+    """Parse a response body into a list of candidates."""
+    return body.decode().splitlines()
+
+
+  def warm(self, parser):
+    """Retrieve the candidates for an empty word ahead of time."""
+    # Invoked by a Prefetcher in a background thread, when completion of
+    # the argument is likely to be requested next.
+    try:
+      self.fetch(self.query(parser, [], ""))
+    except (OSError, HTTPException):
+      pass
+
+
+  def close(self):
+    """Close all pooled connections and drop all cached responses."""
+    with self._lock:
+      pool = self._pool
+      self._pool = []
+      self._cache = {}
+
+    for connection in pool:
+      connection.close()
+
+
+  def __call__(self, parser, values, word):
+    """Complete the given word with candidates reported by the service."""
+    try:
+      candidates = self.parse(self.fetch(self.query(parser, values, word)))
+    except (OSError, HTTPException):
+      yield from self._fallback(parser, values, word)
+      return
+
+    for candidate in candidates:
+      if candidate.startswith(word):
+        yield candidate
@@ -0,0 +1,116 @@
+# shell.py
+
+#/***************************************************************************
+# *   Copyright (C) 2017 Daniel Mueller (deso@posteo.net)                   *
+# *                                                                         *
+# *   This program is free software: you can redistribute it and/or modify  *
+# *   it under the terms of the GNU General Public License as published by  *
+# *   the Free Software Foundation, either version 3 of the License, or     *
+# *   (at your option) any later version.                                   *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU General Public License for more details.                          *
+# *                                                                         *
+# *   You should have received a copy of the GNU General Public License     *
+# *   along with this program.  If not, see <http://www.gnu.org/licenses/>. *
+# ***************************************************************************/
+
+"""Generation of shell completion scripts."""
+
+from deso.argcomp.parser import (
+  COMPLETE_FD_OPTION,
+  COMPLETE_OPTION,
+  NARROW_VARIABLE,
+  NARROWABLE,
+)
+from os.path import (
+  basename,
+)
+from re import (
+  sub,
+)
+from shlex import (
+  quote,
+)
+
+
+_INVOKE_ARGV = """\
+$(%(variable)s=1 "${1}" %(option)s "${COMP_CWORD}" "${COMP_WORDS[@]}")"""
+
+_INVOKE_FD = """\
+$(printf '%%s\\0' "${COMP_CWORD}" "${COMP_WORDS[@]}" |\\
+                %(variable)s=1 "${1}" %(option)s 0)"""
+
+_BASH = """\
+%(function)s()
+{
+  local cur=${COMP_WORDS[COMP_CWORD]}
+  local key
+  printf -v key '%%s\\x1f' "${PWD}" "${HISTCMD}" "${COMP_WORDS[@]:0:COMP_CWORD}"
+
+  # If the word to complete extends the one we completed last time (with
+  # the same preceding words, in the same directory, and on the same
+  # command line) and the completions were reported as narrowable, we
+  # can just filter the previous completions. They expire nevertheless,
+  # as a command line may be edited for a long time.
+  if [[ -n ${%(cache)s_key+x} && ${key} == "${%(cache)s_key}" &&\\
+        ${cur} == "${%(cache)s_prefix}"* &&\\
+        $((SECONDS - %(cache)s_time)) -lt %(ttl)d ]]; then
+    local candidate
+    COMPREPLY=()
+    for candidate in "${%(cache)s_candidates[@]}"; do
+      if [[ ${candidate} == "${cur}"* ]]; then
+        COMPREPLY+=("${candidate}")
+      fi
+    done
+    return
+  fi
+
+  unset %(cache)s_key
+  local completions
+  completions=%(invoke)s
+  local status=$?
+  local lines
+  readarray -t lines < <(echo -n "${completions}")
+
+  if [ "${lines[0]}" = %(narrowable)s ]; then
+    %(cache)s_key=${key}
+    %(cache)s_time=${SECONDS}
+    %(cache)s_prefix=${cur}
+    %(cache)s_candidates=("${lines[@]:1}")
+  fi
+
+  if [ ${status} -eq 0 ]; then
+    COMPREPLY=("${lines[@]:1}")
+  fi
+}
+
+complete -F %(function)s %(program)s
+"""
+
+
+def bashCompletion(program, fd=False, ttl=10):
+  """Generate a bash completion script for the given program."""
+  # The script caches completions reported as narrowable and, for as
+  # long as the word to complete only gets extended, filters them
+  # instead of invoking the program again. Cached completions are used
+  # for at most 'ttl' seconds. If 'fd' is true, the words are passed to
+  # the program through stdin instead of as arguments.
+  name = sub(r"[^A-Za-z0-9_]", "_", basename(program))
+  function = "_argcomp_%s" % name
+
+  if fd:
+    invoke = _INVOKE_FD % {"variable": NARROW_VARIABLE, "option": COMPLETE_FD_OPTION}
+  else:
+    invoke = _INVOKE_ARGV % {"variable": NARROW_VARIABLE, "option": COMPLETE_OPTION}
+
+  return _BASH % {
+    "function": function,
+    "cache": "%s_cache" % function,
+    "invoke": invoke,
+    "narrowable": NARROWABLE,
+    "program": quote(program),
+    "ttl": ttl,
+  }
@@ -0,0 +1,219 @@
+# snapshot.py
+
+#/***************************************************************************
+# *   Copyright (C) 2017 Daniel Mueller (deso@posteo.net)                   *
+# *                                                                         *
+# *   This program is free software: you can redistribute it and/or modify  *
+# *   it under the terms of the GNU General Public License as published by  *
+# *   the Free Software Foundation, either version 3 of the License, or     *
+# *   (at your option) any later version.                                   *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU General Public License for more details.                          *
+# *                                                                         *
+# *   You should have received a copy of the GNU General Public License     *
+# *   along with this program.  If not, see <http://www.gnu.org/licenses/>. *
+# ***************************************************************************/
+
+"""Snapshot support for completing without building a parser."""
+
+from deso.argcomp.file import (
+  replacing,
+)
+from deso.argcomp.parser import (
+  Argument,
+  Arguments,
+  COMPLETE_FD_OPTION,
+  COMPLETE_OPTION,
+  completeChoice,
+  completeWords,
+  completionRequested,
+  completionWords,
+  importCompleter,
+  noCompletion,
+  ParserError,
+  printCompletions,
+  readWords,
+)
+from functools import (
+  partial,
+)
+from hashlib import (
+  sha256,
+)
+from json import (
+  dumps,
+  loads,
+)
+from os import (
+  stat,
+)
+from sys import (
+  argv,
+  exit as exit_,
+)
+
+
+# The version of the snapshot format. It is part of the fingerprint.
+VERSION = 2
+
+
+def completerName(completer):
+  """Retrieve the import path, in the form 'module:function', of a completer."""
+  module = getattr(completer, "__module__", None)
+  qualname = getattr(completer, "__qualname__", None)
+
+  if module is None or qualname is None or "<locals>" in qualname:
+    raise ValueError("Completer %r cannot be referenced by import path." % completer)
+
+  return "%s:%s" % (module, qualname)
+
+
+def fingerprint(inputs):
+  """Create a fingerprint of a set of input files."""
+  # We fingerprint files based on their meta data only. Reading them
+  # would defeat the purpose of avoiding work.
+  hash_ = sha256(b"%d" % VERSION)
+  for input_ in inputs:
+    try:
+      status = stat(input_)
+      data = "%s\0%d\0%d\0" % (input_, status.st_mtime_ns, status.st_size)
+    except FileNotFoundError:
+      data = "%s\0\0" % input_
+    hash_.update(data.encode())
+
+  return hash_.hexdigest()
+
+
+def _encodeCompleter(completer):
+  """Encode a completer in a form suitable for serialization."""
+  if completer is noCompletion:
+    return None
+  elif isinstance(completer, str):
+    # Completers given by import path stay that way.
+    return completer
+  elif isinstance(completer, partial):
+    if completer.func is completeChoice:
+      return {"choices": list(map(str, completer.keywords["choices"]))}
+
+    return {
+      "function": completerName(completer.func),
+      "args": list(completer.args),
+      "keywords": completer.keywords,
+    }
+  else:
+    name = completerName(completer)
+    # Make sure that we will find the very same completer again.
+    if importCompleter(name) is not completer:
+      raise ValueError("Completer %r cannot be referenced by import path." % completer)
+
+    return name
+
+
+def _decodeCompleter(data):
+  """Decode a completer as encoded by _encodeCompleter."""
+  if data is None:
+    return noCompletion
+  elif isinstance(data, str):
+    # The completer is only imported once it is actually needed.
+    return data
+  elif "choices" in data:
+    return partial(completeChoice, choices=data["choices"])
+  else:
+    function = importCompleter(data["function"])
+    return partial(function, *data["args"], **data["keywords"])
+
+
+def _encode(arguments):
+  """Encode a completion tree in a form suitable for serialization."""
+  def encodeValue(value):
+    """Encode an Argument or Arguments object."""
+    if isinstance(value, Arguments):
+      return _encode(value)
+    else:
+      return [value.min_, value.max_, _encodeCompleter(value.comp)]
+
+  return {
+    "positionals": list(map(encodeValue, arguments.positionals)),
+    "keywords": {k: encodeValue(v) for k, v in arguments.keywords.items()},
+  }
+
+
+def _decode(data):
+  """Decode a completion tree as encoded by _encode."""
+  def decodeValue(value):
+    """Decode an Argument or Arguments object."""
+    if isinstance(value, dict):
+      return _decode(value)
+    else:
+      min_, max_, comp = value
+      return Argument(min_, max_, _decodeCompleter(comp))
+
+  positionals = list(map(decodeValue, data["positionals"]))
+  keywords = {k: decodeValue(v) for k, v in data["keywords"].items()}
+  return Arguments(positionals, keywords)
+
+
+def saveSnapshot(parser, path, inputs, args=None, force=False):
+  """Save a snapshot of a parser's completion state."""
+  # Unless forced, we only save a snapshot if completion was requested,
+  # because that means that completeFromSnapshot could not use the
+  # existing snapshot.
+  if args is None:
+    args = argv[1:]
+
+  if not force and not completionRequested(args):
+    return
+
+  data = {
+    "fingerprint": fingerprint(inputs),
+    "arguments": _encode(parser.arguments),
+    "fromfile_prefix_chars": parser.fromfile_prefix_chars,
+  }
+  with replacing(path) as f:
+    f.write(dumps(data).encode())
+
+
+def completeFromSnapshot(path, inputs, args=None):
+  """Perform a completion based on a snapshot, if requested and possible."""
+  # This function is meant to be invoked before the program creates its
+  # parser. If it returns, either no completion was requested or the
+  # snapshot does not exist or is out of date.
+  if args is None:
+    args = argv[1:]
+
+  if not completionRequested(args):
+    return
+
+  try:
+    with open(path, "rb") as f:
+      data = loads(f.read().decode())
+  except (OSError, ValueError):
+    return
+
+  if data.get("fingerprint") != fingerprint(inputs):
+    return
+
+  try:
+    arguments = _decode(data["arguments"])
+    chars = data["fromfile_prefix_chars"]
+  except (ImportError, AttributeError, KeyError, TypeError, ValueError):
+    return
+
+  # Note that we must only read words from a file descriptor once we are
+  # sure to perform the completion, because we cannot put them back.
+  if COMPLETE_OPTION in args:
+    words = completionWords(args[args.index(COMPLETE_OPTION) + 1:])
+  else:
+    words = completionWords(readWords(int(args[args.index(COMPLETE_FD_OPTION) + 1])))
+
+  # Without a parser, completers get passed in None instead.
+  try:
+    completions, narrowable, _ = completeWords(None, words, arguments, chars)
+  except ParserError:
+    exit_(1)
+
+  printCompletions(completions, narrowable)
+  exit_(0 if len(completions) > 0 else 1)
@@ -0,0 +1,221 @@
+# system.py
+
+#/***************************************************************************
+# *   Copyright (C) 2017 Daniel Mueller (deso@posteo.net)                   *
+# *                                                                         *
+# *   This program is free software: you can redistribute it and/or modify  *
+# *   it under the terms of the GNU General Public License as published by  *
+# *   the Free Software Foundation, either version 3 of the License, or     *
+# *   (at your option) any later version.                                   *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU General Public License for more details.                          *
+# *                                                                         *
+# *   You should have received a copy of the GNU General Public License     *
+# *   along with this program.  If not, see <http://www.gnu.org/licenses/>. *
+# ***************************************************************************/
+
+"""Completion support for processes, users, and other system resources."""
+
+from bisect import (
+  bisect_left,
+)
+from deso.argcomp.file import (
+  parseCached,
+)
+from deso.argcomp.parser import (
+  dynamic,
+)
+from os import (
+  fsdecode,
+  scandir,
+)
+from os.path import (
+  expanduser,
+  join,
+)
+
+
+PROC = "/proc"
+PASSWD = "/etc/passwd"
+GROUP = "/etc/group"
+NET = "/sys/class/net"
+SSH_CONFIG = "~/.ssh/config"
+KNOWN_HOSTS = "~/.ssh/known_hosts"
+
+# Process names, keyed by PID, along with the inode and change time of
+# the process' directory they were read for.
+_NAMES = {}
+
+
+def _prefixed(names, word):
+  """Retrieve all names in a sorted list that start with the given word."""
+  for i in range(bisect_left(names, word), len(names)):
+    if not names[i].startswith(word):
+      break
+    yield names[i]
+
+
+def _processes(word=""):
+  """Retrieve the /proc entries of all processes whose ID starts with a given word."""
+  try:
+    with scandir(PROC) as it:
+      # We check the prefix first, as it is the cheaper test.
+      return [e for e in it if e.name.startswith(word) and e.name.isdigit()]
+  except OSError:
+    return []
+
+
+def completePid(parser, values, word):
+  """Complete the ID of a running process."""
+  pids = [entry.name for entry in _processes(word)]
+  yield from sorted(pids, key=int)
+
+
+# Processes come and go, so completions may change at any time.
+dynamic(completePid)
+
+
+def _readName(path):
+  """Read the name of a process from its comm file."""
+  try:
+    with open(path, "rb") as f:
+      return fsdecode(f.read().rstrip(b"\n"))
+  except OSError:
+    # The process may have exited in the meantime.
+    return None
+
+
+def completeProcessName(parser, values, word):
+  """Complete the name of a running process."""
+  # Reading a process' name requires opening a file, which is more
+  # expensive than retrieving the meta data of its directory. The
+  # latter only changes when the PID gets reused, so we use it for
+  # validating cached names.
+  names = set()
+  cache = {}
+  for entry in _processes():
+    try:
+      stat_ = entry.stat()
+    except OSError:
+      continue
+
+    key = (stat_.st_ino, stat_.st_ctime_ns)
+    cached = _NAMES.get(entry.name)
+    if cached is not None and cached[0] == key:
+      name = cached[1]
+    else:
+      name = _readName(join(entry.path, "comm"))
+      if name is None:
+        continue
+
+    cache[entry.name] = (key, name)
+    if name.startswith(word):
+      names.add(name)
+
+  # Only keep the names of processes still running.
+  _NAMES.clear()
+  _NAMES.update(cache)
+  yield from sorted(names)
+
+
+dynamic(completeProcessName)
+
+
+def _parseDatabase(f):
+  """Parse a colon separated database such as /etc/passwd for its names."""
+  names = set()
+  for line in f:
+    if line.startswith(b"#"):
+      continue
+
+    name, _, _ = line.partition(b":")
+    name = name.strip()
+    if name:
+      names.add(fsdecode(name))
+
+  return sorted(names)
+
+
+def completeUser(parser, values, word):
+  """Complete the name of a user."""
+  yield from _prefixed(parseCached(PASSWD, _parseDatabase) or [], word)
+
+
+def completeGroup(parser, values, word):
+  """Complete the name of a group."""
+  yield from _prefixed(parseCached(GROUP, _parseDatabase) or [], word)
+
+
+def completeInterface(parser, values, word):
+  """Complete the name of a network interface."""
+  try:
+    with scandir(NET) as it:
+      interfaces = [entry.name for entry in it if entry.name.startswith(word)]
+  except OSError:
+    return
+
+  yield from sorted(interfaces)
+
+
+def _isPattern(host):
+  """Check whether a host name is actually a pattern."""
+  return any(c in host for c in "*?!")
+
+
+def _parseSshConfig(f):
+  """Parse an ssh configuration file for host names."""
+  hosts = set()
+  for line in f:
+    line = fsdecode(line).strip()
+    if not line or line.startswith("#"):
+      continue
+
+    # Keywords and arguments are separated by white space or an equal
+    # sign.
+    keyword, _, arguments = line.replace("=", " ", 1).partition(" ")
+    if keyword.lower() == "host":
+      hosts.update(h for h in arguments.split() if not _isPattern(h))
+
+  return sorted(hosts)
+
+
+def _parseKnownHosts(f):
+  """Parse an ssh known_hosts file for host names."""
+  hosts = set()
+  for line in f:
+    fields = fsdecode(line).split()
+    if not fields or fields[0].startswith("#"):
+      continue
+
+    # Skip a marker such as @cert-authority.
+    if fields[0].startswith("@"):
+      fields = fields[1:]
+
+    # Hashed host names cannot be completed.
+    if not fields or fields[0].startswith("|"):
+      continue
+
+    for host in fields[0].split(","):
+      # Hosts with a non-standard port are written as [host]:port.
+      if host.startswith("["):
+        host, _, _ = host[1:].partition("]")
+      if host and not _isPattern(host):
+        hosts.add(host)
+
+  return sorted(hosts)
+
+
+def completeSshHost(parser, values, word):
+  """Complete the name of a host known to ssh."""
+  # A user name may precede the host.
+  user, at, host = word.rpartition("@")
+  hosts = set()
+  hosts.update(parseCached(expanduser(SSH_CONFIG), _parseSshConfig) or [])
+  hosts.update(parseCached(expanduser(KNOWN_HOSTS), _parseKnownHosts) or [])
+
+  for candidate in sorted(hosts):
+    if candidate.startswith(host):
+      yield user + at + candidate
@@ -33,7 +33,19 @@ def allTests():
   # Explicitly load all tests by name and not using a single discovery
   # to be able to easily deselect parts.
   tests = [
+    "testCache.py",
     "testCompletingArgumentParser.py",
+    "testGit.py",
+    "testIndex.py",
+    "testMetrics.py",
+    "testPath.py",
+    "testPerformance.py",
+    "testPrefetch.py",
+    "testProcess.py",
+    "testService.py",
+    "testShell.py",
+    "testSnapshot.py",
+    "testSystem.py",
   ]
 
   loader = TestLoader()
@@ -0,0 +1,147 @@
+# testCache.py
+
+#/***************************************************************************
+# *   Copyright (C) 2017 Daniel Mueller (deso@posteo.net)                   *
+# *                                                                         *
+# *   This program is free software: you can redistribute it and/or modify  *
+# *   it under the terms of the GNU General Public License as published by  *
+# *   the Free Software Foundation, either version 3 of the License, or     *
+# *   (at your option) any later version.                                   *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU General Public License for more details.                          *
+# *                                                                         *
+# *   You should have received a copy of the GNU General Public License     *
+# *   along with this program.  If not, see <http://www.gnu.org/licenses/>. *
+# ***************************************************************************/
+
+"""Tests for the caching functionality."""
+
+from deso.argcomp import (
+  dynamic,
+  NegativeCache,
+)
+from os.path import (
+  join,
+)
+from tempfile import (
+  TemporaryDirectory,
+)
+from unittest import (
+  TestCase,
+  main,
+)
+from unittest.mock import (
+  patch,
+)
+
+
+CALLS = []
+
+
+def completeFruit(parser, values, word):
+  """Complete a fruit, recording the invocation."""
+  CALLS.append(word)
+  for fruit in ("apple", "apricot", "banana"):
+    if fruit.startswith(word):
+      yield fruit
+
+
+@dynamic
+def completeLogin(parser, values, word):
+  """Complete a login, only offering hosts once a user was given."""
+  CALLS.append(word)
+  user, at, host = word.partition("@")
+  if user == "root":
+    for host_ in ("alpha", "beta"):
+      if at and host_.startswith(host):
+        yield "root@" + host_
+
+
+class TestNegativeCache(TestCase):
+  """Tests for the NegativeCache class."""
+  def setUp(self):
+    """Set up a cache."""
+    self._dir = TemporaryDirectory()
+    self.addCleanup(self._dir.cleanup)
+    self.path = join(self._dir.name, "cache")
+    del CALLS[:]
+
+
+  def complete(self, cache, values):
+    """Complete the last of the given values."""
+    completer = cache.wrap(completeFruit)
+    return list(completer(None, values, values[-1]))
+
+
+  def testShortCircuit(self):
+    """Verify that longer prefixes of cached empty results short-circuit."""
+    cache = NegativeCache(self.path)
+    self.assertEqual(self.complete(cache, ["x"]), [])
+    self.assertEqual(self.complete(cache, ["xy"]), [])
+    self.assertEqual(self.complete(cache, ["xyz"]), [])
+    self.assertEqual(CALLS, ["x"])
+
+    # Results that are not empty are not cached.
+    self.assertEqual(self.complete(cache, ["ap"]), ["apple", "apricot"])
+    self.assertEqual(self.complete(cache, ["ap"]), ["apple", "apricot"])
+    self.assertEqual(self.complete(cache, ["b"]), ["banana"])
+    self.assertEqual(CALLS, ["x", "ap", "ap", "b"])
+
+
+  def testContext(self):
+    """Verify that cached results depend on the preceding words."""
+    cache = NegativeCache(self.path)
+    self.assertEqual(self.complete(cache, ["--foo", "c"]), [])
+    self.assertEqual(self.complete(cache, ["--bar", "c"]), [])
+    self.assertEqual(self.complete(cache, ["--foo", "ch"]), [])
+    self.assertEqual(CALLS, ["c", "c"])
+
+
+  def testPersistence(self):
+    """Verify that the cache is shared between instances."""
+    self.assertEqual(self.complete(NegativeCache(self.path), ["x"]), [])
+    self.assertEqual(self.complete(NegativeCache(self.path), ["xy"]), [])
+    self.assertEqual(CALLS, ["x"])
+
+
+  def testExpiration(self):
+    """Verify that cache entries expire."""
+    with patch("deso.argcomp.cache.time", return_value=1000.0):
+      self.assertEqual(self.complete(NegativeCache(self.path, ttl=10), ["x"]), [])
+
+    with patch("deso.argcomp.cache.time", return_value=1009.0):
+      self.assertEqual(self.complete(NegativeCache(self.path, ttl=10), ["xy"]), [])
+      self.assertEqual(CALLS, ["x"])
+
+    with patch("deso.argcomp.cache.time", return_value=1010.0):
+      self.assertEqual(self.complete(NegativeCache(self.path, ttl=10), ["xy"]), [])
+      self.assertEqual(CALLS, ["x", "xy"])
+
+
+  def testNotNarrowable(self):
+    """Verify that empty results of non-narrowable completers do not short-circuit."""
+    cache = NegativeCache(self.path)
+    completer = cache.wrap(completeLogin)
+    self.assertFalse(completer.narrowable)
+    self.assertEqual(list(completer(None, ["root"], "root")), [])
+    self.assertEqual(list(completer(None, ["root@"], "root@")), ["root@alpha", "root@beta"])
+    self.assertEqual(list(completer(None, ["root"], "root")), [])
+    self.assertEqual(CALLS, ["root", "root@"])
+
+
+  def testExplicitName(self):
+    """Verify that anonymous completers require an explicit name."""
+    cache = NegativeCache(self.path)
+    with self.assertRaises(ValueError):
+      cache.wrap(lambda parser, values, word: [])
+
+    completer = cache.wrap(lambda parser, values, word: [], name="anonymous")
+    self.assertEqual(list(completer(None, ["a"], "a")), [])
+    self.assertTrue(cache.lookup("anonymous", "ab"))
+
+
+if __name__ == "__main__":
+  main()
@@ -21,19 +21,39 @@
 
 from argparse import (
   Action,
+  ArgumentParser,
   FileType,
 )
+from concurrent.futures import (
+  ThreadPoolExecutor,
+)
 from contextlib import (
   contextmanager,
 )
+from dataclasses import (
+  dataclass,
+)
 from deso.argcomp import (
   completePath,
   CompletingArgumentParser,
+  completionContext,
+  filterCompleter,
+  limitCompleter,
+  mapCompleter,
+  mergeCompleter,
+  noCompletion,
+  unionCompleter,
 )
 from deso.argcomp.parser import (
+  Arguments,
   decodeAction,
   decodeNargs,
+  dynamic,
   escapeDoubleDash,
+  importCompleter,
+  isNarrowable,
+  readWords,
+  resolve,
   unescapeDoubleDash,
 )
 from io import (
@@ -41,24 +61,41 @@ from io import (
 )
 from os import (
   chdir,
+  close,
+  environ,
   getcwd,
   listdir,
+  pipe,
   sep,
+  write,
 )
 from os.path import (
+  abspath,
   basename,
+  dirname,
+  exists,
   join,
   relpath,
 )
 from sys import (
   argv as sysargv,
   executable,
+  getswitchinterval,
   maxsize,
+  modules,
+  path as syspath,
+  setswitchinterval,
+)
+from subprocess import (
+  run,
 )
 from tempfile import (
   NamedTemporaryFile,
   TemporaryDirectory,
 )
+from threading import (
+  Barrier,
+)
 from unittest import (
   TestCase,
   main,
@@ -67,6 +104,30 @@ from unittest.mock import (
   patch,
 )
 
+FAST_EXIT_PROGRAM = """\
+from atexit import register
+from concurrent.futures import ThreadPoolExecutor
+from deso.argcomp import CompletingArgumentParser
+from sys import argv
+from threading import Event
+
+executor = ThreadPoolExecutor(max_workers=1)
+
+@register
+def touch():
+  open(argv[1], "w").close()
+
+def completeHost(parser, values, word):
+  # A regular exit would wait for this work forever.
+  executor.submit(Event().wait)
+  return [h for h in ("alpha", "beta", "gamma") if h.startswith(word)]
+
+parser = CompletingArgumentParser(prog="sample", add_help=False,
+                                  fast_exit=True)
+parser.add_argument("host", completer=completeHost)
+parser.parse_args(argv[2:])
+"""
+
 
 class TestMisc(TestCase):
   """Tests for miscellaneous functionality accompanying the argument parser."""
@@ -91,6 +152,24 @@ class TestMisc(TestCase):
     self.assertEqual(list(transformed), args)
 
 
+  def testReadWords(self):
+    """Verify that NUL separated words can be read from a file descriptor."""
+    def read(data):
+      """Read words from a pipe filled with the given data."""
+      read_fd, write_fd = pipe()
+      try:
+        write(write_fd, data)
+        close(write_fd)
+        return readWords(read_fd)
+      finally:
+        close(read_fd)
+
+    self.assertEqual(read(b"1\0foo\0--\0"), ["1", "foo", "--"])
+    self.assertEqual(read(b"1\0foo\0"), ["1", "foo"])
+    self.assertEqual(read(b"1\0foo\0\0"), ["1", "foo", ""])
+    self.assertEqual(read(b"1\0\\--"), ["1", r"\--"])
+
+
   def testDecodeNargs(self):
     """Check that the decodeNargs() function works as expected."""
     min_, max_ = decodeNargs("*")
@@ -179,6 +258,86 @@ class TestCompleters(TestCase):
       self.assertEqual(self.complete(join(dir_, "file4")), {join(dir_, "file4")})
 
 
+class TestCombinators(TestCase):
+  """Test cases for the completer combinators."""
+  @staticmethod
+  def completer(*candidates, consumed=None):
+    """Create a completer for the given candidates, optionally recording consumption."""
+    def completeCandidates(parser, values, word):
+      """Complete a word from the candidates."""
+      for candidate in candidates:
+        if candidate.startswith(word):
+          if consumed is not None:
+            consumed.append(candidate)
+          yield candidate
+
+    return completeCandidates
+
+
+  def testUnion(self):
+    """Verify that the union combinator removes duplicates."""
+    completer = unionCompleter(
+      self.completer("a1", "b1", "a2"),
+      noCompletion,
+      self.completer("a2", "a3", "a1"),
+    )
+    self.assertEqual(list(completer(None, [], "a")), ["a1", "a2", "a3"])
+    self.assertEqual(list(completer(None, [], "")), ["a1", "b1", "a2", "a3"])
+
+
+  def testMerge(self):
+    """Verify that the merge combinator merges sorted inputs."""
+    completer = mergeCompleter(
+      self.completer("a", "c", "e", "f"),
+      self.completer("b", "c", "d"),
+      self.completer("a", "f", "g"),
+    )
+    self.assertEqual(list(completer(None, [], "")), ["a", "b", "c", "d", "e", "f", "g"])
+
+
+  def testFilterAndMap(self):
+    """Verify that the filter and map combinators work."""
+    completer = mapCompleter(
+      str.upper,
+      filterCompleter(lambda x: x.endswith("1"), self.completer("a1", "a2", "b1")),
+    )
+    self.assertEqual(list(completer(None, [], "")), ["A1", "B1"])
+
+
+  def testLimit(self):
+    """Verify that the limit combinator stops consumption early."""
+    consumed = []
+    completer = limitCompleter(3, unionCompleter(
+      self.completer("a", "b", "c", consumed=consumed),
+      self.completer("d", "e", consumed=consumed),
+    ))
+    self.assertEqual(list(completer(None, [], "")), ["a", "b", "c"])
+    self.assertEqual(consumed, ["a", "b", "c"])
+
+    del consumed[:]
+    completer = limitCompleter(2, mergeCompleter(
+      self.completer("a", "c", "e", consumed=consumed),
+      self.completer("b", "d", consumed=consumed),
+    ))
+    self.assertEqual(list(completer(None, [], "")), ["a", "b"])
+    self.assertLessEqual(len(consumed), 4)
+
+
+  def testNarrowable(self):
+    """Verify that combinators correctly report whether they are narrowable."""
+    narrowable = self.completer("a")
+    self.assertTrue(isNarrowable(narrowable))
+    self.assertFalse(isNarrowable(completePath))
+    self.assertFalse(isNarrowable(dynamic(self.completer("b"))))
+
+    self.assertTrue(isNarrowable(unionCompleter(narrowable, noCompletion)))
+    self.assertFalse(isNarrowable(unionCompleter(narrowable, completePath)))
+    self.assertTrue(isNarrowable(mergeCompleter(narrowable, narrowable)))
+    self.assertTrue(isNarrowable(filterCompleter(bool, narrowable)))
+    self.assertFalse(isNarrowable(mapCompleter(str.upper, narrowable)))
+    self.assertFalse(isNarrowable(limitCompleter(1, narrowable)))
+
+
 class TestCompletingArgumentParser(TestCase):
   """Test cases for the CompletingArgumentParser class."""
   def testNoArgumentInNamespace(self):
@@ -204,6 +363,67 @@ class TestCompletingArgumentParser(TestCase):
     self.assertEqual(remainder, [])
 
 
+  def testConcurrentParsing(self):
+    """Verify that a single parser can be used from multiple threads."""
+    self.checkConcurrentParsing(False, 2000)
+
+
+  def testConcurrentParsingInReleaseMode(self):
+    """Verify that a single parser in release mode can be used from multiple threads."""
+    # The state is released by the first parses only, so we need many
+    # parsers to provoke a race.
+    for _ in range(100):
+      self.checkConcurrentParsing(True, 64)
+
+
+  def checkConcurrentParsing(self, release, count, workers=16):
+    """Parse arguments using a single parser from multiple threads."""
+    # In release mode the completion state only gets built (and
+    # released again by the first parse) if completion was requested.
+    with patch("deso.argcomp.parser.argv", ["concurrent", "--_complete", "1"]):
+      parser = CompletingArgumentParser(prog="concurrent", release=release)
+      parser.add_argument("--count", type=int)
+      subparsers = parser.add_subparsers(dest="command")
+      run = subparsers.add_parser("run")
+      run.add_argument("args", nargs="*")
+
+    # The first parses all start at the same time.
+    barrier = Barrier(workers)
+
+    def parse(i):
+      """Parse a set of arguments specific to the given index."""
+      if i < workers:
+        barrier.wait()
+
+      args = ["--count", str(i), "run", "--", "-%d" % i]
+      if i % 2:
+        namespace = parser.parse_args(args)
+      else:
+        namespace, remainder = parser.parse_known_args(args)
+        self.assertEqual(remainder, [])
+      return i, namespace
+
+    # Switch between threads as often as possible to provoke
+    # interleaving of the individual parse operations.
+    interval = getswitchinterval()
+    setswitchinterval(1e-6)
+    try:
+      with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(parse, range(count)))
+    finally:
+      setswitchinterval(interval)
+
+    for i, namespace in results:
+      self.assertEqual(namespace.count, i)
+      self.assertEqual(namespace.command, "run")
+      self.assertEqual(namespace.args, ["-%d" % i])
+
+    if release:
+      self.assertEqual(parser.arguments, Arguments())
+      self.assertNotIn("--_complete", parser._option_string_actions)
+      self.assertNotIn("--_complete", run._option_string_actions)
+
+
   def performCompletion(self, parser, to_complete, expected,
                         exit_code=0, known_only=False):
     """Attempt a completion and compare the result against the expectation."""
@@ -231,6 +451,41 @@ class TestCompletingArgumentParser(TestCase):
       self.assertEqual(e.exception.code, exit_code)
 
 
+  def performFdCompletion(self, parser, to_complete, expected, exit_code=0):
+    """Attempt a completion reading the words from a file descriptor."""
+    words = ["%d" % len(to_complete), sysargv[0]] + to_complete
+    data = b"".join(map(lambda x: x.encode() + b"\0", words))
+
+    read_fd, write_fd = pipe()
+    try:
+      write(write_fd, data)
+      close(write_fd)
+
+      with patch("sys.stdout", new_callable=StringIO) as mock_stdout:
+        with self.assertRaises(SystemExit) as e:
+          parser.parse_args(["--_complete-fd", "%d" % read_fd])
+
+        completions = set(mock_stdout.getvalue().splitlines())
+        self.assertSetEqual(completions, expected)
+        self.assertEqual(e.exception.code, exit_code)
+    finally:
+      close(read_fd)
+
+
+  def testCompleteFromFd(self):
+    """Verify that completion words can be passed in through a file descriptor."""
+    parser = CompletingArgumentParser(prog="fd", add_help=False)
+    parser.add_argument("-b", "--bar", action="store_true")
+    parser.add_argument("--baz", choices=("--", r"\--", "foo"))
+
+    self.performFdCompletion(parser, ["-"], {"-b", "--bar", "--baz"})
+    self.performFdCompletion(parser, ["--"], {"--bar", "--baz"})
+    self.performFdCompletion(parser, ["-b", "--b"], {"--bar", "--baz"})
+    self.performFdCompletion(parser, ["--baz", ""], {"--", r"\--", "foo"})
+    self.performFdCompletion(parser, ["--baz", "\\"], {r"\--"})
+    self.performFdCompletion(parser, ["--foo"], set(), exit_code=1)
+
+
   def testSimpleKeywordArguments(self):
     """Verify that simple keyword arguments can be completed properly."""
     def doTest(known_only=False):
@@ -516,6 +771,44 @@ class TestCompletingArgumentParser(TestCase):
     doTest(parser, [])
 
 
+  def testCompleterByImportPath(self):
+    """Verify that completers given by import path are imported on demand."""
+    module = "argcomp_lazy_completer"
+    with TemporaryDirectory() as directory:
+      with open(join(directory, module + ".py"), "w") as f:
+        f.write(
+          "from deso.argcomp.parser import dynamic\n"
+          "@dynamic\n"
+          "def complete(parser, values, word):\n"
+          "  yield from (x for x in ('cloud', 'clown') if x.startswith(word))\n"
+        )
+
+      syspath.insert(0, directory)
+      self.addCleanup(syspath.remove, directory)
+      self.addCleanup(modules.pop, module, None)
+
+      parser = CompletingArgumentParser(prog="lazy")
+      parser.add_argument("--where", completer="%s:complete" % module)
+      parser.add_argument("--other", choices=("a", "b"))
+
+      self.assertEqual(vars(parser.parse_args(["--where", "x"])),
+                       {"where": "x", "other": None})
+      self.performCompletion(parser, ["--other", ""], {"a", "b"})
+      self.assertNotIn(module, modules)
+
+      with patch("deso.argcomp.parser.importCompleter",
+                 wraps=importCompleter) as import_:
+        self.performCompletion(parser, ["--where", "cl"], {"cloud", "clown"})
+        self.assertIn(module, modules)
+        self.performCompletion(parser, ["--where", "clou"], {"cloud"})
+        self.assertEqual(import_.call_count, 1)
+
+      # Attributes of the completer are honored once it is imported.
+      context = resolve(parser, ["--where", "c"], parser.arguments,
+                        ["--where", "c"])
+      self.assertFalse(context.narrowable)
+
+
   def testCompleteKeywordWithCompleter(self):
     """Verify that the 'completer' argument works as expected for keyword arguments."""
     def completeKeyword(parser, values, word):
@@ -532,6 +825,342 @@ class TestCompletingArgumentParser(TestCase):
     self.performCompletion(parser, ["-h", "--keyword", "r"], {"rock"})
 
 
+  def testArgumentFiles(self):
+    """Verify that arguments can be read from files."""
+    def createParser(class_):
+      """Create a parser reading arguments from files."""
+      parser = class_(prog="files", add_help=False, fromfile_prefix_chars="@")
+      parser.add_argument("--mode", choices=("fast", "slow"))
+      parser.add_argument("--verbose", action="store_true")
+      parser.add_argument("paths", nargs="*")
+      return parser
+
+    with TemporaryDirectory() as dir_:
+      nested = join(dir_, "nested.args")
+      with open(nested, "w") as f:
+        f.write("c\n")
+
+      args = join(dir_, "paths.args")
+      with open(args, "w") as f:
+        f.write("--mode\nslow\n--verbose\na\n@%s\nb" % nested)
+
+      plain = createParser(ArgumentParser)
+      parser = createParser(CompletingArgumentParser)
+      for words in (["@" + args], ["--mode", "fast", "@" + args, "d"]):
+        self.assertEqual(parser.parse_args(words), plain.parse_args(words))
+
+      namespace = parser.parse_args(["@" + args])
+      self.assertEqual(namespace.mode, "slow")
+      self.assertEqual(namespace.paths, ["a", "c", "b"])
+      self.assertTrue(namespace.verbose)
+
+      with patch("sys.stderr", new_callable=StringIO):
+        with self.assertRaises(SystemExit) as e:
+          parser.parse_args(["@" + join(dir_, "missing.args")])
+      self.assertEqual(e.exception.code, 2)
+
+      # The path of an argument file is completed.
+      self.performCompletion(parser, ["@" + join(dir_, "p")], {"@" + args})
+      self.performCompletion(parser, ["@" + join(dir_, "x")], set(), exit_code=1)
+      with patch.dict(environ, {"ARGCOMP_NARROW": "1"}):
+        self.performCompletion(parser, ["@" + join(dir_, "n")],
+                               {"dynamic", "@" + nested})
+
+      # Referenced files are neither read nor do they influence the
+      # completion of other words.
+      missing = "@" + join(dir_, "missing.args")
+      self.performCompletion(parser, [missing, "--mode", "f"], {"fast"})
+      self.performCompletion(parser, ["--mode", missing, "f"], {"fast"})
+      self.performCompletion(parser, [missing, "--v"], {"--verbose"})
+
+
+  def testParents(self):
+    """Verify that arguments inherited from parent parsers are completed."""
+    common = CompletingArgumentParser(add_help=False)
+    common.add_argument("--color", choices=("red", "green"))
+    common.add_argument("--verbose", action="store_true")
+    common.add_argument("source", choices=("local", "remote"))
+
+    plain = ArgumentParser(add_help=False)
+    plain.add_argument("--level", choices=("low", "high"))
+    plain.add_argument("--log", action="store_true")
+
+    parser = CompletingArgumentParser(prog="parents", add_help=False,
+                                      parents=[common, plain])
+    parser.add_argument("--count", type=int)
+    parser.add_argument("target", choices=("disk", "tape"))
+
+    # The keywords of a completing parent are shared, not copied.
+    self.assertIs(parser.arguments.keywords.maps[1], common.arguments.keywords)
+    self.assertNotIn("--count", common.arguments.keywords)
+
+    self.performCompletion(parser, ["--c"], {"--color", "--count"})
+    self.performCompletion(parser, ["--l"], {"--level", "--log"})
+    self.performCompletion(parser, ["--color", "g"], {"green"})
+    self.performCompletion(parser, ["--level", "l"], {"low", "local"})
+    self.performCompletion(parser, ["--log", "l"], {"local"})
+    self.performCompletion(parser, ["remote", "t"], {"tape"})
+
+    namespace = parser.parse_args(["--verbose", "--color", "red", "local", "disk"])
+    self.assertTrue(namespace.verbose)
+    self.assertEqual(namespace.color, "red")
+    self.assertEqual(namespace.target, "disk")
+
+
+  def testParentsInSubParsers(self):
+    """Verify that sub parsers can share the arguments of a parent parser."""
+    common = CompletingArgumentParser(add_help=False)
+    common.add_argument("--jobs", choices=("1", "2", "4"))
+
+    parser = CompletingArgumentParser(prog="subparents", add_help=False)
+    subparsers = parser.add_subparsers(dest="command")
+    build = subparsers.add_parser("build", add_help=False, parents=[common])
+    build.add_argument("--release", action="store_true")
+    test = subparsers.add_parser("test", add_help=False, parents=[common])
+
+    self.performCompletion(parser, ["build", "--"], {"--jobs", "--release"})
+    self.performCompletion(parser, ["test", "--jobs", "4"], {"4"})
+    self.performCompletion(parser, ["test", "--"], {"--jobs"})
+
+    parser.compact()
+    for sub in (build, test):
+      self.assertIs(sub.arguments.keywords.maps[1], common.arguments.keywords)
+    self.assertIs(parser.arguments.keywords["test"], test.arguments)
+    self.performCompletion(parser, ["build", "--jobs", ""], {"1", "2", "4"})
+
+    namespace = parser.parse_args(["build", "--jobs", "2", "--release"])
+    self.assertEqual(namespace.command, "build")
+    self.assertEqual(namespace.jobs, "2")
+    self.assertTrue(namespace.release)
+
+
+  def testSharedArguments(self):
+    """Verify that equal arguments share a single Argument object."""
+    parser = CompletingArgumentParser(prog="shared", add_help=False)
+    parser.add_argument("-f", "--foo", choices=("a", "b"))
+    parser.add_argument("--bar", choices=("a", "b"))
+    parser.add_argument("--baz", choices=["a", "b"])
+
+    subparsers = parser.add_subparsers()
+    sub = subparsers.add_parser("sub", add_help=False)
+    sub.add_argument("--foo", choices=("a", "b"))
+
+    keywords = parser.arguments.keywords
+    self.assertIs(keywords["-f"], keywords["--foo"])
+    self.assertIs(keywords["--foo"], keywords["--bar"])
+    self.assertIs(keywords["--foo"], sub.arguments.keywords["--foo"])
+    # Choices are shared based on what they emit.
+    self.assertIs(keywords["--foo"], keywords["--baz"])
+
+
+  def testSharedChoicesComparingEqual(self):
+    """Verify that choices comparing equal but completing differently are not shared."""
+    parser = CompletingArgumentParser(prog="choices", add_help=False)
+    parser.add_argument("--int", type=int, choices=(1, 2))
+    parser.add_argument("--float", type=float, choices=(1.0, 2.0))
+    parser.add_argument("--bool", type=bool, choices=(True, False))
+    parser.add_argument("--number", type=int, choices=[1, 0])
+
+    for compact in (False, True):
+      if compact:
+        parser.compact()
+
+      self.performCompletion(parser, ["--int", ""], {"1", "2"})
+      self.performCompletion(parser, ["--float", ""], {"1.0", "2.0"})
+      self.performCompletion(parser, ["--bool", ""], {"True", "False"})
+      self.performCompletion(parser, ["--number", ""], {"1", "0"})
+
+
+  def testUnhashableCompleter(self):
+    """Verify that completers do not have to be hashable."""
+    @dataclass
+    class HostCompleter:
+      """A completer that is not hashable."""
+      domain: str
+
+      def __call__(self, parser, values, word):
+        """Complete a host in the domain."""
+        yield from filter(lambda x: x.startswith(word), ["alpha." + self.domain])
+
+    parser = CompletingArgumentParser(prog="unhashable")
+    parser.add_argument("--host", completer=HostCompleter("example.com"))
+    parser.add_argument("--peer", completer=HostCompleter("example.com"))
+
+    for compact in (False, True):
+      if compact:
+        parser.compact()
+
+      self.performCompletion(parser, ["--host", "a"], {"alpha.example.com"})
+      self.performCompletion(parser, ["--peer", ""], {"alpha.example.com"})
+
+
+  def testAddArguments(self):
+    """Verify that arguments can be added in bulk using a specification."""
+    def hostCompleter(parser, values, word):
+      """Complete a host name."""
+      yield from filter(lambda x: x.startswith(word), ["alpha", "beta"])
+
+    def createParser():
+      """Create a parser equivalent to the specification below."""
+      parser = CompletingArgumentParser(prog="bulk")
+      parser.add_argument("-v", "--verbose", action="count")
+      group = parser.add_argument_group("output", "Output options.")
+      group.add_argument("--format", choices=("json", "text"))
+      exclusive = parser.add_mutually_exclusive_group()
+      exclusive.add_argument("--color", action="store_true")
+      exclusive.add_argument("--no-color", action="store_true")
+
+      subparsers = parser.add_subparsers(dest="command")
+      connect = subparsers.add_parser("connect", help="Connect to a host.")
+      connect.add_argument("host", completer=hostCompleter)
+      connect.add_argument("--port", type=int, complete=False)
+      return parser
+
+    spec = [
+      {"args": ("-v", "--verbose"), "action": "count"},
+      {"group": "output", "description": "Output options.", "arguments": [
+        {"args": "--format", "choices": ("json", "text")},
+      ]},
+      {"exclusive": True, "arguments": [
+        {"args": "--color", "action": "store_true"},
+        {"args": "--no-color", "action": "store_true"},
+      ]},
+      {"subcommands": [
+        {"name": "connect", "help": "Connect to a host.", "arguments": [
+          {"args": "host", "completer": hostCompleter},
+          {"args": "--port", "type": int, "complete": False},
+        ]},
+      ], "dest": "command"},
+    ]
+    parser = CompletingArgumentParser(prog="bulk")
+    parser.add_arguments(spec)
+    expected = createParser()
+
+    self.assertEqual(parser.format_help(), expected.format_help())
+    self.assertEqual(parser.arguments.keywords.keys(),
+                     expected.arguments.keywords.keys())
+
+    args = ["-vv", "--format", "json", "--color", "connect", "beta", "--port", "1"]
+    self.assertEqual(parser.parse_args(args), expected.parse_args(args))
+
+    self.performCompletion(parser, ["--format", "j"], {"json"})
+    self.performCompletion(parser, ["--col"], {"--color"})
+    self.performCompletion(parser, ["connect", "a"], {"alpha"})
+    self.performCompletion(parser, ["connect", "alpha", "--port", ""], set(),
+                           exit_code=1)
+
+    # The specification must be left untouched.
+    self.assertEqual(spec[0], {"args": ("-v", "--verbose"), "action": "count"})
+    self.assertEqual(len(spec[3]["subcommands"][0]), 3)
+
+
+  def testReleaseMode(self):
+    """Verify that completion state is released in release mode."""
+    def createParser():
+      """Create a parser in release mode."""
+      parser = CompletingArgumentParser(prog="release", release=True)
+      parser.add_argument("--color", choices=("red", "green"))
+      subparsers = parser.add_subparsers(dest="command")
+      sub = subparsers.add_parser("sub")
+      sub.add_argument("--name", choices=("alpha", "beta"))
+      return parser, sub
+
+    args = ["--color", "red", "sub", "--name", "beta"]
+    expected = {"color": "red", "command": "sub", "name": "beta"}
+
+    # Without a completion request the state is not built at all.
+    with patch("deso.argcomp.parser.argv", ["release", "--color", "red"]):
+      parser, sub = createParser()
+
+    self.assertEqual(parser.arguments, Arguments())
+    self.assertEqual(sub.arguments, Arguments())
+    self.assertNotIn("--_complete", parser._option_string_actions)
+    self.assertNotIn("--_complete-fd", sub._option_string_actions)
+    self.assertEqual(vars(parser.parse_args(args)), expected)
+
+    with patch("deso.argcomp.parser.argv", ["release", "--_complete", "1"]):
+      parser, sub = createParser()
+
+    self.performCompletion(parser, ["sub", "--name", "a"], {"alpha"})
+    self.assertNotEqual(sub.arguments, Arguments())
+
+    # A regular parse drops the state.
+    self.assertEqual(vars(parser.parse_args(args)), expected)
+    self.assertEqual(parser.arguments, Arguments())
+    self.assertEqual(sub.arguments, Arguments())
+    self.assertNotIn("--_complete", parser._option_string_actions)
+    self.assertNotIn("--_complete", sub._option_string_actions)
+    self.assertNotIn("--_complete", parser.format_help())
+
+    with patch("sys.stderr", new_callable=StringIO):
+      with self.assertRaises(SystemExit) as e:
+        parser.parse_args(["--_complete", "1", "release", ""])
+    self.assertEqual(e.exception.code, 2)
+
+    # Parsers not in release mode are not affected.
+    parser = CompletingArgumentParser(prog="regular")
+    parser.add_argument("--color", choices=("red", "green"))
+    parser.parse_args([])
+    self.performCompletion(parser, ["--color", "g"], {"green"})
+
+
+  def testFastExit(self):
+    """Verify that a parser in fast exit mode terminates right after completing."""
+    env = dict(environ)
+    env["PYTHONPATH"] = abspath(join(dirname(__file__), "..", "..", ".."))
+
+    with TemporaryDirectory() as dir_:
+      marker = join(dir_, "marker")
+      for word, stdout, code in (("", "alpha\nbeta\ngamma\n", 0),
+                                 ("b", "beta\n", 0),
+                                 ("x", "", 1)):
+        with self.subTest(word=word):
+          args = [executable, "-c", FAST_EXIT_PROGRAM, marker,
+                  "--_complete", "2", "sample", word]
+          result = run(args, env=env, capture_output=True, text=True,
+                       timeout=60)
+          self.assertEqual(result.stdout, stdout)
+          self.assertEqual(result.returncode, code)
+          # No atexit handler must have been run.
+          self.assertFalse(exists(marker))
+
+
+  def testCompact(self):
+    """Verify that compaction shares identical parts of the completion tree."""
+    def createParser():
+      """Create a parser with many similar sub parsers."""
+      parser = CompletingArgumentParser(prog="compact")
+      parser.add_argument("--verbose", action="store_true")
+
+      subparsers = parser.add_subparsers()
+      for i in range(100):
+        sub = subparsers.add_parser("sub%d" % i)
+        sub.add_argument("-f", "--foo", choices=["a", "b"])
+        sub.add_argument("--mode", choices=("fast", "slow"))
+        sub.add_argument("file", nargs="*")
+
+      sub = subparsers.add_parser("other")
+      sub.add_argument("--bar", action="store_true")
+      return parser
+
+    parser = createParser()
+    before = parser.footprint()
+    parser.compact()
+    after = parser.footprint()
+
+    self.assertEqual(before.nodes, 102)
+    self.assertEqual(after.nodes, 3)
+    # Even choices given as lists are shared right away.
+    self.assertEqual(before.arguments, 4)
+    self.assertEqual(after.arguments, before.arguments)
+    self.assertLess(after.size, before.size / 4)
+
+    self.performCompletion(parser, ["sub42", "--foo", ""], {"a", "b"})
+    self.performCompletion(parser, ["sub42", "--m"], {"--mode"})
+    self.performCompletion(parser, ["other", "--"], {"--bar", "--help"})
+    self.performCompletion(parser, ["--v"], {"--verbose"})
+
+
   def testCompleterParserInvocation(self):
     """Verify that the parser argument in a completer can be used properly."""
     def completeParser(parser, values, word):
@@ -551,5 +1180,107 @@ class TestCompletingArgumentParser(TestCase):
     self.performCompletion(parser, ["--foo", ""], set(), exit_code=1)
 
 
+  def testCompletionContext(self):
+    """Verify that completers of a request share a completion context."""
+    contexts = []
+
+    def completeContext(parser, values, word):
+      """A completer recording the completion context."""
+      context = completionContext()
+      contexts.append(context)
+      yield "%s:%s" % (context.namespace.bar, context.namespace.foo)
+
+    parser = CompletingArgumentParser(prog="context", add_help=False)
+    parser.add_argument("--foo", action="store_true")
+    subparsers = parser.add_subparsers()
+    sub = subparsers.add_parser("sub", add_help=False)
+    sub.add_argument("--bar", nargs="*", completer=completeContext)
+    sub.add_argument("pos", nargs="*", completer=completeContext)
+
+    with patch.object(parser, "parse_known_args", wraps=parser.parse_known_args) as mock:
+      self.performCompletion(parser, ["--foo", "sub", "--bar", "x", ""],
+                             {"['x', '']:True", "--bar"})
+      # One invocation is for the completion request itself, the other
+      # one is shared by the two completers.
+      self.assertEqual(mock.call_count, 2)
+
+    self.assertEqual(len(contexts), 2)
+    self.assertIs(contexts[0], contexts[1])
+
+    context = contexts[0]
+    self.assertIs(context.parser, parser)
+    self.assertEqual(context.path, ("sub",))
+    self.assertEqual(context.seen, ("--foo", "--bar"))
+    self.assertEqual(context.word, "")
+    self.assertIsNone(completionContext())
+
+
+  def testCompletionContextInvalidArguments(self):
+    """Verify that the context namespace is best-effort."""
+    namespaces = []
+
+    def completeNamespace(parser, values, word):
+      """A completer recording the namespace."""
+      namespaces.append(completionContext().namespace)
+      return []
+
+    parser = CompletingArgumentParser(prog="invalid", add_help=False)
+    parser.add_argument("--count", type=int)
+    parser.add_argument("numbers", nargs="*", type=int, completer=completeNamespace)
+
+    self.performCompletion(parser, ["--count", "2", "1", "a"], set(), exit_code=1)
+    self.assertEqual(vars(namespaces[0]), {"count": 2, "numbers": [1]})
+
+    self.performCompletion(parser, ["--count", "a", "1", ""], {"--count"})
+    self.assertIsNone(namespaces[1])
+
+
+  def testCompletionContextWithoutSideEffects(self):
+    """Verify that parsing the context namespace neither prints nor exits."""
+    namespaces = []
+
+    def completeNamespace(parser, values, word):
+      """A completer recording the namespace."""
+      namespaces.append(completionContext().namespace)
+      return ["value"]
+
+    parser = CompletingArgumentParser(prog="effects")
+    subparsers = parser.add_subparsers()
+    sub = subparsers.add_parser("sub")
+    sub.add_argument("--num", type=int)
+    sub.add_argument("--foo", completer=completeNamespace)
+
+    with patch("sys.stderr", new_callable=StringIO) as stderr:
+      self.performCompletion(parser, ["sub", "--num", "abc", "--foo", ""], {"value"})
+      self.assertIsNone(namespaces[-1])
+
+      # The help text must not end up as completions.
+      self.performCompletion(parser, ["sub", "-h", "--foo", ""], {"value"})
+      self.assertIsNone(namespaces[-1])
+
+    self.assertEqual(stderr.getvalue(), "")
+
+
+  def testNarrowableMarker(self):
+    """Verify that the shell is told whether completions are narrowable when asked."""
+    @dynamic
+    def completeTime(parser, values, word):
+      """A completer whose completions change over time."""
+      yield "now"
+
+    parser = CompletingArgumentParser(prog="narrow", add_help=False)
+    parser.add_argument("--move", choices=("rock", "paper", "scissors"))
+    parser.add_argument("--time", completer=completeTime)
+    parser.add_argument("positional", nargs="?")
+
+    with patch.dict(environ, {"ARGCOMP_NARROW": "1"}):
+      self.performCompletion(parser, ["--move", "r"], {"narrowable", "rock"})
+      self.performCompletion(parser, ["--time", ""], {"dynamic", "now"})
+      self.performCompletion(parser, ["--x"], {"narrowable"}, exit_code=1)
+      self.performCompletion(parser, ["pos", "pos", ""], {"narrowable"}, exit_code=1)
+
+    self.performCompletion(parser, ["--move", "r"], {"rock"})
+
+
 if __name__ == "__main__":
   main()
@@ -0,0 +1,245 @@
+# testGit.py
+
+#/***************************************************************************
+# *   Copyright (C) 2017 Daniel Mueller (deso@posteo.net)                   *
+# *                                                                         *
+# *   This program is free software: you can redistribute it and/or modify  *
+# *   it under the terms of the GNU General Public License as published by  *
+# *   the Free Software Foundation, either version 3 of the License, or     *
+# *   (at your option) any later version.                                   *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU General Public License for more details.                          *
+# *                                                                         *
+# *   You should have received a copy of the GNU General Public License     *
+# *   along with this program.  If not, see <http://www.gnu.org/licenses/>. *
+# ***************************************************************************/
+
+"""Tests for the git completion functionality."""
+
+from deso.argcomp import (
+  completeGitBranch,
+  completeGitRef,
+  completeGitRemote,
+  completeGitTag,
+  completeGitWorktree,
+)
+from deso.argcomp.git import (
+  _parsePackedRefs,
+)
+from deso.argcomp.parser import (
+  isNarrowable,
+)
+from functools import (
+  partial,
+)
+from os import (
+  environ,
+  makedirs,
+  stat,
+  utime,
+)
+from os.path import (
+  dirname,
+  join,
+)
+from tempfile import (
+  TemporaryDirectory,
+)
+from unittest import (
+  TestCase,
+  main,
+)
+from unittest.mock import (
+  patch,
+)
+
+
+SHA = "0123456789abcdef0123456789abcdef01234567"
+
+PACKED_REFS = """\
+# pack-refs with: peeled fully-peeled sorted
+%(sha)s refs/heads/main
+%(sha)s refs/heads/maint
+%(sha)s refs/remotes/origin/main
+%(sha)s refs/tags/v1.0
+^%(sha)s
+%(sha)s refs/tags/v1.1
+""" % {"sha": SHA}
+
+CONFIG = """\
+[core]
+	bare = false
+[remote "origin"]
+	url = https://example.com/repo.git
+[remote "upstream"]
+	url = https://example.com/upstream.git
+[branch "main"]
+	remote = origin
+"""
+
+
+def complete(completer, word, path):
+  """Invoke a completer and retrieve its completions as a list."""
+  return list(completer(None, [word], word, path=path))
+
+
+class TestGit(TestCase):
+  """Tests for the git completers."""
+  def setUp(self):
+    """Create a fake repository layout."""
+    self._dir = TemporaryDirectory()
+    self.addCleanup(self._dir.cleanup)
+
+    environ_ = patch.dict(environ)
+    environ_.start()
+    self.addCleanup(environ_.stop)
+    environ.pop("GIT_DIR", None)
+
+    self.repo = join(self._dir.name, "repo")
+    self.git = join(self.repo, ".git")
+    self.write(join(self.git, "HEAD"), "ref: refs/heads/main\n")
+    self.write(join(self.git, "config"), CONFIG)
+    makedirs(join(self.git, "refs", "heads"))
+    makedirs(join(self.git, "refs", "tags"))
+    makedirs(join(self.repo, "src", "deep"))
+
+
+  def write(self, path, content):
+    """Write a file, creating all leading directories."""
+    makedirs(dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+      f.write(content)
+
+
+  def writeRef(self, name):
+    """Write a loose reference."""
+    self.write(join(self.git, name), SHA + "\n")
+
+
+  def testNoRepository(self):
+    """Verify that nothing is completed outside of a repository."""
+    self.assertEqual(complete(completeGitBranch, "", self._dir.name), [])
+    self.assertEqual(complete(completeGitRemote, "", self._dir.name), [])
+    self.assertEqual(complete(completeGitWorktree, "", self._dir.name), [])
+
+
+  def testDynamic(self):
+    """Verify that git completions are not narrowed by the shell."""
+    # Completions depend on the working directory, so the shell must not
+    # reuse them.
+    completers = (completeGitBranch, completeGitTag, completeGitRef,
+                  completeGitRemote, completeGitWorktree)
+    for completer in completers:
+      self.assertFalse(isNarrowable(completer))
+      self.assertFalse(isNarrowable(partial(completer, path=self._dir.name)))
+
+
+  def testPackedRefs(self):
+    """Verify that references are read from a packed-refs file."""
+    self.write(join(self.git, "packed-refs"), PACKED_REFS)
+
+    self.assertEqual(complete(completeGitBranch, "", self.repo), ["main", "maint"])
+    self.assertEqual(complete(completeGitBranch, "maint", self.repo), ["maint"])
+    self.assertEqual(complete(completeGitBranch, "x", self.repo), [])
+    self.assertEqual(complete(completeGitTag, "v", self.repo), ["v1.0", "v1.1"])
+    self.assertEqual(complete(completeGitRef, "", self.repo),
+                     ["main", "maint", "origin/main", "v1.0", "v1.1"])
+
+
+  def testLooseRefs(self):
+    """Verify that loose references are found."""
+    self.writeRef("refs/heads/main")
+    self.writeRef("refs/heads/feature/one")
+    self.writeRef("refs/heads/feature/two")
+    self.writeRef("refs/heads/fix/three")
+    self.writeRef("refs/heads/wip.lock")
+    self.writeRef("refs/tags/v2.0")
+    self.writeRef("refs/remotes/origin/HEAD")
+
+    self.assertEqual(complete(completeGitBranch, "", self.repo),
+                     ["feature/one", "feature/two", "fix/three", "main"])
+    self.assertEqual(complete(completeGitBranch, "f", self.repo),
+                     ["feature/one", "feature/two", "fix/three"])
+    self.assertEqual(complete(completeGitBranch, "feature/t", self.repo),
+                     ["feature/two"])
+    self.assertEqual(complete(completeGitTag, "", self.repo), ["v2.0"])
+    self.assertEqual(complete(completeGitRef, "o", self.repo), ["origin/HEAD"])
+
+
+  def testPackedAndLooseRefs(self):
+    """Verify that packed and loose references are combined."""
+    self.write(join(self.git, "packed-refs"), PACKED_REFS)
+    self.writeRef("refs/heads/main")
+    self.writeRef("refs/heads/topic")
+    self.writeRef("refs/tags/v1.2")
+
+    self.assertEqual(complete(completeGitBranch, "", self.repo),
+                     ["main", "maint", "topic"])
+    self.assertEqual(complete(completeGitTag, "v1.", self.repo),
+                     ["v1.0", "v1.1", "v1.2"])
+
+
+  def testPackedRefsCache(self):
+    """Verify that a parsed packed-refs file is reused until it changes."""
+    path = join(self.git, "packed-refs")
+    self.write(path, PACKED_REFS)
+
+    with patch("deso.argcomp.git._parsePackedRefs",
+               wraps=_parsePackedRefs) as parse:
+      self.assertEqual(complete(completeGitBranch, "", self.repo), ["main", "maint"])
+      self.assertEqual(complete(completeGitTag, "", self.repo), ["v1.0", "v1.1"])
+      self.assertEqual(parse.call_count, 1)
+
+      # Change the file without changing its size, but make sure that
+      # its modification time differs.
+      mtime = stat(path).st_mtime_ns + 10**9
+      self.write(path, PACKED_REFS.replace("maint", "mains"))
+      utime(path, ns=(mtime, mtime))
+
+      self.assertEqual(complete(completeGitBranch, "", self.repo), ["main", "mains"])
+      self.assertEqual(parse.call_count, 2)
+
+
+  def testRemotes(self):
+    """Verify that remotes are read from the configuration."""
+    self.assertEqual(complete(completeGitRemote, "", self.repo),
+                     ["origin", "upstream"])
+    self.assertEqual(complete(completeGitRemote, "u", self.repo), ["upstream"])
+
+
+  def testSubdirectory(self):
+    """Verify that the repository is found from a sub directory."""
+    self.writeRef("refs/heads/main")
+    deep = join(self.repo, "src", "deep")
+    self.assertEqual(complete(completeGitBranch, "", deep), ["main"])
+    self.assertEqual(complete(completeGitRemote, "o", deep), ["origin"])
+
+
+  def testWorktrees(self):
+    """Verify that worktrees share the references of the main repository."""
+    self.writeRef("refs/heads/main")
+    self.writeRef("refs/heads/topic")
+
+    worktree = join(self._dir.name, "topic")
+    admin = join(self.git, "worktrees", "topic")
+    self.write(join(admin, "HEAD"), "ref: refs/heads/topic\n")
+    self.write(join(admin, "commondir"), "../..\n")
+    self.write(join(admin, "gitdir"), join(worktree, ".git") + "\n")
+    self.write(join(worktree, ".git"), "gitdir: %s\n" % admin)
+
+    self.assertEqual(complete(completeGitBranch, "", worktree), ["main", "topic"])
+    self.assertEqual(complete(completeGitRemote, "", worktree),
+                     ["origin", "upstream"])
+
+    expected = [self.repo, worktree]
+    self.assertEqual(complete(completeGitWorktree, self._dir.name, worktree),
+                     expected)
+    self.assertEqual(complete(completeGitWorktree, worktree, self.repo),
+                     [worktree])
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,249 @@
+# testIndex.py
+
+#/***************************************************************************
+# *   Copyright (C) 2017 Daniel Mueller (deso@posteo.net)                   *
+# *                                                                         *
+# *   This program is free software: you can redistribute it and/or modify  *
+# *   it under the terms of the GNU General Public License as published by  *
+# *   the Free Software Foundation, either version 3 of the License, or     *
+# *   (at your option) any later version.                                   *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU General Public License for more details.                          *
+# *                                                                         *
+# *   You should have received a copy of the GNU General Public License     *
+# *   along with this program.  If not, see <http://www.gnu.org/licenses/>. *
+# ***************************************************************************/
+
+"""Tests for the index completion functionality."""
+
+from deso.argcomp import (
+  completeIndex,
+  FileSystemIndex,
+  writeIndex,
+)
+from deso.argcomp.index import (
+  _listDirectory,
+  searchIndex,
+  searchIndexLevel,
+)
+from functools import (
+  partial,
+)
+from os import (
+  chdir,
+  fsdecode,
+  getcwd,
+  listdir,
+  makedirs,
+  sep,
+  stat,
+  utime,
+)
+from os.path import (
+  dirname,
+  join,
+)
+from tempfile import (
+  TemporaryDirectory,
+)
+from unittest import (
+  TestCase,
+  main,
+)
+from unittest.mock import (
+  patch,
+)
+
+
+class TestIndex(TestCase):
+  """Tests for the index functionality."""
+  def testSearch(self):
+    """Verify that prefix search in sorted data works as expected."""
+    data = b"a\nab\nabc\nb\nba\nc\n"
+    self.assertEqual(list(searchIndex(data, b"")), data.split()[:6])
+    self.assertEqual(list(searchIndex(data, b"a")), [b"a", b"ab", b"abc"])
+    self.assertEqual(list(searchIndex(data, b"ab")), [b"ab", b"abc"])
+    self.assertEqual(list(searchIndex(data, b"b")), [b"b", b"ba"])
+    self.assertEqual(list(searchIndex(data, b"c")), [b"c"])
+    self.assertEqual(list(searchIndex(data, b"bb")), [])
+    self.assertEqual(list(searchIndex(data, b"0")), [])
+    self.assertEqual(list(searchIndex(data, b"d")), [])
+
+    # The terminating separator is optional.
+    self.assertEqual(list(searchIndex(b"a\0b\0bc", b"b", b"\0")), [b"b", b"bc"])
+
+
+  def testSearchExhaustive(self):
+    """Verify prefix search against a linear scan."""
+    records = sorted({"%x" % (i * 7919 % 4096) for i in range(1000)})
+    data = "\n".join(records).encode()
+
+    for prefix in ("", "1", "a", "ff", "10", "abc", "fff", "g"):
+      expected = [r.encode() for r in records if r.startswith(prefix)]
+      self.assertEqual(list(searchIndex(data, prefix.encode())), expected)
+
+
+  def testSearchLevel(self):
+    """Verify that level-wise search matches a filtered linear scan."""
+    records = set()
+    for i in range(500):
+      path = "%x" % (i * 7919 % 4096)
+      # Create a tree of directories with one character per level.
+      components = list(path)
+      for j in range(1, len(components)):
+        records.add("/".join(components[:j]) + "/")
+      records.add("/".join(components))
+    records |= {"a-b", "a0", "a/-", "a/0/"}
+    records = sorted(r.encode() for r in records)
+    data = b"\0".join(records)
+
+    for prefix in ("", "a", "a/", "a/0", "a/0/", "1/f/", "f/f/f", "g"):
+      prefix = prefix.encode()
+      expected = [r for r in records if r.startswith(prefix)]
+      expected = [r for r in expected if b"/" not in r[len(prefix):-1]]
+      self.assertEqual(list(searchIndexLevel(data, prefix, b"\0", b"/")), expected)
+
+
+  def testSearchLevelSkipsSubtrees(self):
+    """Verify that level-wise search does not look at records below the level."""
+    class Data(bytes):
+      """Data counting the records sliced out of it."""
+      slices = 0
+
+      def __getitem__(self, index):
+        """Retrieve a slice of the data."""
+        Data.slices += 1
+        return super().__getitem__(index)
+
+    records = ["root/"]
+    for child in ("a", "b", "c"):
+      records += ["root/%s/" % child]
+      records += ["root/%s/%05d" % (child, i) for i in range(10000)]
+    data = Data("\0".join(sorted(records)).encode())
+
+    result = list(searchIndexLevel(data, b"root/", b"\0", b"/"))
+    self.assertEqual(result, [b"root/", b"root/a/", b"root/b/", b"root/c/"])
+    self.assertLess(Data.slices, 200)
+
+
+  def testWriteAndComplete(self):
+    """Verify that an index can be written and used for completion."""
+    candidates = ["host%d.example.com" % i for i in range(1000)]
+    candidates += ["gateway", "gäteway"]
+
+    for separator in ("\n", "\0"):
+      with TemporaryDirectory() as dir_:
+        path = join(dir_, "hosts")
+        writeIndex(path, reversed(candidates), separator=separator)
+        self.assertEqual(listdir(dir_), ["hosts"])
+
+        complete = partial(completeIndex, path=path, separator=separator)
+        expected = ["host%d.example.com" % i for i in range(100, 200)]
+        expected += ["host1.example.com", "host10.example.com"]
+        expected += ["host%d.example.com" % i for i in range(10, 20)]
+        self.assertEqual(set(complete(None, [], "host1")), set(expected))
+        self.assertEqual(list(complete(None, [], "host999")), ["host999.example.com"])
+        self.assertEqual(list(complete(None, [], "g")), ["gateway", "gäteway"])
+        self.assertEqual(list(complete(None, [], "x")), [])
+
+        # Replace the index with a different one.
+        writeIndex(path, ["xylophone"], separator=separator)
+        self.assertEqual(list(complete(None, [], "")), ["xylophone"])
+
+
+  def testEmptyAndMissingIndex(self):
+    """Verify that empty and missing index files yield no completions."""
+    with TemporaryDirectory() as dir_:
+      path = join(dir_, "empty")
+      self.assertEqual(list(completeIndex(None, [], "", path)), [])
+
+      writeIndex(path, [])
+      self.assertEqual(list(completeIndex(None, [], "", path)), [])
+
+
+class TestFileSystemIndex(TestCase):
+  """Tests for the FileSystemIndex class."""
+  def setUp(self):
+    """Create a directory tree to index."""
+    self._dir = TemporaryDirectory()
+    self.addCleanup(self._dir.cleanup)
+
+    self.root = join(self._dir.name, "root")
+    for file_ in ("a/b/file1", "a/b/file2", "a/c/file3", "a/file4", "d/file5"):
+      path = join(self.root, file_)
+      makedirs(dirname(path), exist_ok=True)
+      open(path, "w").close()
+
+    old_cwd = getcwd()
+    chdir(self._dir.name)
+    self.addCleanup(chdir, old_cwd)
+
+    self.index = FileSystemIndex(self.root, join(self._dir.name, "index"))
+
+
+  def complete(self, word):
+    """Complete the given word using the index."""
+    return set(self.index(None, [], word))
+
+
+  def testComplete(self):
+    """Verify that paths can be completed from the index."""
+    self.index.update()
+
+    self.assertEqual(self.complete("root/"), {"root/a/", "root/d/"})
+    self.assertEqual(self.complete("root/a/"), {"root/a/b/", "root/a/c/", "root/a/file4"})
+    self.assertEqual(self.complete("root/a/b/f"), {"root/a/b/file1", "root/a/b/file2"})
+    self.assertEqual(self.complete(join(self.root, "d", "")), {join(self.root, "d", "file5")})
+
+    chdir(join(self.root, "a"))
+    self.assertEqual(self.complete(""), {"b/", "c/", "file4"})
+    self.assertEqual(self.complete("../d/"), {"../d/file5"})
+
+
+  def testFallback(self):
+    """Verify that paths outside of the indexed tree are completed directly."""
+    self.index.update()
+    self.assertEqual(self.complete("ind"), {"index", "index.state"})
+    self.assertEqual(self.complete("ro"), {"root" + sep})
+
+
+  def testIncrementalUpdate(self):
+    """Verify that updates only scan modified directories."""
+    with patch("deso.argcomp.index._listDirectory", wraps=_listDirectory) as mock:
+      self.index.update()
+      self.assertEqual(mock.call_count, 5)
+
+      mock.reset_mock()
+      self.index.update()
+      self.assertEqual(mock.call_count, 0)
+
+      path = join(self.root, "a", "c")
+      open(join(path, "file6"), "w").close()
+      # Make sure the modification time differs regardless of the file
+      # system's time stamp granularity.
+      mtime = stat(path).st_mtime_ns
+      utime(path, ns=(mtime + 10**9, mtime + 10**9))
+
+      self.index.update()
+      self.assertEqual(mock.call_count, 1)
+      self.assertEqual(mock.call_args[0][0], path)
+
+    self.assertEqual(self.complete("root/a/c/"), {"root/a/c/file3", "root/a/c/file6"})
+
+
+  def testUnusualNames(self):
+    """Verify that file names with new lines or invalid encodings are indexed."""
+    open(join(self.root, "d", "new\nline"), "w").close()
+    open(join(self.root.encode(), b"d", b"latin-\xe9"), "w").close()
+    self.index.update()
+
+    expected = {"root/d/file5", "root/d/new\nline", "root/d/" + fsdecode(b"latin-\xe9")}
+    self.assertEqual(self.complete("root/d/"), expected)
+    self.assertEqual(self.complete("root/d/n"), {"root/d/new\nline"})
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,233 @@
+# testMetrics.py
+
+#/***************************************************************************
+# *   Copyright (C) 2017 Daniel Mueller (deso@posteo.net)                   *
+# *                                                                         *
+# *   This program is free software: you can redistribute it and/or modify  *
+# *   it under the terms of the GNU General Public License as published by  *
+# *   the Free Software Foundation, either version 3 of the License, or     *
+# *   (at your option) any later version.                                   *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU General Public License for more details.                          *
+# *                                                                         *
+# *   You should have received a copy of the GNU General Public License     *
+# *   along with this program.  If not, see <http://www.gnu.org/licenses/>. *
+# ***************************************************************************/
+
+"""Tests for the metrics functionality."""
+
+from deso.argcomp import (
+  CompletingArgumentParser,
+  mergeMetrics,
+  Metrics,
+  NegativeCache,
+  readMetrics,
+  writeMetrics,
+)
+from deso.argcomp.metrics import (
+  BUCKETS,
+  CACHE_HITS,
+  CACHE_MISSES,
+  COMPLETER_CALLS,
+  COMPLETER_DURATION,
+  EMPTY,
+  formatPrometheus,
+  parsePrometheus,
+  REQUEST_DURATION,
+  REQUESTS,
+)
+from io import (
+  StringIO,
+)
+from os import (
+  environ,
+)
+from os.path import (
+  join,
+)
+from tempfile import (
+  TemporaryDirectory,
+)
+from unittest import (
+  TestCase,
+  main,
+)
+from unittest.mock import (
+  patch,
+)
+
+
+def completeFruit(parser, values, word):
+  """Complete a fruit."""
+  for fruit in ("apple", "apricot", "banana"):
+    if fruit.startswith(word):
+      yield fruit
+
+
+class TestMetrics(TestCase):
+  """Tests for the Metrics class and its helpers."""
+  def setUp(self):
+    """Create a temporary directory for metrics files."""
+    self._dir = TemporaryDirectory()
+    self.addCleanup(self._dir.cleanup)
+
+
+  def testCountersAndHistograms(self):
+    """Verify that counters and histograms are aggregated correctly."""
+    metrics = Metrics()
+    metrics.increment(REQUESTS)
+    metrics.increment(REQUESTS, 2)
+    metrics.increment(CACHE_HITS, cache="negative")
+    metrics.observe(REQUEST_DURATION, 0.0001)
+    metrics.observe(REQUEST_DURATION, 0.02)
+    metrics.observe(REQUEST_DURATION, 100.0)
+
+    snapshot = metrics.snapshot()
+    self.assertEqual(snapshot["counters"], {
+      REQUESTS: {"": 3},
+      CACHE_HITS: {'cache="negative"': 1},
+    })
+
+    histogram = snapshot["histograms"][REQUEST_DURATION][""]
+    self.assertEqual(len(histogram["buckets"]), len(BUCKETS) + 1)
+    self.assertEqual(histogram["buckets"][0], 1)
+    self.assertEqual(histogram["buckets"][BUCKETS.index(0.025)], 1)
+    self.assertEqual(histogram["buckets"][-1], 1)
+    self.assertEqual(sum(histogram["buckets"]), 3)
+    self.assertAlmostEqual(histogram["sum"], 100.0201)
+
+
+  def testPrometheusFormat(self):
+    """Verify that metrics survive a round trip through the Prometheus format."""
+    metrics = Metrics()
+    metrics.increment(EMPTY)
+    metrics.recordCompleter(completeFruit, 0.003)
+    metrics.recordCompleter(completeFruit, 0.3)
+    metrics.observe(REQUEST_DURATION, 0.5)
+
+    snapshot = metrics.snapshot()
+    text = formatPrometheus(snapshot)
+    label = 'completer="%s.completeFruit"' % __name__
+
+    self.assertIn("# TYPE %s counter\n" % COMPLETER_CALLS, text)
+    self.assertIn("%s{%s} 2\n" % (COMPLETER_CALLS, label), text)
+    self.assertIn('%s_bucket{%s,le="0.005"} 1\n' % (COMPLETER_DURATION, label), text)
+    self.assertIn('%s_bucket{%s,le="+Inf"} 2\n' % (COMPLETER_DURATION, label), text)
+    self.assertIn("%s_count 1\n" % REQUEST_DURATION, text)
+    self.assertEqual(parsePrometheus(text), snapshot)
+
+
+  def testFlush(self):
+    """Verify that flushing adds to the metrics already stored."""
+    for name in ("metrics.prom", "metrics.json"):
+      with self.subTest(name=name):
+        path = join(self._dir.name, name)
+        for _ in range(3):
+          metrics = Metrics(path)
+          metrics.recordRequest(0.01, empty=False)
+          metrics.recordCache("service", True)
+          metrics.flush()
+          # The in-memory metrics are reset by a flush.
+          metrics.flush()
+
+        stored = readMetrics(path)
+        self.assertEqual(stored["counters"][REQUESTS], {"": 3})
+        self.assertEqual(stored["counters"][CACHE_HITS], {'cache="service"': 3})
+        self.assertNotIn(EMPTY, stored["counters"])
+        histogram = stored["histograms"][REQUEST_DURATION][""]
+        self.assertEqual(sum(histogram["buckets"]), 3)
+
+
+  def testFlushWithoutFcntl(self):
+    """Verify that metrics can be flushed on systems lacking the fcntl module."""
+    path = join(self._dir.name, "metrics.json")
+    # A None entry in sys.modules causes the import to fail.
+    with patch.dict("sys.modules", {"fcntl": None}):
+      metrics = Metrics(path)
+      metrics.recordRequest(0.01, empty=False)
+      metrics.flush()
+
+    self.assertEqual(readMetrics(path)["counters"][REQUESTS], {"": 1})
+
+
+  def testReadAndMerge(self):
+    """Verify that metrics files of different formats can be merged."""
+    first = Metrics()
+    first.recordRequest(0.01, empty=True)
+    first.recordCache("negative", False)
+    second = Metrics()
+    second.recordRequest(2.0, empty=True)
+    second.recordCache("negative", True)
+
+    prom = join(self._dir.name, "first.prom")
+    json = join(self._dir.name, "second.json")
+    writeMetrics(prom, first.snapshot())
+    writeMetrics(json, second.snapshot())
+
+    merged = mergeMetrics(readMetrics(prom), readMetrics(json))
+    self.assertEqual(merged["counters"][REQUESTS], {"": 2})
+    self.assertEqual(merged["counters"][EMPTY], {"": 2})
+    self.assertEqual(merged["counters"][CACHE_HITS], {'cache="negative"': 1})
+    self.assertEqual(merged["counters"][CACHE_MISSES], {'cache="negative"': 1})
+    self.assertAlmostEqual(merged["histograms"][REQUEST_DURATION][""]["sum"], 2.01)
+
+
+  def complete(self, parser, words):
+    """Perform a completion of the given words."""
+    args = ["--_complete", "%d" % (len(words) + 1), "program"] + words
+    with patch("sys.stdout", new_callable=StringIO):
+      with self.assertRaises(SystemExit):
+        parser.parse_args(args)
+
+
+  def testParserMetrics(self):
+    """Verify that a parser records metrics about completion requests."""
+    path = join(self._dir.name, "metrics.prom")
+    cache = NegativeCache(join(self._dir.name, "cache"))
+    parser = CompletingArgumentParser(prog="metrics", metrics=Metrics(path))
+    subparsers = parser.add_subparsers()
+    eat = subparsers.add_parser("eat")
+    eat.add_argument("fruit", completer=cache.wrap(completeFruit))
+
+    self.complete(parser, ["eat", "a"])
+    self.complete(parser, ["eat", "c"])
+    self.complete(parser, ["eat", "ch"])
+    self.complete(parser, ["eat", "b"])
+
+    metrics = readMetrics(path)
+    counters = metrics["counters"]
+    label = 'completer="%s.completeFruit"' % __name__
+    self.assertEqual(counters[REQUESTS], {"": 4})
+    self.assertEqual(counters[EMPTY], {"": 2})
+    self.assertEqual(counters[COMPLETER_CALLS], {label: 4})
+    self.assertEqual(counters[CACHE_HITS], {'cache="negative"': 1})
+    self.assertEqual(counters[CACHE_MISSES], {'cache="negative"': 3})
+
+    histogram = metrics["histograms"][COMPLETER_DURATION][label]
+    self.assertEqual(sum(histogram["buckets"]), 4)
+
+
+  def testEnvironment(self):
+    """Verify that metrics can be enabled through the environment."""
+    path = join(self._dir.name, "metrics.json")
+    parser = CompletingArgumentParser(prog="metrics")
+    parser.add_argument("--fruit", completer=completeFruit)
+
+    self.complete(parser, ["--fruit", "a"])
+    with self.assertRaises(FileNotFoundError):
+      readMetrics(path)
+
+    with patch.dict(environ, {"ARGCOMP_METRICS": path}):
+      self.complete(parser, ["--fruit", "a"])
+      self.complete(parser, ["--fruit", "x"])
+
+    counters = readMetrics(path)["counters"]
+    self.assertEqual(counters[REQUESTS], {"": 2})
+    self.assertEqual(counters[EMPTY], {"": 1})
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,139 @@
+# testPath.py
+
+#/***************************************************************************
+# *   Copyright (C) 2017 Daniel Mueller (deso@posteo.net)                   *
+# *                                                                         *
+# *   This program is free software: you can redistribute it and/or modify  *
+# *   it under the terms of the GNU General Public License as published by  *
+# *   the Free Software Foundation, either version 3 of the License, or     *
+# *   (at your option) any later version.                                   *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU General Public License for more details.                          *
+# *                                                                         *
+# *   You should have received a copy of the GNU General Public License     *
+# *   along with this program.  If not, see <http://www.gnu.org/licenses/>. *
+# ***************************************************************************/
+
+"""Tests for the recursive path completion functionality."""
+
+from contextlib import (
+  contextmanager,
+)
+from deso.argcomp import (
+  completePathRecursive,
+)
+from os import (
+  chdir,
+  getcwd,
+  makedirs,
+  symlink,
+)
+from os.path import (
+  dirname,
+  join,
+)
+from tempfile import (
+  TemporaryDirectory,
+)
+from unittest import (
+  TestCase,
+  main,
+)
+
+
+FILES = [
+  "README",
+  "src/conf.py",
+  "src/a/config.ini",
+  "src/a/b/other",
+  "src/a/b/c/conf",
+  "src/.git/config",
+  "src/build/conf.out",
+  "doc/conf/index.txt",
+]
+
+
+@contextmanager
+def tree():
+  """Create a directory tree and change into it."""
+  with TemporaryDirectory() as root:
+    for file_ in FILES:
+      path = join(root, file_)
+      makedirs(dirname(path), exist_ok=True)
+      open(path, "w").close()
+
+    # Create a cycle to verify that symbolic links are not followed.
+    symlink(join(root, "src"), join(root, "src", "a", "loop"))
+
+    old_cwd = getcwd()
+    chdir(root)
+    try:
+      yield
+    finally:
+      chdir(old_cwd)
+
+
+class TestCompletePathRecursive(TestCase):
+  """Tests for the completePathRecursive function."""
+  @staticmethod
+  def complete(word, **kwargs):
+    """A simple wrapper around completePathRecursive()."""
+    return list(completePathRecursive(None, [], word, **kwargs))
+
+
+  def testRecursiveCompletion(self):
+    """Verify that paths are completed recursively."""
+    with tree():
+      expected = [
+        "src/conf.py",
+        "src/.git/config",
+        "src/a/config.ini",
+        "src/build/conf.out",
+        "src/a/b/c/conf",
+      ]
+      self.assertEqual(self.complete("src/**/conf"), expected)
+      self.assertEqual(self.complete("src/**conf"), expected)
+      self.assertEqual(self.complete("**/conf/"), ["doc/conf/index.txt"])
+      self.assertEqual(self.complete("**/c/co"), ["src/a/b/c/conf"])
+      self.assertEqual(self.complete("src/**/nothing"), [])
+
+
+  def testNonRecursiveCompletion(self):
+    """Verify that words without '**' are completed like regular paths."""
+    with tree():
+      self.assertEqual(set(self.complete("src/")), {
+        "src/conf.py", "src/a/", "src/.git/", "src/build/",
+      })
+
+
+  def testDepthLimit(self):
+    """Verify that the maximum depth is honored."""
+    with tree():
+      self.assertEqual(self.complete("src/**/conf", max_depth=1), ["src/conf.py"])
+      self.assertEqual(len(self.complete("src/**/conf", max_depth=3)), 4)
+
+
+  def testExclusion(self):
+    """Verify that excluded entries are pruned."""
+    with tree():
+      expected = ["src/conf.py", "src/a/config.ini", "src/a/b/c/conf"]
+      self.assertEqual(self.complete("src/**/conf", exclude=[".git/", "build/"]), expected)
+      self.assertEqual(self.complete("src/**/conf", exclude=[".*", "*.out"]), expected)
+      self.assertEqual(self.complete("src/**/conf", exclude=[".git", "a/b/"]),
+                       ["src/conf.py", "src/a/config.ini", "src/build/conf.out"])
+      # A directory pattern must not match files.
+      self.assertEqual(self.complete("**/README", exclude=["README/"]), ["README"])
+
+
+  def testLimit(self):
+    """Verify that completion stops once the limit is reached."""
+    with tree():
+      self.assertEqual(self.complete("src/**/conf", limit=2),
+                       ["src/conf.py", "src/.git/config"])
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,377 @@
+# testPerformance.py
+
+#/***************************************************************************
+# *   Copyright (C) 2017 Daniel Mueller (deso@posteo.net)                   *
+# *                                                                         *
+# *   This program is free software: you can redistribute it and/or modify  *
+# *   it under the terms of the GNU General Public License as published by  *
+# *   the Free Software Foundation, either version 3 of the License, or     *
+# *   (at your option) any later version.                                   *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU General Public License for more details.                          *
+# *                                                                         *
+# *   You should have received a copy of the GNU General Public License     *
+# *   along with this program.  If not, see <http://www.gnu.org/licenses/>. *
+# ***************************************************************************/
+
+"""Performance tests comparing against a plain ArgumentParser."""
+
+from argparse import (
+  ArgumentParser,
+  REMAINDER,
+  SUPPRESS,
+)
+from deso.argcomp import (
+  CompletingArgumentParser,
+)
+from gc import (
+  collect,
+)
+from os import (
+  environ,
+)
+from os.path import (
+  abspath,
+  dirname,
+  join,
+)
+from subprocess import (
+  run,
+)
+from sys import (
+  executable,
+)
+from time import (
+  perf_counter,
+)
+from tempfile import (
+  TemporaryDirectory,
+)
+from tracemalloc import (
+  get_traced_memory,
+  start,
+  stop,
+)
+from unittest import (
+  TestCase,
+  main,
+)
+from unittest.mock import (
+  patch,
+)
+
+
+# The number of times to repeat each measurement. We only take the
+# fastest run into account to reduce noise.
+REPEAT = int(environ.get("ARGCOMP_REPEAT", "20"))
+# The number of processes to measure each kind of parser in.
+ROUNDS = int(environ.get("ARGCOMP_ROUNDS", "5"))
+# The maximum tolerated ratio between the time it takes to parse a
+# list of arguments with a CompletingArgumentParser and that of a
+# plain ArgumentParser. Ideally it is one, but we allow for some
+# measurement noise and the dispatch of the overridden
+# parse_known_args method (once per level of sub parsers).
+RATIO = float(environ.get("ARGCOMP_RATIO", "1.05"))
+# The numbers of options to construct parsers with, comma separated.
+SIZES = environ.get("ARGCOMP_SIZES", "1000,10000")
+# The time an atexit handler of the program used for measuring the
+# latency of exiting after a completion takes, in seconds.
+TEARDOWN = 0.1
+
+MEASURE_PROGRAM = """\
+from argparse import ArgumentParser
+from deso.argcomp import CompletingArgumentParser
+from deso.argcomp.test.testPerformance import createParser
+from sys import argv
+from timeit import repeat
+
+parse = getattr(createParser(%(class)s), argv[1])
+args = argv[2:]
+print(min(repeat(lambda: parse(args), number=%(number)d, repeat=%(repeat)d)))
+"""
+
+EXIT_PROGRAM = """\
+from atexit import register
+from deso.argcomp import CompletingArgumentParser
+from sys import argv
+from time import sleep
+
+register(sleep, %(teardown)s)
+
+parser = CompletingArgumentParser(prog="exit", fast_exit=argv[1] == "fast")
+parser.add_argument("--flag", action="store_true")
+parser.parse_args(argv[2:])
+"""
+
+
+def addHiddenOptions(parser):
+  """Add options equivalent to the hidden ones of a CompletingArgumentParser."""
+  # The hidden options take part in each parse operation. Without them
+  # a plain ArgumentParser would not be doing the same work.
+  parser.add_argument("--_complete", default=SUPPRESS, nargs=REMAINDER, help=SUPPRESS)
+  parser.add_argument("--_complete-fd", default=SUPPRESS, type=int, help=SUPPRESS)
+
+
+def createParser(class_):
+  """Create an argument parser of the given class with a set of arguments."""
+  parser = class_(prog="bench")
+  if class_ is ArgumentParser:
+    addHiddenOptions(parser)
+  for i in range(20):
+    parser.add_argument("--option-%d" % i, type=int, default=0)
+  parser.add_argument("--flag", action="store_true")
+  parser.add_argument("files", nargs="*")
+
+  subparsers = parser.add_subparsers(dest="command")
+  run = subparsers.add_parser("run")
+  if class_ is ArgumentParser:
+    addHiddenOptions(run)
+  run.add_argument("--jobs", type=int)
+  run.add_argument("targets", nargs="*")
+  return parser
+
+
+def measure(classes, method, args, number=100):
+  """Measure the time it takes parsers of each of the classes to parse the given arguments."""
+  # Each parser is measured in a process of its own: the interpreter
+  # specializes the argparse code for the parser it runs with first,
+  # penalizing any other parser measured in the same process. We
+  # alternate between the processes to not penalize any of the parsers
+  # by changing system conditions.
+  env = dict(environ)
+  env["PYTHONPATH"] = abspath(join(dirname(__file__), "..", "..", ".."))
+  times = [float("inf")] * len(classes)
+  for _ in range(ROUNDS):
+    for i, class_ in enumerate(classes):
+      program = MEASURE_PROGRAM % {
+        "class": class_.__name__,
+        "number": number,
+        "repeat": REPEAT,
+      }
+      result = run([executable, "-c", program, method] + args,
+                   env=env, capture_output=True, text=True, check=True)
+      times[i] = min(times[i], float(result.stdout))
+
+  return times
+
+
+def createSpec(count):
+  """Create a specification of a parser with the given number of options."""
+  spec = []
+  for i in range(count):
+    if i % 3 == 0:
+      spec.append({"args": "--option-%d" % i, "choices": ("a", "b")})
+    elif i % 3 == 1:
+      spec.append({"args": "--option-%d" % i, "action": "store_true"})
+    else:
+      spec.append({"args": ("-o%d" % i, "--option-%d" % i), "type": int})
+  return spec
+
+
+def construct(spec, bulk):
+  """Measure the time it takes to construct a parser from a specification."""
+  start = perf_counter()
+  parser = CompletingArgumentParser(prog="bench")
+  if bulk:
+    parser.add_arguments(spec)
+  else:
+    for entry in spec:
+      entry = dict(entry)
+      args = entry.pop("args")
+      if isinstance(args, str):
+        args = (args,)
+      parser.add_argument(*args, **entry)
+  return perf_counter() - start
+
+
+def inherit(count, parents):
+  """Measure the time it takes to construct sub parsers sharing a set of options."""
+  start = perf_counter()
+  spec = createSpec(100)
+  common = CompletingArgumentParser(add_help=False)
+  common.add_arguments(spec)
+
+  parser = CompletingArgumentParser(prog="bench")
+  subparsers = parser.add_subparsers(dest="command")
+  for i in range(count):
+    if parents:
+      subparsers.add_parser("command-%d" % i, parents=[common])
+    else:
+      subparser = subparsers.add_parser("command-%d" % i)
+      subparser.add_arguments(spec)
+  return perf_counter() - start, parser
+
+
+def allocate(argv, release):
+  """Measure the memory retained by a parser after a regular parse."""
+  collect()
+  start()
+  try:
+    with patch("deso.argcomp.parser.argv", argv):
+      parser = CompletingArgumentParser(prog="bench", release=release)
+      parser.add_arguments(createSpec(300))
+      subparsers = parser.add_subparsers(dest="command")
+      for i in range(10):
+        subparser = subparsers.add_parser("command-%d" % i)
+        subparser.add_arguments(createSpec(30))
+
+    parser.parse_args(["command-3", "--option-0", "a"])
+    collect()
+    current, _ = get_traced_memory()
+    return current
+  finally:
+    stop()
+
+
+def complete(mode):
+  """Measure the time it takes a program to complete and exit."""
+  env = dict(environ)
+  env["PYTHONPATH"] = abspath(join(dirname(__file__), "..", "..", ".."))
+  program = EXIT_PROGRAM % {"teardown": TEARDOWN}
+  args = [executable, "-c", program, mode, "--_complete", "2", "exit", "--f"]
+
+  start = perf_counter()
+  result = run(args, env=env, capture_output=True, text=True, check=True)
+  duration = perf_counter() - start
+
+  assert result.stdout == "--flag\n", result.stdout
+  return duration
+
+
+def peak(class_, path):
+  """Measure the peak memory usage of parsing arguments read from a file."""
+  parser = class_(prog="bench", fromfile_prefix_chars="@")
+  parser.add_argument("paths", nargs="*")
+
+  collect()
+  start()
+  try:
+    parser.parse_args(["@" + path])
+    _, peak = get_traced_memory()
+    return peak
+  finally:
+    stop()
+
+
+class TestPerformance(TestCase):
+  """Performance tests for parsing arguments."""
+  def assertNoOverhead(self, method, args):
+    """Verify that parsing arguments has no measurable overhead."""
+    plain = createParser(ArgumentParser)
+    completing = createParser(CompletingArgumentParser)
+
+    # Both parsers must agree on the result.
+    expected = getattr(plain, method)(args)
+    self.assertEqual(getattr(completing, method)(args), expected)
+
+    # A single measurement may be skewed by other load on the system.
+    # A real regression, however, shows up in each one.
+    for _ in range(3):
+      base, ours = measure([ArgumentParser, CompletingArgumentParser], method, args)
+      if ours / base < RATIO:
+        break
+    else:
+      self.fail("%s took %.2fx as long as with a plain ArgumentParser"
+                % (method, ours / base))
+
+
+  def testImportedModules(self):
+    """Verify that importing the package does not import optional dependencies."""
+    env = dict(environ)
+    env["PYTHONPATH"] = abspath(join(dirname(__file__), "..", "..", ".."))
+    modules = ("fcntl", "http.client", "multiprocessing", "concurrent.futures")
+    # The metrics module gets imported on every completion request with
+    # metrics enabled and has to work on systems lacking fcntl.
+    for package in ("deso.argcomp", "deso.argcomp.metrics"):
+      with self.subTest(package=package):
+        program = ("import sys, %s\n"
+                   "print(' '.join(m for m in %r if m in sys.modules))" % (package, modules))
+        result = run([executable, "-c", program], env=env, capture_output=True,
+                     text=True, check=True)
+        self.assertEqual(result.stdout.strip(), "")
+
+
+  def testParseArgsOverhead(self):
+    """Measure the overhead of parse_args over a plain ArgumentParser."""
+    args = ["--option-3", "42", "--flag", "a", "b", "run", "--jobs", "4", "x"]
+    self.assertNoOverhead("parse_args", args)
+
+
+  def testParseKnownArgsOverhead(self):
+    """Measure the overhead of parse_known_args over a plain ArgumentParser."""
+    args = ["--option-7", "13", "--unknown", "run", "--jobs", "2", "--", "-x"]
+    self.assertNoOverhead("parse_known_args", args)
+
+
+  def testBulkConstruction(self):
+    """Verify that adding arguments in bulk is faster than one by one."""
+    for count in map(int, SIZES.split(",")):
+      with self.subTest(count=count):
+        spec = createSpec(count)
+        single = min(construct(spec, False) for _ in range(3))
+        bulk = min(construct(spec, True) for _ in range(3))
+        self.assertLess(bulk, single,
+                        "constructing %d options took %.3fs in bulk and %.3fs "
+                        "one by one" % (count, bulk, single))
+
+
+  def testParentsFootprint(self):
+    """Verify that options inherited from a parent are cheaper than repeated ones."""
+    repeated, parser = min((inherit(100, False) for _ in range(3)),
+                           key=lambda x: x[0])
+    footprint = parser.footprint()
+    shared, parser = min((inherit(100, True) for _ in range(3)),
+                         key=lambda x: x[0])
+    self.assertLess(shared, repeated,
+                    "constructing sub parsers took %.3fs with parents and "
+                    "%.3fs with repeated options" % (shared, repeated))
+
+    # With parents the per sub parser size no longer depends on the
+    # number of inherited options.
+    self.assertLess(parser.footprint().size * 5, footprint.size)
+
+
+  def testArgumentFileMemory(self):
+    """Verify that reading an argument file does not keep it in memory as a whole."""
+    with TemporaryDirectory() as dir_:
+      path = join(dir_, "paths.args")
+      with open(path, "w") as f:
+        for i in range(50000):
+          f.write("/usr/share/doc/package-%d/README.md\n" % i)
+
+      plain = peak(ArgumentParser, path)
+      ours = peak(CompletingArgumentParser, path)
+      self.assertLess(ours, plain,
+                      "reading arguments from a file peaked at %d bytes, "
+                      "compared to %d bytes with a plain ArgumentParser"
+                      % (ours, plain))
+
+
+  def testReleaseMemory(self):
+    """Verify that release mode reduces the memory retained by a parser."""
+    regular = ["bench", "command-3"]
+    completion = ["bench", "--_complete", "2", "bench", ""]
+    for argv in (regular, completion):
+      with self.subTest(argv=argv):
+        default = allocate(argv, False)
+        released = allocate(argv, True)
+        self.assertLess(released, default,
+                        "a released parser retained %d bytes, a default one "
+                        "%d bytes" % (released, default))
+
+
+  def testFastExit(self):
+    """Verify that a fast exit saves the time spent tearing down the program."""
+    regular = min(complete("regular") for _ in range(3))
+    fast = min(complete("fast") for _ in range(3))
+    # The slow atexit handler is the only difference between the two.
+    self.assertLess(fast, regular - TEARDOWN / 2,
+                    "completing took %.3fs with a fast exit and %.3fs with "
+                    "a regular one" % (fast, regular))
+
+
+if __name__ == "__main__":
+  main()
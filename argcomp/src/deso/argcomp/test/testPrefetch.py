@@ -0,0 +1,167 @@
+# testPrefetch.py
+
+#/***************************************************************************
+# *   Copyright (C) 2017 Daniel Mueller (deso@posteo.net)                   *
+# *                                                                         *
+# *   This program is free software: you can redistribute it and/or modify  *
+# *   it under the terms of the GNU General Public License as published by  *
+# *   the Free Software Foundation, either version 3 of the License, or     *
+# *   (at your option) any later version.                                   *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU General Public License for more details.                          *
+# *                                                                         *
+# *   You should have received a copy of the GNU General Public License     *
+# *   along with this program.  If not, see <http://www.gnu.org/licenses/>. *
+# ***************************************************************************/
+
+
+"""Tests for the prefetching functionality."""
+
+from deso.argcomp import (
+  CompletingArgumentParser,
+  Prefetcher,
+)
+from io import (
+  StringIO,
+)
+from threading import (
+  Event,
+)
+from unittest import (
+  TestCase,
+  main,
+)
+from unittest.mock import (
+  patch,
+)
+
+
+class WarmCompleter:
+  """A completer recording when it gets warmed."""
+  def __init__(self, name, warmed, block=None):
+    """Create a new completer appending its name to 'warmed' when warmed."""
+    self._name = name
+    self._warmed = warmed
+    self._block = block
+    self.started = Event()
+
+
+  def warm(self, parser):
+    """Warm the completer."""
+    self.started.set()
+    if self._block is not None:
+      self._block.wait()
+    self._warmed.append(self._name)
+
+
+  def __call__(self, parser, values, word):
+    """Complete the given word."""
+    if self._name.startswith(word):
+      yield self._name
+
+
+# A completer referenced by its import path.
+WARMED = []
+IMPORTED = WarmCompleter("imported", WARMED)
+
+
+def complete(parser, words):
+  """Perform a completion of the given words."""
+  args = ["--_complete", "%d" % (len(words) + 1), "program"] + words
+  with patch("sys.stdout", new_callable=StringIO) as stdout:
+    try:
+      parser.parse_args(args)
+    except SystemExit:
+      pass
+
+  return stdout.getvalue().splitlines()
+
+
+class TestPrefetcher(TestCase):
+  """Tests for the Prefetcher class."""
+  def setUp(self):
+    """Create a prefetcher."""
+    self.prefetcher = Prefetcher(max_workers=1, max_pending=4)
+    self.addCleanup(self.prefetcher.close)
+    self.warmed = []
+
+
+  def completer(self, name, block=None):
+    """Create a completer recording its warming in 'warmed'."""
+    return WarmCompleter(name, self.warmed, block)
+
+
+  def testSubCommand(self):
+    """Verify that the completers of a just completed sub command are warmed."""
+    parser = CompletingArgumentParser(prog="prefetch", add_help=False,
+                                      prefetcher=self.prefetcher)
+    parser.add_argument("--user", completer=self.completer("user"))
+    subparsers = parser.add_subparsers()
+    build = subparsers.add_parser("build", add_help=False)
+    build.add_argument("--target", completer=self.completer("target"))
+    build.add_argument("host", completer=self.completer("host"))
+    test = subparsers.add_parser("test", add_help=False)
+    test.add_argument("--suite", completer=self.completer("suite"))
+
+    self.assertEqual(complete(parser, ["bui"]), ["build"])
+    self.prefetcher.wait()
+
+    # Completers of the completed sub command come first, followed by
+    # those of the parser the word belongs to.
+    self.assertEqual(self.warmed, ["host", "target", "user"])
+
+
+  def testCancellation(self):
+    """Verify that pending warming gets cancelled by the next request."""
+    block = Event()
+    parser = CompletingArgumentParser(prog="prefetch", add_help=False,
+                                      prefetcher=self.prefetcher)
+    subparsers = parser.add_subparsers()
+    first = self.completer("first", block)
+    one = subparsers.add_parser("one", add_help=False)
+    one.add_argument("--first", completer=first)
+    one.add_argument("--pending", completer=self.completer("pending"))
+    two = subparsers.add_parser("two", add_help=False)
+    two.add_argument("--second", completer=self.completer("second"))
+
+    self.assertEqual(complete(parser, ["one", "--first", "f"]), ["first"])
+    self.assertTrue(first.started.wait(10))
+    # The next request arrives while the first completer is still being
+    # warmed. That cannot be interrupted, but the rest is dropped.
+    self.assertEqual(complete(parser, ["two", "--second", "s"]), ["second"])
+    block.set()
+    self.prefetcher.wait()
+
+    self.assertEqual(self.warmed, ["first", "second"])
+
+
+  def testLimit(self):
+    """Verify that the number of completers warmed per request is limited."""
+    parser = CompletingArgumentParser(prog="prefetch", add_help=False,
+                                      prefetcher=self.prefetcher)
+    for i in range(10):
+      parser.add_argument("--option-%d" % i, completer=self.completer("%d" % i))
+    parser.add_argument("--choice", choices=("a", "b"))
+
+    complete(parser, ["--option-1", "1"])
+    self.prefetcher.wait()
+    self.assertEqual(self.warmed, ["0", "1", "2", "3"])
+
+
+  def testImportPath(self):
+    """Verify that completers given by import path are imported and warmed."""
+    parser = CompletingArgumentParser(prog="prefetch", add_help=False,
+                                      prefetcher=self.prefetcher)
+    parser.add_argument("--imported", completer="%s:IMPORTED" % __name__)
+
+    del WARMED[:]
+    complete(parser, ["--imp"])
+    self.prefetcher.wait()
+    self.assertEqual(WARMED, ["imported"])
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,136 @@
+# testProcess.py
+
+#/***************************************************************************
+# *   Copyright (C) 2017 Daniel Mueller (deso@posteo.net)                   *
+# *                                                                         *
+# *   This program is free software: you can redistribute it and/or modify  *
+# *   it under the terms of the GNU General Public License as published by  *
+# *   the Free Software Foundation, either version 3 of the License, or     *
+# *   (at your option) any later version.                                   *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU General Public License for more details.                          *
+# *                                                                         *
+# *   You should have received a copy of the GNU General Public License     *
+# *   along with this program.  If not, see <http://www.gnu.org/licenses/>. *
+# ***************************************************************************/
+
+"""Tests for the process completion functionality."""
+
+from deso.argcomp import (
+  CompletingArgumentParser,
+  limitCompleter,
+)
+from deso.argcomp.process import (
+  ProcessCompleter,
+)
+from io import (
+  StringIO,
+)
+from os import (
+  getpid,
+)
+from sys import (
+  argv as sysargv,
+)
+from time import (
+  perf_counter,
+  sleep,
+)
+from unittest import (
+  TestCase,
+  main,
+)
+from unittest.mock import (
+  patch,
+)
+
+
+WORDS = ["apple", "apricot", "banana", "blueberry", "cherry", "avocado"]
+
+
+def completeWord(parser, values, word):
+  """Complete a word from a fixed list, reporting the process used."""
+  assert parser is None
+  for candidate in WORDS:
+    if candidate.startswith(word):
+      yield "%s:%d" % (candidate, getpid())
+
+
+def completeNumber(parser, values, word, part):
+  """Complete a number in the given range."""
+  for number in map(str, part):
+    if number.startswith(word):
+      yield number
+
+
+def splitNumbers(values, word):
+  """Split the search space of completeNumber into partitions."""
+  return [range(i, i + 100) for i in range(0, 1000, 100)]
+
+
+def completeSlowly(parser, values, word, part):
+  """Complete a number, taking a while for all but the first partition."""
+  if part > 0:
+    sleep(0.5)
+  yield str(part)
+
+
+def splitSlowly(values, word):
+  """Split the search space of completeSlowly into partitions."""
+  return list(range(8))
+
+
+def completeValues(parser, values, word):
+  """Complete by yielding the values."""
+  yield from values
+
+
+class TestProcessCompleter(TestCase):
+  """Tests for the ProcessCompleter class."""
+  def testCompleteInWorker(self):
+    """Verify that a completer is run in a different process."""
+    completer = ProcessCompleter(completeWord)
+    completions = list(completer(None, [], "a"))
+    words = [c.split(":")[0] for c in completions]
+    pids = {int(c.split(":")[1]) for c in completions}
+
+    self.assertEqual(words, ["apple", "apricot", "avocado"])
+    self.assertEqual(len(pids), 1)
+    self.assertNotIn(getpid(), pids)
+
+
+  def testPartitionedCompletion(self):
+    """Verify that partitioned results are reported in order."""
+    completer = ProcessCompleter(completeNumber, split=splitNumbers, max_workers=4)
+    expected = [str(i) for i in range(1000) if str(i).startswith("9")]
+    self.assertEqual(list(completer(None, [], "9")), expected)
+    self.assertEqual(len(list(completer(None, [], ""))), 1000)
+
+
+  def testEarlyStop(self):
+    """Verify that stopping early does not wait for the remaining partitions."""
+    completer = ProcessCompleter(completeSlowly, split=splitSlowly, max_workers=2)
+    start = perf_counter()
+    self.assertEqual(list(limitCompleter(1, completer)(None, [], "")), ["0"])
+    self.assertLess(perf_counter() - start, 1.0)
+
+
+  def testParserIntegration(self):
+    """Verify that a process completer can be registered with a parser."""
+    parser = CompletingArgumentParser(prog="process", add_help=False)
+    parser.add_argument("--fruit", completer=ProcessCompleter(completeValues))
+
+    args = ["--_complete", "2", sysargv[0], "--fruit", "b"]
+    with patch("sys.stdout", new_callable=StringIO) as mock_stdout:
+      with self.assertRaises(SystemExit) as e:
+        parser.parse_args(args)
+
+      self.assertEqual(mock_stdout.getvalue().splitlines(), ["--fruit", "b"])
+      self.assertEqual(e.exception.code, 0)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,235 @@
+# testService.py
+
+#/***************************************************************************
+# *   Copyright (C) 2017 Daniel Mueller (deso@posteo.net)                   *
+# *                                                                         *
+# *   This program is free software: you can redistribute it and/or modify  *
+# *   it under the terms of the GNU General Public License as published by  *
+# *   the Free Software Foundation, either version 3 of the License, or     *
+# *   (at your option) any later version.                                   *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU General Public License for more details.                          *
+# *                                                                         *
+# *   You should have received a copy of the GNU General Public License     *
+# *   along with this program.  If not, see <http://www.gnu.org/licenses/>. *
+# ***************************************************************************/
+
+"""Tests for the service completion functionality."""
+
+from contextlib import (
+  contextmanager,
+)
+from deso.argcomp.service import (
+  ServiceCompleter,
+)
+from http.server import (
+  BaseHTTPRequestHandler,
+  ThreadingHTTPServer,
+)
+from os.path import (
+  join,
+)
+from socketserver import (
+  ThreadingUnixStreamServer,
+)
+from tempfile import (
+  TemporaryDirectory,
+)
+from threading import (
+  Thread,
+)
+from unittest import (
+  TestCase,
+  main,
+)
+
+
+class Handler(BaseHTTPRequestHandler):
+  """A request handler serving a fixed set of candidates."""
+  protocol_version = "HTTP/1.1"
+
+  def setup(self):
+    """Set up the handler for a new connection."""
+    super().setup()
+    self.server.connections += 1
+
+
+  def do_GET(self):
+    """Handle a GET request."""
+    self.server.requests.append(self.path)
+    if self.path.startswith("/hosts"):
+      body = b"alpha\nbeta\nbetamax\n"
+      self.send_response(200)
+    else:
+      body = b""
+      self.send_response(404)
+
+    self.send_header("Content-Length", str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+
+  def log_message(self, format, *args):
+    """Suppress all logging."""
+    pass
+
+
+class UnixHandler(Handler):
+  """A request handler usable with Unix domain sockets."""
+  def address_string(self):
+    """Retrieve a string representation of the client address."""
+    return "unix"
+
+
+@contextmanager
+def serve(server):
+  """Serve requests in a background thread for the duration of the context."""
+  server.connections = 0
+  server.requests = []
+
+  thread = Thread(target=server.serve_forever, args=(0.01,))
+  thread.start()
+  try:
+    yield server
+  finally:
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+class TestServiceCompleter(TestCase):
+  """Tests for the ServiceCompleter class."""
+  @contextmanager
+  def completer(self, path, **kwargs):
+    """Create a completer querying a stand-in server over TCP."""
+    with serve(ThreadingHTTPServer(("127.0.0.1", 0), Handler)) as server:
+      completer = ServiceCompleter(path, host="127.0.0.1", port=server.server_port, **kwargs)
+      try:
+        yield completer, server
+      finally:
+        completer.close()
+
+
+  def testComplete(self):
+    """Verify that candidates are retrieved from the service and filtered."""
+    with self.completer("/hosts") as (completer, server):
+      self.assertEqual(list(completer(None, [], "")), ["alpha", "beta", "betamax"])
+      self.assertEqual(list(completer(None, [], "bet")), ["beta", "betamax"])
+      self.assertEqual(list(completer(None, [], "x")), [])
+
+
+  def testResponseCaching(self):
+    """Verify that responses are cached."""
+    with self.completer("/hosts") as (completer, server):
+      for word in ("", "a", "b", "be"):
+        list(completer(None, [], word))
+
+      self.assertEqual(server.requests, ["/hosts"])
+
+
+  def testCacheSize(self):
+    """Verify that the number of cached responses is bounded."""
+    with self.completer("/hosts?prefix={word}", cache_size=2) as (completer, server):
+      for word in ("a", "b", "c", "b"):
+        list(completer(None, [], word))
+
+      self.assertEqual(len(completer._cache), 2)
+      self.assertEqual(server.requests, ["/hosts?prefix=%s" % w for w in "abc"])
+
+      # The response for "a" got evicted.
+      list(completer(None, [], "a"))
+      self.assertEqual(len(server.requests), 4)
+
+    with self.completer("/hosts?prefix={word}", ttl=0) as (completer, server):
+      for word in ("a", "b", "c"):
+        list(completer(None, [], word))
+      self.assertEqual(len(completer._cache), 1)
+
+
+  def testWordInPath(self):
+    """Verify that the word to complete can be embedded in the path."""
+    with self.completer("/hosts?prefix={word}") as (completer, server):
+      self.assertEqual(list(completer(None, [], "be ta")), [])
+      self.assertEqual(list(completer(None, [], "be")), ["beta", "betamax"])
+      self.assertEqual(server.requests, ["/hosts?prefix=be%20ta", "/hosts?prefix=be"])
+
+
+  def testConnectionReuse(self):
+    """Verify that connections to the service are kept alive and reused."""
+    with self.completer("/hosts", ttl=0) as (completer, server):
+      for _ in range(5):
+        self.assertEqual(list(completer(None, [], "al")), ["alpha"])
+
+      self.assertEqual(len(server.requests), 5)
+      self.assertEqual(server.connections, 1)
+
+
+  def testWarm(self):
+    """Verify that warming a completer caches the response for an empty word."""
+    with self.completer("/hosts") as (completer, server):
+      completer.warm(None)
+      self.assertEqual(server.requests, ["/hosts"])
+      self.assertEqual(list(completer(None, [], "be")), ["beta", "betamax"])
+      self.assertEqual(server.requests, ["/hosts"])
+
+    with self.completer("/missing") as (completer, server):
+      completer.warm(None)
+      self.assertEqual(server.requests, ["/missing"])
+
+
+  def testFallbackOnError(self):
+    """Verify that the fallback completer is used on unexpected responses."""
+    def fallback(parser, values, word):
+      """A fallback completer."""
+      yield "fallback"
+
+    with self.completer("/missing", fallback=fallback) as (completer, server):
+      self.assertEqual(list(completer(None, [], "")), ["fallback"])
+
+
+  def testNoBackoffOnError(self):
+    """Verify that error responses do not cause the service to be considered unavailable."""
+    def fallback(parser, values, word):
+      """A fallback completer."""
+      yield "fallback"
+
+    with self.completer("/{word}hosts", fallback=fallback) as (completer, server):
+      self.assertEqual(list(completer(None, [], "x")), ["fallback"])
+      self.assertEqual(list(completer(None, [], "")), ["alpha", "beta", "betamax"])
+      self.assertEqual(server.requests, ["/xhosts", "/hosts"])
+
+
+  def testFallbackOnUnavailableService(self):
+    """Verify that the fallback completer is used if the service is down."""
+    def fallback(parser, values, word):
+      """A fallback completer."""
+      yield "fallback"
+
+    with self.completer("/hosts", fallback=fallback) as (completer, server):
+      port = server.server_port
+
+    completer = ServiceCompleter("/hosts", host="127.0.0.1", port=port, fallback=fallback)
+    self.assertEqual(list(completer(None, [], "")), ["fallback"])
+    # Subsequent requests should back off and not even try to connect.
+    self.assertEqual(list(completer(None, [], "")), ["fallback"])
+
+
+  def testUnixSocket(self):
+    """Verify that a service can be queried over a Unix domain socket."""
+    with TemporaryDirectory() as dir_:
+      path = join(dir_, "socket")
+      with serve(ThreadingUnixStreamServer(path, UnixHandler)) as server:
+        completer = ServiceCompleter("/hosts", unix_socket=path, ttl=0)
+        try:
+          self.assertEqual(list(completer(None, [], "a")), ["alpha"])
+          self.assertEqual(list(completer(None, [], "b")), ["beta", "betamax"])
+          self.assertEqual(server.connections, 1)
+        finally:
+          completer.close()
+
+
+if __name__ == "__main__":
+  main()
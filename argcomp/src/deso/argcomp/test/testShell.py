@@ -0,0 +1,320 @@
+# testShell.py
+
+#/***************************************************************************
+# *   Copyright (C) 2017 Daniel Mueller (deso@posteo.net)                   *
+# *                                                                         *
+# *   This program is free software: you can redistribute it and/or modify  *
+# *   it under the terms of the GNU General Public License as published by  *
+# *   the Free Software Foundation, either version 3 of the License, or     *
+# *   (at your option) any later version.                                   *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU General Public License for more details.                          *
+# *                                                                         *
+# *   You should have received a copy of the GNU General Public License     *
+# *   along with this program.  If not, see <http://www.gnu.org/licenses/>. *
+# ***************************************************************************/
+
+"""End-to-end tests driving completion through bash."""
+
+from deso.argcomp.shell import (
+  bashCompletion,
+)
+from os import (
+  chmod,
+  environ,
+)
+from os.path import (
+  abspath,
+  dirname,
+  join,
+)
+from shlex import (
+  quote,
+)
+from shutil import (
+  which,
+)
+from subprocess import (
+  run,
+)
+from sys import (
+  executable,
+)
+from tempfile import (
+  TemporaryDirectory,
+)
+from unittest import (
+  skipIf,
+  TestCase,
+  main,
+)
+
+
+# The number of completions to perform per scenario.
+ITERATIONS = int(environ.get("ARGCOMP_ITERATIONS", "5"))
+# The latency budgets (in seconds) for the 50th and 99th percentiles of
+# each scenario. The defaults are generous because they include the
+# start up of the Python interpreter.
+BUDGET_P50 = float(environ.get("ARGCOMP_BUDGET_P50", "1.0"))
+BUDGET_P99 = float(environ.get("ARGCOMP_BUDGET_P99", "2.0"))
+
+PROGRAM = """\
+#!{executable}
+from deso.argcomp import (
+  completePath,
+  CompletingArgumentParser,
+)
+
+def completeHost(parser, values, word):
+  for host in ("alpha", "beta", "gamma"):
+    if host.startswith(word):
+      yield host
+
+parser = CompletingArgumentParser(prog="sample")
+parser.add_argument("-v", "--verbose", action="store_true")
+subparsers = parser.add_subparsers()
+connect = subparsers.add_parser("connect")
+connect.add_argument("host", completer=completeHost)
+connect.add_argument("--mode", choices=("fast", "slow"))
+connect.add_argument("--config", completer=completePath)
+parser.parse_args()
+"""
+
+# The completion functions, as documented in the README.
+FUNCTIONS = """\
+_complete_argv()
+{
+  local completions=$("${1}" --_complete "${COMP_CWORD}" "${COMP_WORDS[@]}")
+  if [ $? -eq 0 ]; then
+    readarray -t COMPREPLY < <(echo -n "${completions}")
+  fi
+}
+
+_complete_fd()
+{
+  local completions=$(printf '%s\\0' "${COMP_CWORD}" "${COMP_WORDS[@]}" |\\
+                      "${1}" --_complete-fd 0)
+  if [ $? -eq 0 ]; then
+    readarray -t COMPREPLY < <(echo -n "${completions}")
+  fi
+}
+"""
+
+# The driver invoking a completion function the way bash would,
+# printing the latency (in microseconds) and the completions.
+MEASURE = """\
+measure()
+{
+  local name=${1}
+  local function=${2}
+  shift 2
+
+  COMP_WORDS=("${@}")
+  COMP_CWORD=$((${#COMP_WORDS[@]} - 1))
+
+  local i start end
+  for ((i = 0; i < %d; i++)); do
+    COMPREPLY=()
+    start=${EPOCHREALTIME//[.,]/}
+    "${function}" "${COMP_WORDS[0]}" "${COMP_WORDS[COMP_CWORD]}" "${COMP_WORDS[COMP_CWORD-1]}"
+    end=${EPOCHREALTIME//[.,]/}
+    printf '%%s\\t%%d\\t%%s\\n' "${name}" $((end - start)) "$(IFS=$'\\x1f'; echo "${COMPREPLY[*]}")"
+  done
+}
+"""
+
+SCENARIOS = [
+  ("keyword", ["-"], {"-h", "--help", "-v", "--verbose"}),
+  ("subcommand", ["-v", "con"], {"connect"}),
+  ("completer", ["connect", ""], {"alpha", "beta", "gamma", "-h", "--help", "--mode", "--config"}),
+  ("choices", ["connect", "--mode", "f"], {"fast"}),
+  ("no-match", ["connect", "--x"], set()),
+]
+
+
+def percentile(values, percent):
+  """Calculate a percentile using the nearest-rank method."""
+  values = sorted(values)
+  rank = -(-len(values) * percent // 100)
+  return values[max(int(rank), 1) - 1]
+
+
+def writeProgram(path, content):
+  """Write an executable program."""
+  with open(path, "w") as f:
+    f.write(content)
+  chmod(path, 0o755)
+
+
+def runBash(script):
+  """Run a bash script with the package being importable and return its output."""
+  env = dict(environ)
+  env["PYTHONPATH"] = abspath(join(dirname(__file__), "..", "..", ".."))
+  result = run(["bash", "--noprofile", "--norc", "-c", script],
+               env=env, capture_output=True, text=True, check=True)
+  return result.stdout
+
+
+@skipIf(which("bash") is None, "bash is not available")
+class TestShellLatency(TestCase):
+  """Measure the latency of completions as perceived in bash."""
+  def measure(self, function):
+    """Run all scenarios using the given completion function and collect the results."""
+    with TemporaryDirectory() as dir_:
+      program = join(dir_, "sample")
+      writeProgram(program, PROGRAM.format(executable=executable))
+
+      script = [FUNCTIONS, bashCompletion(program), MEASURE % ITERATIONS]
+      for name, words, _ in SCENARIOS:
+        args = [name, function, program] + words
+        script.append("measure %s" % " ".join(map(quote, args)))
+
+      output = runBash("\n".join(script))
+
+    results = {}
+    for line in output.splitlines():
+      name, latency, completions = line.split("\t")
+      completions = set(completions.split("\x1f")) - {""}
+      results.setdefault(name, []).append((int(latency) / 1000000, completions))
+
+    return results
+
+
+  def check(self, function):
+    """Check the latency and results of all scenarios for a completion function."""
+    results = self.measure(function)
+
+    for name, _, expected in SCENARIOS:
+      latencies = [latency for latency, _ in results[name]]
+      self.assertEqual(len(latencies), ITERATIONS)
+
+      for _, completions in results[name]:
+        self.assertEqual(completions, expected, name)
+
+      p50 = percentile(latencies, 50)
+      p99 = percentile(latencies, 99)
+      report = "%s/%s: p50=%.3fs p99=%.3fs" % (function, name, p50, p99)
+      self.assertLessEqual(p50, BUDGET_P50, report)
+      self.assertLessEqual(p99, BUDGET_P99, report)
+
+
+  def testPercentile(self):
+    """Verify the percentile calculation."""
+    values = list(range(1, 101))
+    self.assertEqual(percentile(values, 50), 50)
+    self.assertEqual(percentile(values, 99), 99)
+    self.assertEqual(percentile([3, 1, 2], 50), 2)
+    self.assertEqual(percentile([3, 1, 2], 99), 3)
+
+
+  def testArgvLatency(self):
+    """Measure completion latency with words passed in as arguments."""
+    self.check("_complete_argv")
+
+
+  def testFdLatency(self):
+    """Measure completion latency with words passed in through stdin."""
+    self.check("_complete_fd")
+
+
+  def testGeneratedLatency(self):
+    """Measure completion latency with the generated, narrowing, completion function."""
+    self.check("_argcomp_sample")
+
+
+@skipIf(which("bash") is None, "bash is not available")
+class TestShellNarrowing(TestCase):
+  """Tests for the narrowing of completions in the shell."""
+  def complete(self, fd, steps):
+    """Perform a sequence of completions, replacing the program with a failing one in between."""
+    # We replace the program with one that always fails after the first
+    # completion. Any further completions can then only succeed if they
+    # are served from the shell's cache.
+    with TemporaryDirectory() as dir_:
+      program = join(dir_, "sample")
+      failing = join(dir_, "failing")
+      writeProgram(program, PROGRAM.format(executable=executable))
+      writeProgram(failing, "#!/bin/sh\nexit 1\n")
+
+      script = [bashCompletion(program, fd=fd), "cd %s" % quote(dir_)]
+      completions = 0
+      for words in steps:
+        # Plain strings are shell commands to run in between.
+        if isinstance(words, str):
+          script.append(words)
+          continue
+
+        completions += 1
+        if completions == 2:
+          script.append("mv %s %s" % (quote(failing), quote(program)))
+
+        script.append("COMP_WORDS=(%s)" % " ".join(map(quote, [program] + words)))
+        script.append("COMP_CWORD=%d" % len(words))
+        script.append("COMPREPLY=()")
+        script.append('_argcomp_sample "%s" "${COMP_WORDS[COMP_CWORD]}"' % program)
+        script.append(r"""(IFS=$'\x1f'; echo "${COMPREPLY[*]}")""")
+
+      output = runBash("\n".join(script))
+
+    return [set(line.split("\x1f")) - {""} for line in output.splitlines()]
+
+
+  def testNarrowing(self):
+    """Verify that extended words are completed from the shell's cache."""
+    for fd in (False, True):
+      steps = [
+        ["connect", ""],
+        ["connect", "-"],
+        ["connect", "--m"],
+        ["connect", "g"],
+        ["connect", "x"],
+      ]
+      expected = [
+        {"alpha", "beta", "gamma", "-h", "--help", "--mode", "--config"},
+        {"-h", "--help", "--mode", "--config"},
+        {"--mode"},
+        {"gamma"},
+        set(),
+      ]
+      self.assertEqual(self.complete(fd, steps), expected)
+
+
+  def testNoNarrowing(self):
+    """Verify that the cache is not used when it must not be."""
+    # A different preceding word invalidates the cache.
+    steps = [["connect", "--mode", ""], ["connect", "--mod", "f"]]
+    expected = [{"fast", "slow", "alpha", "beta", "gamma"}, set()]
+    self.assertEqual(self.complete(False, steps), expected)
+
+    # So does a shorter word.
+    steps = [["connect", "--mode", "f"], ["connect", "--mode", ""]]
+    self.assertEqual(self.complete(False, steps), [{"fast"}, set()])
+
+    # And path completion is not narrowable.
+    steps = [["connect", "--config", "/"], ["connect", "--config", "/t"]]
+    result = self.complete(False, steps)
+    self.assertIn("/tmp/", result[0])
+    self.assertEqual(result[1], set())
+
+
+  def testExpiry(self):
+    """Verify that cached completions expire."""
+    first = {"fast", "slow", "alpha", "beta", "gamma"}
+    # Changing the working directory invalidates the cache.
+    steps = [["connect", "--mode", ""], "cd /", ["connect", "--mode", "f"]]
+    self.assertEqual(self.complete(False, steps), [first, set()])
+
+    # So does the time to live elapsing, which we fake by adjusting the
+    # number of seconds the shell has been running.
+    steps = [["connect", "--mode", ""], "SECONDS=$((SECONDS + 10))", ["connect", "--mode", "f"]]
+    self.assertEqual(self.complete(False, steps), [first, set()])
+
+    steps = [["connect", "--mode", ""], "SECONDS=$((SECONDS + 9))", ["connect", "--mode", "f"]]
+    self.assertEqual(self.complete(False, steps), [first, {"fast"}])
+
+
+if __name__ == "__main__":
+  main()
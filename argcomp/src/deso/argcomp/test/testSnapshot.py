@@ -0,0 +1,229 @@
+# testSnapshot.py
+
+#/***************************************************************************
+# *   Copyright (C) 2017 Daniel Mueller (deso@posteo.net)                   *
+# *                                                                         *
+# *   This program is free software: you can redistribute it and/or modify  *
+# *   it under the terms of the GNU General Public License as published by  *
+# *   the Free Software Foundation, either version 3 of the License, or     *
+# *   (at your option) any later version.                                   *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU General Public License for more details.                          *
+# *                                                                         *
+# *   You should have received a copy of the GNU General Public License     *
+# *   along with this program.  If not, see <http://www.gnu.org/licenses/>. *
+# ***************************************************************************/
+
+"""Tests for the snapshot functionality."""
+
+from deso.argcomp import (
+  completeFromSnapshot,
+  completeIndex,
+  CompletingArgumentParser,
+  saveSnapshot,
+  writeIndex,
+)
+from deso.argcomp.snapshot import (
+  _decodeCompleter,
+  _encodeCompleter,
+  completerName,
+  importCompleter,
+)
+from functools import (
+  partial,
+)
+from io import (
+  StringIO,
+)
+from os import (
+  close,
+  environ,
+  pipe,
+  stat,
+  utime,
+  write,
+)
+from os.path import (
+  exists,
+  join,
+)
+from sys import (
+  argv as sysargv,
+)
+from tempfile import (
+  TemporaryDirectory,
+)
+from unittest import (
+  TestCase,
+  main,
+)
+from unittest.mock import (
+  patch,
+)
+
+
+def completeColor(parser, values, word):
+  """Complete a color."""
+  for color in ("red", "green", "blue"):
+    if color.startswith(word):
+      yield color
+
+
+class TestSnapshot(TestCase):
+  """Tests for the snapshot functionality."""
+  def setUp(self):
+    """Create a directory for the snapshot and its inputs."""
+    self._dir = TemporaryDirectory()
+    self.addCleanup(self._dir.cleanup)
+
+    self.snapshot = join(self._dir.name, "snapshot")
+    self.config = join(self._dir.name, "config")
+    self.index = join(self._dir.name, "index")
+    open(self.config, "w").close()
+    writeIndex(self.index, ["alpha", "beta"])
+
+
+  def createParser(self):
+    """Create a parser to snapshot."""
+    parser = CompletingArgumentParser(prog="snapshot")
+    parser.add_argument("-c", "--color", completer=completeColor)
+    parser.add_argument("--mode", choices=("fast", "slow"))
+    parser.add_argument("--level", choices=range(3))
+
+    subparsers = parser.add_subparsers()
+    sub = subparsers.add_parser("sub", add_help=False)
+    sub.add_argument("--name", completer=partial(completeIndex, path=self.index))
+    sub.add_argument("file", nargs="+")
+    return parser
+
+
+  def completeFromSnapshot(self, to_complete, args=None):
+    """Attempt a completion from the snapshot, returning the completions and exit code."""
+    if args is None:
+      args = ["--_complete", "%d" % len(to_complete), sysargv[0]] + to_complete
+
+    with patch("sys.stdout", new_callable=StringIO) as mock_stdout:
+      try:
+        completeFromSnapshot(self.snapshot, [self.config], args=args)
+      except SystemExit as e:
+        return set(mock_stdout.getvalue().splitlines()), e.code
+
+    return None
+
+
+  def testCompleterName(self):
+    """Verify that completers can be referenced by import path."""
+    name = completerName(completeIndex)
+    self.assertEqual(name, "deso.argcomp.index:completeIndex")
+    self.assertIs(importCompleter(name), completeIndex)
+
+    with self.assertRaises(ValueError):
+      completerName(lambda parser, values, word: [])
+
+    # Completers given by import path are kept as such.
+    self.assertEqual(_encodeCompleter(name), name)
+    self.assertEqual(_decodeCompleter(name), name)
+
+
+  def testSaveOnlyOnCompletion(self):
+    """Verify that snapshots are only saved when completion is requested."""
+    parser = self.createParser()
+    saveSnapshot(parser, self.snapshot, [self.config], args=["--mode", "fast"])
+    self.assertFalse(exists(self.snapshot))
+
+    saveSnapshot(parser, self.snapshot, [self.config], args=["--_complete", "1", "x", ""])
+    self.assertTrue(exists(self.snapshot))
+
+
+  def testCompleteFromSnapshot(self):
+    """Verify that completion can be performed using a snapshot."""
+    saveSnapshot(self.createParser(), self.snapshot, [self.config], force=True)
+
+    self.assertEqual(self.completeFromSnapshot(["--c"]), ({"--color"}, 0))
+    self.assertEqual(self.completeFromSnapshot(["-c", "g"]), ({"green"}, 0))
+    self.assertEqual(self.completeFromSnapshot(["--mode", ""]), ({"fast", "slow"}, 0))
+    self.assertEqual(self.completeFromSnapshot(["--level", ""]), ({"0", "1", "2"}, 0))
+    self.assertEqual(self.completeFromSnapshot(["sub", "--"]), ({"--name"}, 0))
+    self.assertEqual(self.completeFromSnapshot(["sub", "--name", "a"]), ({"alpha"}, 0))
+    self.assertEqual(self.completeFromSnapshot(["--x"]), (set(), 1))
+
+    # No completion request means no completion.
+    self.assertIsNone(self.completeFromSnapshot(None, args=["--mode", "fast"]))
+
+
+  def testCompleteFromSnapshotWithFd(self):
+    """Verify that snapshot completion works with words read from a file descriptor."""
+    saveSnapshot(self.createParser(), self.snapshot, [self.config], force=True)
+
+    read_fd, write_fd = pipe()
+    try:
+      write(write_fd, b"2\0snapshot\0--mode\0f\0")
+      close(write_fd)
+      result = self.completeFromSnapshot(None, args=["--_complete-fd", "%d" % read_fd])
+      self.assertEqual(result, ({"fast"}, 0))
+    finally:
+      close(read_fd)
+
+
+  def testNarrowMarker(self):
+    """Verify that snapshot completion reports whether completions can be narrowed."""
+    saveSnapshot(self.createParser(), self.snapshot, [self.config], force=True)
+
+    args = ["--_complete", "3", sysargv[0], "--mode", ""]
+    with patch.dict(environ, {"ARGCOMP_NARROW": "1"}), \
+         patch("sys.stdout", new_callable=StringIO) as mock_stdout:
+      with self.assertRaises(SystemExit) as e:
+        completeFromSnapshot(self.snapshot, [self.config], args=args)
+
+    # The marker has to come first, because the shell strips it off
+    # unconditionally.
+    self.assertEqual(e.exception.code, 0)
+    self.assertEqual(mock_stdout.getvalue().splitlines(), ["narrowable", "fast", "slow"])
+
+
+  def testArgumentFiles(self):
+    """Verify that snapshot completion handles references to argument files."""
+    parser = CompletingArgumentParser(prog="snapshot", add_help=False,
+                                      fromfile_prefix_chars="@")
+    parser.add_argument("--mode", choices=("fast", "slow"))
+    parser.add_argument("color", completer=completeColor)
+    saveSnapshot(parser, self.snapshot, [self.config], force=True)
+
+    # Referenced files do not count as positional arguments.
+    missing = "@" + join(self._dir.name, "missing.args")
+    self.assertEqual(self.completeFromSnapshot([missing, "r"]), ({"red"}, 0))
+    self.assertEqual(self.completeFromSnapshot(["--mode", missing, "f"]), ({"fast"}, 0))
+
+    # The paths of argument files are completed.
+    prefix = "@" + join(self._dir.name, "con")
+    self.assertEqual(self.completeFromSnapshot([prefix]), ({"@" + self.config}, 0))
+
+
+  def testInvalidation(self):
+    """Verify that a changed input invalidates the snapshot."""
+    self.assertIsNone(self.completeFromSnapshot(["--c"]))
+
+    saveSnapshot(self.createParser(), self.snapshot, [self.config], force=True)
+    self.assertIsNotNone(self.completeFromSnapshot(["--c"]))
+
+    mtime = stat(self.config).st_mtime_ns + 10**9
+    utime(self.config, ns=(mtime, mtime))
+    self.assertIsNone(self.completeFromSnapshot(["--c"]))
+
+
+  def testUnreferencableCompleter(self):
+    """Verify that snapshots cannot be created for anonymous completers."""
+    parser = CompletingArgumentParser(prog="anonymous")
+    parser.add_argument("--foo", completer=lambda parser, values, word: [])
+
+    with self.assertRaises(ValueError):
+      saveSnapshot(parser, self.snapshot, [self.config], force=True)
+
+    self.assertFalse(exists(self.snapshot))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,207 @@
+# testSystem.py
+
+#/***************************************************************************
+# *   Copyright (C) 2017 Daniel Mueller (deso@posteo.net)                   *
+# *                                                                         *
+# *   This program is free software: you can redistribute it and/or modify  *
+# *   it under the terms of the GNU General Public License as published by  *
+# *   the Free Software Foundation, either version 3 of the License, or     *
+# *   (at your option) any later version.                                   *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU General Public License for more details.                          *
+# *                                                                         *
+# *   You should have received a copy of the GNU General Public License     *
+# *   along with this program.  If not, see <http://www.gnu.org/licenses/>. *
+# ***************************************************************************/
+
+"""Tests for the system resource completion functionality."""
+
+from deso.argcomp import (
+  completeGroup,
+  completeInterface,
+  completePid,
+  completeProcessName,
+  completeSshHost,
+  completeUser,
+)
+from deso.argcomp.system import (
+  _readName,
+)
+from os import (
+  makedirs,
+  rename,
+)
+from os.path import (
+  dirname,
+  join,
+)
+from tempfile import (
+  TemporaryDirectory,
+)
+from unittest import (
+  TestCase,
+  main,
+)
+from unittest.mock import (
+  patch,
+)
+
+
+PASSWD = """\
+root:x:0:0:root:/root:/bin/bash
+daemon:x:1:1:daemon:/usr/sbin:/usr/sbin/nologin
+deso:x:1000:1000:Daniel:/home/deso:/bin/bash
+"""
+
+GROUP = """\
+root:x:0:
+dialout:x:20:deso
+deso:x:1000:
+"""
+
+SSH_CONFIG = """\
+# A comment.
+Host build build.example.com
+  User deso
+Host *.internal !bastion.internal
+  ProxyJump bastion
+host=backup
+Match host gateway
+"""
+
+KNOWN_HOSTS = """\
+github.com,140.82.121.3 ssh-ed25519 AAAA
+[bastion.example.com]:2222 ssh-ed25519 AAAA
+|1|c2FsdA==|aGFzaA== ssh-ed25519 AAAA
+@cert-authority *.example.com ssh-ed25519 AAAA
+@revoked broken.example.com ssh-ed25519 AAAA
+"""
+
+
+def complete(completer, word):
+  """Invoke a completer and retrieve its completions as a list."""
+  return list(completer(None, [word], word))
+
+
+class TestSystem(TestCase):
+  """Tests for the system resource completers."""
+  def setUp(self):
+    """Create fake system databases and point the completers to them."""
+    self._dir = TemporaryDirectory()
+    self.addCleanup(self._dir.cleanup)
+    self.root = self._dir.name
+
+    paths = {
+      "PROC": "proc",
+      "PASSWD": "etc/passwd",
+      "GROUP": "etc/group",
+      "NET": "sys/class/net",
+      "SSH_CONFIG": "home/.ssh/config",
+      "KNOWN_HOSTS": "home/.ssh/known_hosts",
+    }
+    for name, path in paths.items():
+      patcher = patch("deso.argcomp.system.%s" % name, join(self.root, path))
+      patcher.start()
+      self.addCleanup(patcher.stop)
+
+    self.write("etc/passwd", PASSWD)
+    self.write("etc/group", GROUP)
+    self.write("home/.ssh/config", SSH_CONFIG)
+    self.write("home/.ssh/known_hosts", KNOWN_HOSTS)
+    for interface in ("lo", "eth0", "eth1", "wlan0"):
+      makedirs(join(self.root, "sys/class/net", interface))
+
+    self.write("proc/meminfo", "")
+    self.write("proc/self/comm", "python\n")
+    for pid, name in ((1, "init"), (12, "bash"), (123, "bash"), (2, "sshd")):
+      self.write("proc/%d/comm" % pid, name + "\n")
+
+
+  def write(self, path, content):
+    """Write a file below the fake root, creating all leading directories."""
+    path = join(self.root, path)
+    makedirs(dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+      f.write(content)
+
+
+  def testPid(self):
+    """Verify that process IDs are completed."""
+    self.assertEqual(complete(completePid, ""), ["1", "2", "12", "123"])
+    self.assertEqual(complete(completePid, "12"), ["12", "123"])
+    self.assertEqual(complete(completePid, "s"), [])
+
+
+  def testProcessName(self):
+    """Verify that process names are completed."""
+    self.assertEqual(complete(completeProcessName, ""), ["bash", "init", "sshd"])
+    self.assertEqual(complete(completeProcessName, "s"), ["sshd"])
+
+
+  def testProcessNameCache(self):
+    """Verify that process names are only read again if the PID got reused."""
+    with patch("deso.argcomp.system._readName", wraps=_readName) as read:
+      self.assertEqual(complete(completeProcessName, "i"), ["init"])
+      self.assertEqual(read.call_count, 4)
+      self.assertEqual(complete(completeProcessName, "i"), ["init"])
+      self.assertEqual(read.call_count, 4)
+
+      # A different process with the same ID gets a new directory.
+      proc = join(self.root, "proc")
+      rename(join(proc, "1"), join(proc, "old"))
+      self.write("proc/1/comm", "systemd\n")
+      self.assertEqual(complete(completeProcessName, "i"), [])
+      self.assertEqual(complete(completeProcessName, "sy"), ["systemd"])
+      self.assertEqual(read.call_count, 5)
+
+
+  def testUserAndGroup(self):
+    """Verify that users and groups are completed."""
+    self.assertEqual(complete(completeUser, ""), ["daemon", "deso", "root"])
+    self.assertEqual(complete(completeUser, "de"), ["deso"])
+    self.assertEqual(complete(completeGroup, "d"), ["deso", "dialout"])
+    self.assertEqual(complete(completeGroup, "x"), [])
+
+
+  def testInterface(self):
+    """Verify that network interfaces are completed."""
+    self.assertEqual(complete(completeInterface, ""), ["eth0", "eth1", "lo", "wlan0"])
+    self.assertEqual(complete(completeInterface, "eth"), ["eth0", "eth1"])
+
+
+  def testSshHost(self):
+    """Verify that ssh hosts are completed."""
+    expected = [
+      "140.82.121.3",
+      "backup",
+      "bastion.example.com",
+      "broken.example.com",
+      "build",
+      "build.example.com",
+      "github.com",
+    ]
+    self.assertEqual(complete(completeSshHost, ""), expected)
+    self.assertEqual(complete(completeSshHost, "bu"), ["build", "build.example.com"])
+    self.assertEqual(complete(completeSshHost, "git@gi"), ["git@github.com"])
+
+
+  def testMissingFiles(self):
+    """Verify that missing databases result in no completions."""
+    with TemporaryDirectory() as empty:
+      with patch("deso.argcomp.system.PROC", join(empty, "proc")), \
+           patch("deso.argcomp.system.PASSWD", join(empty, "passwd")), \
+           patch("deso.argcomp.system.NET", join(empty, "net")), \
+           patch("deso.argcomp.system.KNOWN_HOSTS", join(empty, "known_hosts")), \
+           patch("deso.argcomp.system.SSH_CONFIG", join(empty, "config")):
+        self.assertEqual(complete(completePid, ""), [])
+        self.assertEqual(complete(completeProcessName, ""), [])
+        self.assertEqual(complete(completeUser, ""), [])
+        self.assertEqual(complete(completeInterface, ""), [])
+        self.assertEqual(complete(completeSshHost, ""), [])
+
+
+if __name__ == "__main__":
+  main()